@@ -63,13 +63,17 @@ import serial.tools.list_ports
 import keyboard
 import time
 import datetime
-import csv
 import math
+import os
+import sys
+import atexit
+import numpy as np
+from dataq_decode import ScanDecoder, channel_function, ANALOG
 
-dataList_prev = [0,0,0] # List of prev analog channel data for csv file
-dataList_curr = []      # List of current analog channel data for csv file
-dataList_ref = []
-dataList_newcurr = []   # List of the difference between prev and current data
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from csv_sink import CsvSink
+
+dataList_ref = None     # Laser distances of the first recorded scan
 
 # Copy or clone a list with slice operator
 # def Cloning(li1):
@@ -256,6 +260,15 @@ send_cmd("filter * 1")
 # Configure the instrument's scan list
 config_scn_lst()
 
+# Decodes binary scans in bulk using the range table built above
+decoder = ScanDecoder(slist, range_table)
+
+# Columns after the two pressure channels, by their slist entry: analog
+# channels are laser distance sensors (V -> mm, written relative to the
+# first scan), rate, counter and digital channels are written as decoded
+laser = np.array([channel_function(item) == ANALOG for item in slist[2:]], dtype=bool)
+laser_scale = np.where(laser, 1000.0, 1.0)
+
 # Define sample rate = 10 Hz:
 # 60,000,000/(srate * dec) = 60,000,000/(11718 * 512) = 10 Hz
 # send_cmd("dec 512")
@@ -272,9 +285,10 @@ print("Ready to acquire...")
 print("")
 print("Press <g> to go, <s> to stop, <r> to reset counter, and <q> to quit:")
 
-# slist position pointer range: 0 (first position) to len(slist)
-slist_pointer = 0
+# Number of scans received so far
 cycle_count = 0
+# Time of the previous read, restarted when scanning starts
+last_read = time.time()
 
 # label = "[P1,F1,L1]"
 
@@ -284,11 +298,10 @@ serial_number = input("Enter Serial Number\n")
 trial_number = input("Enter Trial Number. Ex. 001,002,..\n")
 filename = "Test_" + serial_number + "_" + trial_number + ".csv" # CSV file name
 
-with open(filename, mode='x', newline='', encoding='utf-8') as csvfile:
-    #creating csv writer object
-    csvwriter = csv.writer(csvfile, dialect='excel')
-    #print header row
-    csvwriter.writerow(["Date/Time", "Pressure", "Flowrate", "Displacement"])
+# Keep the csv file open for the whole run (exclusive creation, failing if file exists)
+# and write rows in batches; synced to disk on stop and quit
+csvsink = CsvSink(filename, header=["Date/Time", "Pressure", "Flowrate", "Displacement"])
+atexit.register(csvsink.close)
 
 while True:
     # 'g' "go" start scan
@@ -296,6 +309,7 @@ while True:
         keyboard.read_key()
         acquiring = True
         send_cmd("start")
+        last_read = time.time()
           
     # 's' stop scan
     if keyboard.is_pressed('s' or 'S'):
@@ -303,6 +317,8 @@ while True:
         send_cmd("stop")
         time.sleep(1)
         ser.flushInput()
+        decoder.reset()
+        csvsink.sync()
         print("")
         print("stopped")
         acquiring = False
@@ -317,127 +333,76 @@ while True:
         keyboard.read_key()
         send_cmd("stop")
         ser.flushInput()
+        decoder.reset()
         break
 
-    while (ser.inWaiting() > (2 * len(slist))):
-        t = datetime.datetime.now()
-        s = t.strftime('%Y-%m-%d %H:%M:%S.%f')
-        head = s[:-7]               # everything up to the '.'
-        tail = s[-7:]               # the '.' and the 6 digits after it
-        f = float(tail)
-        temp = "{:.03f}".format(f)  # for Python 2.x: temp = "%.3f" % f
-        new_tail = temp[1:]         # temp[0] is always '0'; get rid of it
-        current_time = head + new_tail
-
-        # Append time data to 0th index of list
-        # dataList_curr.append(current_time)
-
-        for i in range(len(slist)):
-            # The four LSBs of slist determine measurement function
-            function = ((slist[slist_pointer]) & (0xf))
-            # Two bytes per sample
-            bytes = ser.read(2)
-
-            if (function < 8):
-                # Analog input channel
-                result = (range_table[slist_pointer] * int.from_bytes(bytes, byteorder='little', signed=True) / 32768)
-                if (i == 0):
-                    # Pressure (Pa)
-                    result = (result * (2500 / 750) * 90 / 2)
-                    
-                elif (i == 1):
-                    # Pressure (Pa)
-                    pressure_pa = (result * (2500 / 750) * 90 / 2)
-                    
-                    # Pressure (w.c)
-                    pressure_wc = pressure_pa / 250
-                    
-                    # Diameter of blower outlet (in)
-                    outlet_dia = 8 
-                    
-                    # Area of blower inlet (ft^2)
-                    duct_area = ((math.pi * (outlet_dia/12)) ** 2) 
-                    
-                    # Density of dry air (lbs/ft^3)
-                    dryair_density = 0.075 
-                    
-                    # Pitot tube coefficient = 0.81
-                    pitot_coef = 0.81
-                    
-                    # Air flowrate (m^3/s)
-                    result = (duct_area * 1096.2 * pitot_coef * math.sqrt(abs((pressure_wc / dryair_density))) * 0.00047194745)
-                    
-                else:
-                    if (cycle_count > 4):
-                        # Laser Sensor measurements (mm)
-                        result = result * 1000 
-                    else:
-                        result = 0
-
-                if(cycle_count > 4):
-                    if(int(slist_pointer) == 2): 
-                        dataList_curr.append(float(round(result, 0))) # Append analog channel i+1 data
-                    else:
-                        dataList_curr.append(float(round(result, 3))) # Append analog channel i+1 data
-
-            elif (function == 8):
-                # Digital input channel
-                result = ((int.from_bytes(bytes, byteorder='big', signed=False)) & (0x007f))
-                dataList_curr.append(result)
-
-            elif (function == 9):
-                # Rate input channel
-                result = ((int.from_bytes(bytes, byteorder='little', signed=True) + 32768) / 65535 * (range_table[slist_pointer]))
-                dataList_curr.append(result)
-
-            else:
-                # Counter input channel
-                result = ((int.from_bytes(bytes, byteorder='little', signed=True)) + 32768)
-                dataList_curr.append(result)
-
-            # Get the next position in slist
-            slist_pointer += 1
-
-            if (slist_pointer + 1) > (len(slist)):
-                if (cycle_count > 4):
-                    # End of a pass through slist items...output, reset, continue
-                    if (cycle_count == 5):
-                        dataList_ref = dataList_curr.copy() # copy the laser distance at the start of the test
-
-                    # dataList_prev initialized to [0,0,0,0,0] for first pass
-                    for j in range(len(dataList_curr)):
-                        if (j == 0 or j == 1):
-                            dataList_newcurr.append(float(round(dataList_curr[0], 3)))
-                        else:
-                            # calibration_factor = 0.153
-                            diff = 0
-                            diff = abs(float(dataList_curr[j]) - float(dataList_ref[j]))
-                            dataList_newcurr.append(float(round(diff, 3)))
-
-                    # Print to console (prints raw data rather than diff)
-                    #print(current_time + " | " + label + " " + output_string.rstrip(", "))
-                    print(current_time + " | " + "Chamber Pressure (Pa): " + str(dataList_newcurr[0]) + " | " + "Flow Rate (m^3/s): " + str(dataList_newcurr[1]) + " | " + "Displacemet of Valve (mm) " + str(dataList_newcurr[2]))
-
-                    # Insert timestamp at beginning (index 0) of dataList_newcurr before writing to .csv
-                    dataList_newcurr.insert(0, current_time)
-
-                    # Write to csv file (writes the differences)
-                    with open(filename, 'a+', newline='', encoding='utf-8') as csvfile:
-                        # Creating csv writer object
-                        csvwriter = csv.writer(csvfile, dialect='excel')
-                        # Print row of csv data
-                        csvwriter.writerow(dataList_newcurr)
-
-                    # Copying current data into previous data for next passthrough
-                    #dataList_prev = Cloning(dataList_curr)
-                    
-                    # Clearing the current data list for next row of csv printing
-                    dataList_newcurr.clear()
-                    dataList_curr.clear()
+    # Read everything that arrived since the last pass in one call and
+    # decode all complete scans at once; a partial scan waits for the next read
+    waiting = ser.inWaiting()
+    if (waiting > 0):
+        scans = decoder.feed(ser.read(waiting))
+        now = time.time()
+
+        # Spread the timestamps of this block evenly since the previous read
+        times = now - (now - last_read) * np.arange(len(scans) - 1, -1, -1) / max(len(scans), 1)
+        last_read = now
+
+        # Skip the first 5 scans while the sensors settle
+        settled = max(0, 5 - cycle_count)
+        cycle_count += len(scans)
+        scans = scans[settled:]
+        times = times[settled:]
+
+        if (len(scans) > 0):
+            # Pressure (Pa)
+            pressure_pa = scans[:, 0] * (2500 / 750) * 90 / 2
+
+            # Pressure (w.c)
+            pressure_wc = (scans[:, 1] * (2500 / 750) * 90 / 2) / 250
+
+            # Diameter of blower outlet (in)
+            outlet_dia = 8
+
+            # Area of blower inlet (ft^2)
+            duct_area = ((math.pi * (outlet_dia/12)) ** 2)
+
+            # Density of dry air (lbs/ft^3)
+            dryair_density = 0.075
+
+            # Pitot tube coefficient = 0.81
+            pitot_coef = 0.81
+
+            # Air flowrate (m^3/s)
+            flowrate = (duct_area * 1096.2 * pitot_coef * np.sqrt(np.abs(pressure_wc / dryair_density)) * 0.00047194745)
+
+            # Laser Sensor measurements (mm), other channels as decoded
+            displacement = scans[:, 2:] * laser_scale
+            displacement[:, laser] = np.round(displacement[:, laser], 0)
+
+            if dataList_ref is None:
+                dataList_ref = np.where(laser, displacement[0], 0.0) # copy the laser distance at the start of the test
+
+            # Columns written to the csv file: pressure, flowrate and the laser displacement differences
+            dataList_newcurr = np.empty((len(scans), scans.shape[1]))
+            dataList_newcurr[:, 0] = np.round(pressure_pa, 3)
+            dataList_newcurr[:, 1] = np.round(flowrate, 3)
+            differences = displacement - dataList_ref
+            differences[:, laser] = np.abs(differences[:, laser])
+            dataList_newcurr[:, 2:] = np.round(differences, 3)
+
+            stamps = [datetime.datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] for t in times]
+
+            # Print the newest scan of the block to console
+            print(stamps[-1] + " | " + "Chamber Pressure (Pa): " + str(dataList_newcurr[-1, 0]) + " | " + "Flow Rate (m^3/s): " + str(dataList_newcurr[-1, 1]) + " | " + "Displacemet of Valve (mm) " + str(dataList_newcurr[-1, 2]))
+
+            # Write the block to csv file, timestamp first (writes the differences)
+            csvsink.writerows([stamp] + row for stamp, row in zip(stamps, dataList_newcurr.tolist()))
+
+    # Write out rows still buffered when no new data arrives
+    csvsink.poll()
 
-                slist_pointer = 0
-                time.sleep(0.7) # Delay
-                cycle_count += 1 # Increment the while loop cycle count
+    time.sleep(0.1) # Poll interval
 
+csvsink.close()
 ser.close()
 SystemExit
\ No newline at end of file
@@ -0,0 +1,51 @@
+import struct
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from dataq_decode import ANALOG, DIGITAL, RATE, ScanDecoder, channel_function
+
+SLIST = [0x0000, 0x0001, 0x0008, 0x0709, 0x000A]
+RANGES = [5, 5, 0, 500, 0]
+
+
+def _scan(*samples):
+    return struct.pack("<%dh" % len(samples), *samples)
+
+
+def test_channel_function():
+    assert [channel_function(item) for item in SLIST] == [ANALOG, ANALOG, DIGITAL, RATE, 0xA]
+    assert channel_function(0x0307) == ANALOG
+
+
+def test_every_channel_type_is_scaled():
+    decoder = ScanDecoder(SLIST, RANGES)
+    scans = decoder.feed(_scan(16384, -32768, 0x2A00, 0, -32768))
+    assert scans.shape == (1, 5)
+    assert np.allclose(scans[0, :2], [2.5, -5.0])
+    assert scans[0, 2] == 0x2A
+    assert np.isclose(scans[0, 3], 32768 * 500 / 65535)
+    assert scans[0, 4] == 0
+
+
+def test_partial_scans_wait_for_the_next_read():
+    decoder = ScanDecoder([0, 1], [5, 5])
+    data = _scan(100, 200) + _scan(300, 400)
+    assert decoder.feed(data[:3]).shape == (0, 2)
+    assert decoder.pending == 3
+    scans = decoder.feed(data[3:])
+    assert np.allclose(scans * 32768 / 5, [[100, 200], [300, 400]])
+    assert decoder.pending == 0
+
+
+def test_reset_drops_a_partial_scan():
+    decoder = ScanDecoder([0, 1], [5, 5])
+    decoder.feed(b"\x01")
+    decoder.reset()
+    assert np.allclose(decoder.feed(_scan(32767, 0)), [[5 * 32767 / 32768, 0]])
+
+
+def test_mismatched_range_table():
+    with pytest.raises(ValueError):
+        ScanDecoder([0, 1], [5])
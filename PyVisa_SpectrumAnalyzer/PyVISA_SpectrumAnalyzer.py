@@ -17,8 +17,12 @@ import pyvisa
 import time
 import datetime
 import os
+import sys
+import atexit
 from os import path
-import csv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from csv_sink import CsvSink
 
 ## Check if filename exists, otherwise request user input
 def check_file(filepath):
@@ -42,12 +46,11 @@ filepath = os.path.join(dirname, filename)
 ## Check if file already exists
 filepath = check_file(filepath)
 
-## Initialize CSV (exclusive creation, failing if file exists)
-with open(filepath, mode='x', newline='', encoding='utf-8') as csvfile:
-    #creating csv writer object
-    csvwriter = csv.writer(csvfile, dialect='excel')
-    #print header row
-    csvwriter.writerow(["Date/Time", "Frequency (Hz)", "Amplitude (dBm)"])
+## Initialize CSV (exclusive creation, failing if file exists), kept open for the
+## whole run; rows are written in batches and synced to disk when the script exits
+csvsink = CsvSink(filepath, header=["Date/Time", "Frequency (Hz)", "Amplitude (dBm)"],
+                  flush_rows=10, flush_interval=10.0)
+atexit.register(csvsink.close)
 
 ## Set permissions of file to max (octal 777) (R/W/X for all users)
 os.chmod(filepath, 0o777)
@@ -88,11 +91,7 @@ while True:
           "Amplitude (dB): " + (arr[1])) 
     
     # Append data to csv file (writes the differences)
-    with open(filepath, 'a+', newline='', encoding='utf-8') as csvfile:
-        #creating csv writer object
-        csvwriter = csv.writer(csvfile, dialect='excel')
-        #print row of csv data
-        csvwriter.writerow(data_List)
-        counter += 1
-        time.sleep(1)
+    csvsink.writerow(data_List)
+    counter += 1
+    time.sleep(1)
         
\ No newline at end of file
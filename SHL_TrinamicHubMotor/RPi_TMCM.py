@@ -24,30 +24,72 @@ Hardware:
              2S1P per TMCM/BB-1630 module. 29.6V 5Ah Secondary Battery Pack
 """
 # ---------------------------------------------------------------------------
+import os
 import sys
 #Raspberry Pi Python version (from 2018)
 sys.path.append("/home/pi/.local/lib/python2.7/site-packages")
 #sys.path.append("./TMCL")
 from serial import Serial
-import math
 import TMCL
+import TMCL.metrics
+import TMCL.watchdog
 
 ## serial-address as set on the TMCM module.
 MODULE_ADDRESS = 1
 
-print("Connecting to USB serial ports..")
-## Open the USB serial ports
-serial_port0 = Serial("/dev/ttyACM0")
-serial_port1 = Serial("/dev/ttyACM1")
-serial_port2 = Serial("/dev/ttyACM2")
-serial_port3 = Serial("/dev/ttyACM3")
-
-print("Connecting to TMCL serial busses..")
-## Create a Bus instance using the open serial port
-bus0 = TMCL.connect(serial_port0)
-bus1 = TMCL.connect(serial_port1)
-bus2 = TMCL.connect(serial_port2)
-bus3 = TMCL.connect(serial_port3)
+## USB serial ports, override with TMCM_PORTS=<port0>,<port1>,<port2>,<port3>
+SERIAL_PORTS = os.environ.get("TMCM_PORTS", "/dev/ttyACM0,/dev/ttyACM1,/dev/ttyACM2,/dev/ttyACM3").split(",")
+
+## Wheel number (0-3) of each module, stored in user variable 0 (SGP 0, 2, <wheel>)
+## and cached per USB serial number so later startups skip probing
+WHEEL_CACHE = os.path.expanduser("~/.tmcm_wheels.json")
+
+found = {}
+if "TMCM_PORTS" not in os.environ:
+    print("Discovering TMCM modules..")
+    found = TMCL.find_wheels(address=MODULE_ADDRESS, cache_path=WHEEL_CACHE)
+
+if sorted(found) == [0, 1, 2, 3]:
+    bus0 = found[0].bus
+    bus1 = found[1].bus
+    bus2 = found[2].bus
+    bus3 = found[3].bus
+else:
+    if found:
+        print("Found wheels %s only, using fixed serial ports.." % sorted(found))
+        for motor in found.values():
+            motor.bus.serial.close()
+
+    print("Connecting to USB serial ports..")
+    ## Open the USB serial ports
+    serial_port0 = Serial(SERIAL_PORTS[0])
+    serial_port1 = Serial(SERIAL_PORTS[1])
+    serial_port2 = Serial(SERIAL_PORTS[2])
+    serial_port3 = Serial(SERIAL_PORTS[3])
+
+    print("Connecting to TMCL serial busses..")
+    ## Create a Bus instance using the open serial port
+    bus0 = TMCL.connect(serial_port0)
+    bus1 = TMCL.connect(serial_port1)
+    bus2 = TMCL.connect(serial_port2)
+    bus3 = TMCL.connect(serial_port3)
+
+## Wait at most REPLY_TIMEOUT [s] for each reply (EEPROM stores get longer) and
+## resend requests whose reply got lost up to REPLY_RETRIES times
+REPLY_TIMEOUT = 0.05
+REPLY_RETRIES = 2
+for bus in (bus0, bus1, bus2, bus3):
+    bus.timeout = REPLY_TIMEOUT
+    bus.timeouts = {TMCL.Command.STAP: 0.25, TMCL.Command.STGP: 0.25}
+    bus.retries = REPLY_RETRIES
+
+## Log all motor traffic to a binary file, e.g. TMCM_LOG=run.tmlog
+## (read it back with: python -m TMCL.replay run.tmlog)
+if os.environ.get("TMCM_LOG"):
+    from TMCL.recorder import Recorder
+    recorder = Recorder(os.environ["TMCM_LOG"])
+    for bus in (bus0, bus1, bus2, bus3):
+        recorder.attach(bus)
 
 print("Creating motor modules..")
 ## Create motor modules
@@ -55,156 +97,112 @@ motor0 = bus0.get_motor(MODULE_ADDRESS)
 motor1 = bus1.get_motor(MODULE_ADDRESS)
 motor2 = bus2.get_motor(MODULE_ADDRESS)
 motor3 = bus3.get_motor(MODULE_ADDRESS)
+motors = TMCL.MotorGroup([motor0, motor1, motor2, motor3])
+## Sends a command to all four modules at the same instant
+wheels = TMCL.SyncDispatcher([motor0, motor1, motor2, motor3])
 
 print("Restarting Trinamic Module Timers..")
 ## Restart/Reinitialize the Trinamic Module Timers
-motor0.send(5,31,0,0)
-motor1.send(5,31,0,0)
-motor2.send(5,31,0,0)
-motor3.send(5,31,0,0)
+motor0.axis.set(31, 0)
+motor1.axis.set(31, 0)
+motor2.axis.set(31, 0)
+motor3.axis.set(31, 0)
 
 ## //////////// API Definitions ////////////
-## Motor parameter initializations
+## Accepted distance to a target position [counts] and longest wait for a move [s]
+POSITION_TOLERANCE = 5
+MOVE_TIMEOUT = 60
+
+## Motor parameter initializations (parameter, axis): value
+## (see also position_mode_script.tmc, which TMCL.load_profile() can read)
+MOTOR_PROFILE = TMCL.Profile(axis=[
+    ((159, 0), 6),        ##set commutation mode (FOC Hall Sensor)
+    ((254, 0), 1),        ##set hall sensor invert (True)
+    ((253, 0), 20),       ##set motor poles (20)
+    ((177, 0), 1000),     ##set start current [1mA] (peak)
+    ((6, 0), 6250),       ##set max current [6250mA] (peak)
+    ((4, 0), 1700),       ##set max velocity [1700rpm]
+    ((11, 0), 500),       ##set acceleration [500rpm/s]
+    ((172, 0), 600),      ##set torque P (600)
+    ((173, 0), 1000),     ##set torque I (1000)
+    ((234, 0), 20175),    ##set velocity P (20175)
+    ((235, 0), 20175),    ##set velocity I (20175)
+    ((230, 0), 300),      ##set position P (300)
+    ((25, 0), 300),       ##set thermal winding time constant [ms]
+    ((26, 0), 300),       ##set IIT counter limit
+])
+
 def motorParam():
     ## TMCL-IDE Commands
-	print("Initializing motor parameters..")
-    
-    ##set commutation mode (FOC Hall Sensor)
-    motor0.send(5, 159, 0, 6)
-    motor1.send(5, 159, 0, 6)
-    motor2.send(5, 159, 0, 6)
-    motor3.send(5, 159, 0, 6)
-
-    ##set hall sensor invert (True)
-    motor0.send(5, 254, 0, 1)
-    motor1.send(5, 254, 0, 1)
-    motor2.send(5, 254, 0, 1)
-    motor3.send(5, 254, 0, 1)
-
-    ##set motor poles (20)
-    motor0.send(5, 253, 0, 20)
-    motor1.send(5, 253, 0, 20)
-    motor2.send(5, 253, 0, 20)
-    motor3.send(5, 253, 0, 20)
-
-    ##set start current [1mA] (peak)
-    motor0.send(5, 177, 0, 1000)
-    motor1.send(5, 177, 0, 1000)
-    motor2.send(5, 177, 0, 1000)
-    motor3.send(5, 177, 0, 1000)
-
-    ##set max current [6250mA] (peak)
-    motor0.send(5, 6, 0, 6250)
-    motor1.send(5, 6, 0, 6250)
-    motor2.send(5, 6, 0, 6250)
-    motor3.send(5, 6, 0, 6250)
-
-    ##set max velocity [1700rpm]
-    motor0.send(5, 4, 0, 1700)
-    motor1.send(5, 4, 0, 1700)
-    motor2.send(5, 4, 0, 1700)
-    motor3.send(5, 4, 0, 1700)
-
-    ##set acceleration [500rpm/s]
-    motor0.send(5, 11, 0, 500)
-    motor1.send(5, 11, 0, 500)
-    motor2.send(5, 11, 0, 500)
-    motor3.send(5, 11, 0, 500)
-
-    ##set torque P (600)
-    motor0.send(5, 172, 0, 600)
-    motor1.send(5, 172, 0, 600)
-    motor2.send(5, 172, 0, 600)
-    motor3.send(5, 172, 0, 600)
-
-    ##set torque I (1000)
-    motor0.send(5, 173, 0, 1000)
-    motor1.send(5, 173, 0, 1000)
-    motor2.send(5, 173, 0, 1000)
-    motor3.send(5, 173, 0, 1000)
-
-    ##set velocity P (20175)
-    motor0.send(5, 234, 0, 20175)
-    motor1.send(5, 234, 0, 20175)
-    motor2.send(5, 234, 0, 20175)
-    motor3.send(5, 234, 0, 20175)
-
-    ##set velocity I (20175)
-    motor0.send(5, 235, 0, 20175)
-    motor1.send(5, 235, 0, 20175)
-    motor2.send(5, 235, 0, 20175)
-    motor3.send(5, 235, 0, 20175)
-
-    ##set position P (20175)
-    motor0.send(5, 230, 0, 300)
-    motor1.send(5, 230, 0, 300)
-    motor2.send(5, 230, 0, 300)
-    motor3.send(5, 230, 0, 300)
-
-    ##set thermal winding time constant [ms]    
-    motor0.send(5, 25, 0, 300)
-    motor1.send(5, 25, 0, 300)
-    motor2.send(5, 25, 0, 300)
-    motor3.send(5, 25, 0, 300)
-
-    ##set IIT counter limit
-    motor0.send(5, 26, 0, 300)
-    motor1.send(5, 26, 0, 300)
-    motor2.send(5, 26, 0, 300)
-    motor3.send(5, 26, 0, 300)
+    print("Initializing motor parameters..")
+
+    ## Read all modules in one batch each and only write what differs
+    changed = TMCL.apply_profile([motor0, motor1, motor2, motor3], MOTOR_PROFILE)
+    for i in range(len(changed)):
+        print("Motor %d: %d parameters updated" % (i, len(changed[i])))
     
 
+## Set in __main__; motion commands are skipped once it tripped
+watchdog = None
+
+def tripped():
+    ##True once the watchdog stopped the wheels, until it is reset
+    if watchdog is not None and watchdog.tripped is not None:
+        print("Watchdog tripped, motion command skipped: %s" % watchdog.tripped.reason)
+        return True
+    return False
+
 def fwd():
     ##SAP 0x1, 0x0, 0        set actual position
     print("Actual Position Set to 0.")
-    motor0.send(5, 1, 0, 0)
-    motor1.send(5, 1, 0, 0)
-    motor2.send(5, 1, 0, 0)
-    motor3.send(5, 1, 0, 0)
+    motor0.axis.set(1, 0)
+    motor1.axis.set(1, 0)
+    motor2.axis.set(1, 0)
+    motor3.axis.set(1, 0)
 
     ##SAP 140x6, 0x0, 1      enable velocity ramp
     print("Enabling Position Mode...")
-    motor0.send(5, 146, 0, 1)
+    motor0.axis.set(146, 1)
     print("Motor 0 Velocity Ramp: %s" % (motor0.send(6,146,0,0)))
-    motor1.send(5, 146, 0, 1)
+    motor1.axis.set(146, 1)
     print("Motor 1 Velocity Ramp: %s" % (motor1.send(6,146,0,0)))
-    motor2.send(5, 146, 0, 1)
+    motor2.axis.set(146, 1)
     print("Motor 2 Velocity Ramp: %s" % (motor2.send(6,146,0,0)))
-    motor3.send(5, 146, 0, 1)
+    motor3.axis.set(146, 1)
     print("Motor 3 Velocity Ramp: %s" % (motor3.send(6,146,0,0)))
 
     ##SAP 0x0, 0x0, 0x4E20    set target position
+    if tripped():
+        return
     print("Target Position set to 75ft.")
-    motor0.send(5, 0, 0, 5730)
+    sync = wheels.set_axis(0, 5730)
+    print("Target Position skew between wheels: %.3fms" % (sync.send_skew * 1e3))
     print("Motor 0 Target Position: %s" % (motor0.send(6,0,0,0)))
-    motor1.send(5, 0, 0, 5730)
-    print("Motor 0 Target Position: %s" % (motor1.send(6,0,0,0)))
-    motor2.send(5, 0, 0, 5730)
+    print("Motor 1 Target Position: %s" % (motor1.send(6,0,0,0)))
     print("Motor 2 Target Position: %s" % (motor2.send(6,0,0,0)))
-    motor3.send(5, 0, 0, 5730)
     print("Motor 3 Target Position: %s" % (motor3.send(6,0,0,0)))
 
-     ##WAIT FOR EVENT CODE NEEDED
+    waitPosition(5730)
     
 def rev():
     ##SAP 0x0, 0x0, 0        set target position
+    if tripped():
+        return
     print("Target Position set to 0.")
-    motor0.send(5, 0, 0, 0)
-    motor1.send(5, 0, 0, 0)
-    motor2.send(5, 0, 0, 0)
-    motor3.send(5, 0, 0, 0)
+    sync = wheels.set_axis(0, 0)
+    print("Target Position skew between wheels: %.3fms" % (sync.send_skew * 1e3))
 
-    ##WAIT FOR EVENT CODE NEEDED
+    waitPosition(0)
 
     ##SAP 140x6, 0x0, 0      disable velocity ramp
     print("Disabling velocity ramp...")
-    motor0.send(5, 146, 0, 0)
+    motor0.axis.set(146, 0)
     print("Motor 0 Velocity Ramp: %s" % (motor0.send(6,146,0,0)))
-    motor1.send(5, 146, 0, 0)
+    motor1.axis.set(146, 0)
     print("Motor 1 Velocity Ramp: %s" % (motor0.send(6,146,0,0)))
-    motor2.send(5, 146, 0, 0)
+    motor2.axis.set(146, 0)
     print("Motor 2 Velocity Ramp: %s" % (motor0.send(6,146,0,0)))
-    motor3.send(5, 146, 0, 0)
+    motor3.axis.set(146, 0)
     print("Motor 3 Velocity Ramp: %s" % (motor0.send(6,146,0,0)))
 
     ##MST 0              	stop motor
@@ -214,6 +212,17 @@ def rev():
     motor2.send(3, 0, 0, 0)
     motor3.send(3, 0, 0, 0)
 
+def waitPosition(target):
+    ##wait until all four actual positions are within POSITION_TOLERANCE of target
+    ##a watchdog trip ends the wait
+    times = motors.wait_until(1, target, POSITION_TOLERANCE, MOVE_TIMEOUT,
+        stop=lambda: watchdog is not None and watchdog.tripped is not None)
+    for i in range(len(times)):
+        if times[i] is None:
+            print("Motor %d stopped by the watchdog before reaching %d" % (i, target))
+        else:
+            print("Motor %d reached %d after %.3fs" % (i, target, times[i]))
+
 def readMotor0RPM():
     print("Motor 0 RPM: %s" % (motor0.send(6,3,0,0)))
     return motor0.send(6,3,0,0)
@@ -254,31 +263,19 @@ def readMotor3Current():
     return motor3.send(6,150,0,0)
 
 def readBoard0Temp():
-    ADC0 = motor0.send(6,152,0,0)
-    B = 3434
-    RNTC0 = (9011.2/ADC0) - 2.2
-    board0Temp = ((B * 298.16)/(B + (math.log(RNTC0/10)*298.16)))- 273.16
+    board0Temp = float(TMCL.metrics.board_temperature(motor0.send(6,152,0,0).value))
     print("Trinamic 0 Temperature(C): %s" % (board0Temp))
     return board0Temp
 def readBoard1Temp():
-    ADC1 = motor1.send(6,152,0,0)
-    B = 3434
-    RNTC1 = (9011.2/ADC1) - 2.2
-    board1Temp = ((B * 298.16)/(B + (math.log(RNTC1/10)*298.16)))- 273.16
+    board1Temp = float(TMCL.metrics.board_temperature(motor1.send(6,152,0,0).value))
     print("Trinamic 1 Temperature(C): %s" % (board1Temp))
     return board1Temp
 def readBoard2Temp():
-    ADC2 = motor2.send(6,152,0,0)
-    B = 3434
-    RNTC2 = (9011.2/ADC2) - 2.2
-    board2Temp = ((B * 298.16)/(B + (math.log(RNTC2/10)*298.16)))- 273.16
+    board2Temp = float(TMCL.metrics.board_temperature(motor2.send(6,152,0,0).value))
     print("Trinamic 2 Temperature(C): %s" % (board2Temp))
     return board2Temp
 def readBoard3Temp():
-    ADC3 = motor3.send(6,152,0,0)
-    B = 3434
-    RNTC3 = (9011.2/ADC3) - 2.2
-    board3Temp = ((B * 298.16)/(B + (math.log(RNTC3/10)*298.16)))- 273.16
+    board3Temp = float(TMCL.metrics.board_temperature(motor3.send(6,152,0,0).value))
     print("Trinamic 3 Temperature(C): %s" % (board3Temp))
     return board3Temp
     
@@ -360,7 +357,22 @@ def readIIT3():
     return motor3.send(6,27,0,0)
 
 ## //////////// Application ////////////
-motorParam()
-while(1):
-    fwd()
-    rev()
+## Stops every wheel when a module reports an error or leaves these limits
+WATCHDOG_LIMITS = [
+    TMCL.watchdog.Limit(156, mask=TMCL.watchdog.ERROR_FLAGS, name="error flags"),
+    TMCL.watchdog.Limit(27, high=300, name="IIT sum"),    ## IIT counter limit of MOTOR_PROFILE
+    TMCL.watchdog.Limit(152, high=80.0, convert=TMCL.metrics.board_temperature, name="driver temperature [C]"),
+    TMCL.watchdog.Limit(151, low=240, high=340, name="supply voltage [0.1V]"),
+]
+
+def watchdogTrip(trip):
+    print("EMERGENCY STOP: %s" % trip.reason)
+    print("Trip to stop [ms]: %s" % ["%.2f" % (t * 1e3) if t is not None else "no ack" for t in trip.latencies])
+
+if __name__ == "__main__":
+    motorParam()
+    watchdog = TMCL.watchdog.Watchdog([motor0, motor1, motor2, motor3], WATCHDOG_LIMITS, on_trip=watchdogTrip)
+    watchdog.start()
+    while(watchdog.tripped is None):
+        fwd()
+        rev()
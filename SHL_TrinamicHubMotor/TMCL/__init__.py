@@ -2,6 +2,20 @@ from .bus import Bus
 from .motor import Motor
 from .commands import Command
 from .reply import Reply
+from .dispatch import Priority, RequestExpired
+from .cache import ParameterCache
+from .stats import BusStats, StatsExporter
+from .group import MotorGroup
+from .sync import SyncDispatcher, SyncResult
+from .discovery import scan_bus, find_wheels
+from .profile import Profile, apply_profile, load_profile
+from .snapshot import snapshot_modules, restore_modules, save_snapshot, load_snapshot
+from .script import parse_script, load_script
+from .assembler import assemble
+from .aio import AsyncBus, AsyncMotor
 
-def connect ( serial_port, CAN = False ):
-    return Bus(serial_port, CAN)
+def connect ( serial_port, CAN = False, timeout = None, retries = 0 ):
+    return Bus(serial_port, CAN, timeout, retries)
+
+def connect_async ( serial_port, CAN = False, timeout = None ):
+    return AsyncBus(serial_port, CAN, timeout)
@@ -0,0 +1,297 @@
+import asyncio
+from .bus import Bus, RESYNC_LIMIT
+from .commands import Command
+
+
+class AsyncBus (Bus):
+	"""
+	asyncio flavour of `Bus`.
+	`send` and `send_many` are coroutines that never block the event loop,
+	so several buses can be driven concurrently from a single thread.
+	The serial port is switched to non-blocking reads and the loop is
+	woken up through the port's file descriptor when a reply arrives.
+
+	Replies are checked against their requests like on `Bus`. After a
+	timeout the input is flushed, and again before the next request, so
+	a late reply never answers it.
+	"""
+
+	def __init__( self, serial, CAN = False, timeout = None, poll_interval = 0.001 ):
+		"""
+		:param serial:
+			An open serial port. Its read timeout is set to 0 (non-blocking).
+		:type  serial: serial.Serial
+
+		:param timeout:
+			Seconds to wait for a complete reply, or None to wait forever
+		:type  timeout: float
+
+		:param poll_interval:
+			Seconds between read attempts for ports that do not expose a
+			file descriptor
+		:type  poll_interval: float
+		"""
+		super(AsyncBus, self).__init__(serial, CAN)
+		self.timeout = timeout
+		self.poll_interval = poll_interval
+		self.serial.timeout = 0
+		self._alock = asyncio.Lock()
+		# set after a timeout: replies to the timed out request may still arrive
+		self._stale = False
+		try:
+			self._fileno = serial.fileno()
+		except (AttributeError, NotImplementedError, ValueError):
+			self._fileno = None
+
+	async def send ( self, address, command, type, motorbank, value ):
+		"""
+		Send a message to the specified module and await the reply.
+		Parameters are the same as for `Bus.send`.
+
+		:rtype: Reply
+		"""
+		async with self._alock:
+			if self._stale:
+				self.reset_input()
+			self.serial.write(self._encode(address, command, type, motorbank, value))
+			replies = await self._read([(address, command)])
+		return self._handle_reply(replies[0])
+
+	async def send_many ( self, commands ):
+		"""
+		Coroutine version of `Bus.send_many`.
+
+		:rtype: list of Reply
+		"""
+		commands = list(commands)
+		if not commands:
+			return []
+		async with self._alock:
+			if self._stale:
+				self.reset_input()
+			self.serial.write(self._encode_many(commands))
+			replies = await self._read([command[:2] for command in commands])
+		for reply in replies:
+			self._handle_reply(reply)
+		return replies
+
+	def get_module( self, address=1 ):
+		"""
+		:rtype: AsyncModule
+		"""
+		return AsyncModule(self, address)
+
+	def get_motor( self, address=1, motor_id=0 ):
+		"""
+		:rtype: AsyncMotor
+		"""
+		return AsyncMotor(self, address, motor_id)
+
+	async def _read( self, requests ):
+		"""
+		Read the replies to the (address, command) pairs just written.
+
+		:rtype: list of Reply
+		"""
+		if self.timeout is None:
+			return await self._receive_all(requests)
+		try:
+			return await asyncio.wait_for(self._receive_all(requests), self.timeout)
+		except asyncio.TimeoutError:
+			# drop what did arrive now and anything late before the next request
+			self.reset_input()
+			self._stale = True
+			raise
+
+	def reset_input( self ):
+		super(AsyncBus, self).reset_input()
+		self._stale = False
+
+	async def _receive_all( self, requests ):
+		return [await self._receive_reply(address, command) for address, command in requests]
+
+	async def _receive_reply( self, address, command ):
+		"""
+		Await the reply to `command` from `address`. Bytes that cannot
+		start a valid frame and frames that answer something else are
+		dropped, as in `Bus._resync`.
+
+		:rtype: Reply
+		"""
+		buf = self._pending
+		length = self.reply_length
+		discarded = 0
+		while True:
+			position = 0
+			while len(buf) - position >= length:
+				if not self.resync:
+					reply = self._decode(buf, position)
+					del buf[:length]
+					return reply
+				reply = self._match(buf, position, address, command)
+				if reply is not None:
+					del buf[:position + length]
+					return reply
+				position += length if self._frame(buf, position) is not None else 1
+			del buf[:position]
+			discarded += position
+			if discarded > RESYNC_LIMIT:
+				raise IOError("No valid reply after discarding %d bytes" % discarded)
+			chunk = self.serial.read(length - len(buf))
+			if chunk:
+				buf.extend(chunk)
+			else:
+				await self._readable()
+
+	async def _readable( self ):
+		if self._fileno is None:
+			await asyncio.sleep(self.poll_interval)
+			return
+		loop = asyncio.get_running_loop()
+		ready = loop.create_future()
+		loop.add_reader(self._fileno, lambda: ready.done() or ready.set_result(None))
+		try:
+			await ready
+		finally:
+			loop.remove_reader(self._fileno)
+
+
+class AsyncModule(object):
+	"""
+	Represents a single TMCM module on an `AsyncBus`.
+	"""
+
+	def __init__( self, bus, address=1 ):
+		self.bus = bus
+		self.address = address
+
+	def get_motor( self, axis=0 ):
+		"""
+		:rtype: AsyncMotor
+		"""
+		return AsyncMotor(self.bus, self.address, axis)
+
+
+class AsyncMotor(object):
+	"""
+	Mirror of `Motor` whose commands are coroutines.
+	"""
+	RFS_START = 0
+	RFS_STOP = 1
+	RFS_STATUS = 2
+
+	def __init__( self, bus, address=1, axis=0 ):
+		self.bus = bus
+		self.module_id = address
+		self.motor_id = axis
+		self.axis = AsyncAxisParameterInterface(self)
+
+	async def send( self, cmd, type, motorbank, value ):
+		return await self.bus.send(self.module_id, cmd, type, motorbank, value)
+
+	async def stop( self ):
+		await self.send(Command.MST, 0, self.motor_id, 0)
+
+	async def get_user_var( self, n ):
+		reply = await self.send(Command.GGP, n, 2, 0)
+		return reply.value
+
+	async def set_user_var( self, n, value ):
+		reply = await self.send(Command.SGP, n, 2, value)
+		return reply.status
+
+	async def rotate_left( self, velocity ):
+		reply = await self.send(Command.ROL, 0, self.motor_id, velocity)
+		return reply.status
+
+	async def rotate_right( self, velocity ):
+		reply = await self.send(Command.ROR, 0, self.motor_id, velocity)
+		return reply.status
+
+	async def move_absolute( self, position ):
+		reply = await self.send(Command.MVP, 0, self.motor_id, position)
+		return reply.status
+
+	async def move_relative( self, offset ):
+		reply = await self.send(Command.MVP, 1, self.motor_id, offset)
+		return reply.status
+
+	async def run_command( self, cmdIndex ):
+		reply = await self.send(Command.RUN_APPLICATION, 1, self.motor_id, cmdIndex)
+		return reply.status
+
+	async def reference_search( self, rfs_type ):
+		reply = await self.send(Command.RFS, rfs_type, self.motor_id, 99)
+		return reply.status
+
+
+class AsyncAxisParameterInterface(object):
+	"""
+	Mirror of `AxisParameterInterface`.
+	The named parameters are read-only properties returning awaitables,
+	e.g. `await motor.axis.actual_position`. Use `set` to write them.
+	"""
+
+	def __init__( self, motor ):
+		"""
+
+		:param motor:
+		:type  motor: AsyncMotor
+		"""
+		self.motor = motor
+
+	async def get( self, param ):
+		reply = await self.motor.send(Command.GAP, param, self.motor.motor_id, 0)
+		return reply.value
+
+	async def set( self, param, value ):
+		reply = await self.motor.send(Command.SAP, param, self.motor.motor_id, value)
+		return reply.status
+
+	@property
+	def target_position( self ):
+		return self.get(0)
+
+	@property
+	def actual_position( self ):
+		return self.get(1)
+
+	@property
+	def target_speed( self ):
+		return self.get(2)
+
+	@property
+	def actual_speed( self ):
+		return self.get(3)
+
+	@property
+	def max_positioning_speed( self ):
+		return self.get(4)
+
+	@property
+	def max_accelleration( self ):
+		return self.get(5)
+
+	@property
+	def max_current( self ):
+		return self.get(6)
+
+	@property
+	def standby_current( self ):
+		return self.get(7)
+
+	@property
+	def target_position_reached( self ):
+		return self.get(8)
+
+	@property
+	def ref_switch_status( self ):
+		return self.get(9)
+
+	@property
+	def right_limit_status( self ):
+		return self.get(10)
+
+	@property
+	def left_limit_status( self ):
+		return self.get(11)
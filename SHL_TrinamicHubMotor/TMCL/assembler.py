@@ -0,0 +1,100 @@
+from .commands import Command
+from .script import ScriptError, parse_script
+
+
+# Symbolic operands accepted in the `type` field
+MVP_TYPES = {"ABS": 0, "REL": 1, "COORD": 2}
+RFS_TYPES = {"START": 0, "STOP": 1, "STATUS": 2}
+CALC_OPERATIONS = {"ADD": 0, "SUB": 1, "MUL": 2, "DIV": 3, "MOD": 4, "AND": 5, "OR": 6,
+	"XOR": 7, "NOT": 8, "LOAD": 9}
+CALCX_OPERATIONS = dict(CALC_OPERATIONS, SWAP=10)
+JUMP_CONDITIONS = {"ZE": 0, "NZ": 1, "EQ": 2, "NE": 3, "GT": 4, "GE": 5, "LT": 6, "LE": 7,
+	"ETO": 8, "EAL": 9, "EDV": 10, "EPO": 11}
+WAIT_CONDITIONS = {"TICKS": 0, "POS": 1, "REFSW": 2, "LIMSW": 3, "RFS": 4}
+CLE_FLAGS = {"ALL": 0, "ETO": 1, "EDV": 2, "EPO": 3}
+
+# mnemonic: (operand fields in source order, symbols for the type field)
+# Fields are "t" (type), "m" (motor/bank) and "v" (value). Omitted
+# trailing operands are 0. A label is allowed wherever a value is.
+INSTRUCTIONS = {
+	"ROR": ("mv", None),
+	"ROL": ("mv", None),
+	"MST": ("m", None),
+	"MVP": ("tmv", MVP_TYPES),
+	"SAP": ("tmv", None),
+	"GAP": ("tm", None),
+	"STAP": ("tm", None),
+	"RSAP": ("tm", None),
+	"AAP": ("tm", None),
+	"SGP": ("tmv", None),
+	"GGP": ("tm", None),
+	"STGP": ("tm", None),
+	"RSGP": ("tm", None),
+	"AGP": ("tm", None),
+	"RFS": ("tm", RFS_TYPES),
+	"SIO": ("tmv", None),
+	"GIO": ("tm", None),
+	"SAC": ("tmv", None),
+	"SCO": ("tmv", None),
+	"GCO": ("tm", None),
+	"CCO": ("tm", None),
+	"CALC": ("tv", CALC_OPERATIONS),
+	"CALCX": ("t", CALCX_OPERATIONS),
+	"COMP": ("v", None),
+	"JC": ("tv", JUMP_CONDITIONS),
+	"JA": ("v", None),
+	"CSUB": ("v", None),
+	"RSUB": ("", None),
+	"WAIT": ("tmv", WAIT_CONDITIONS),
+	"STOP": ("", None),
+	"CLE": ("t", CLE_FLAGS),
+}
+
+
+def assemble( source ):
+	"""
+	Assemble TMCL source into program instructions.
+
+	Labels ("Loop:") may be used as the target of JA, JC and CSUB. Every
+	instruction occupies one program memory word, so a label resolves to
+	the index of the instruction that follows it.
+
+	:param source: Script source or output of `parse_script`
+	:type  source: str or list of Instruction
+
+	:return: (command, type, motorbank, value) tuples ready for download
+	:rtype:  list of tuple
+	"""
+	if isinstance(source, str):
+		source = parse_script(source)
+
+	labels = {}
+	code = []
+	for instruction in source:
+		if instruction.mnemonic == "LABEL":
+			name = instruction.args[0]
+			if name in labels:
+				raise ScriptError("duplicate label %s" % name, instruction.line)
+			labels[name] = len(code)
+		elif instruction.mnemonic not in INSTRUCTIONS:
+			raise ScriptError("unknown instruction %s" % instruction.mnemonic, instruction.line)
+		else:
+			code.append(instruction)
+
+	return [_encode(instruction, labels) for instruction in code]
+
+
+def _encode( instruction, labels ):
+	fields, symbols = INSTRUCTIONS[instruction.mnemonic]
+	if len(instruction.args) > len(fields):
+		raise ScriptError("%s takes at most %d operands" % (instruction.mnemonic, len(fields)),
+			instruction.line)
+	operands = {"t": 0, "m": 0, "v": 0}
+	for field, arg in zip(fields, instruction.args):
+		if isinstance(arg, str):
+			table = symbols if field == "t" else labels if field == "v" else {}
+			if not table or arg not in table:
+				raise ScriptError("unknown operand %s" % arg, instruction.line)
+			arg = table[arg]
+		operands[field] = arg
+	return (getattr(Command, instruction.mnemonic), operands["t"], operands["m"], operands["v"])
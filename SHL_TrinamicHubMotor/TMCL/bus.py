@@ -1,29 +1,133 @@
+import contextlib
 import struct
+import threading
+import time
+from .commands import Command
+from .dispatch import Priority, Request, RequestQueue, Worker
 from .motor import Module, Motor
-from .reply import Reply, TrinamicException
+from .reply import ChecksumError, Reply, TrinamicException
+from .stats import BusStats
 
 
 # MSG_STRUCTURE = ">BBBBIB"
 MSG_STRUCTURE = ">BBBBiB"
-MSG_STRUCTURE_CAN = ">BBBI"
+MSG_STRUCTURE_CAN = ">BBBi"
 
 # REPLY_STRUCTURE = ">BBBBIB"
 REPLY_STRUCTURE = ">BBBBiB"
-REPLY_STRUCTURE_CAN = ">BBBI"
+REPLY_STRUCTURE_CAN = ">BBBi"
 REPLY_STRUCTURE_IIC = ">BBBIB"
 
 REPLY_LENGTH = 9
 REPLY_LENGTH_CAN = 7
 REPLY_LENGTH_IIC = 8
 
+# Precompiled frame layouts for the encode/decode fast path
+_MSG = struct.Struct(MSG_STRUCTURE)
+_MSG_CAN = struct.Struct(MSG_STRUCTURE_CAN)
+_REPLY = struct.Struct(REPLY_STRUCTURE)
+_REPLY_CAN = struct.Struct(REPLY_STRUCTURE_CAN)
+
+# Bytes discarded while looking for a valid reply before giving up
+RESYNC_LIMIT = 256
+
+# Commands that do the same when sent twice, so a request whose reply was
+# lost may be repeated. MVP is safe unless it is a relative move.
+RETRY_SAFE_COMMANDS = frozenset((
+	Command.ROL, Command.ROR, Command.MST, Command.SAP, Command.GAP, Command.STAP, Command.RSAP,
+	Command.SGP, Command.GGP, Command.STGP, Command.RSGP, Command.SIO, Command.GIO, Command.SCO,
+	Command.GCO, Command.CCO, Command.GET_APPLICATION_STATUS, Command.GET_FIRMWARE_VERSION,
+))
+MVP_RELATIVE = 1
+
+
+def checksum( a, b, c, d, value ):
+	"""
+	Sum of the eight header and value bytes of a binary frame, modulo 256.
+	Computed arithmetically so no intermediate buffer is needed.
+	"""
+	value &= 0xFFFFFFFF
+	return (a + b + c + d + (value & 0xFF) + ((value >> 8) & 0xFF) +
+		((value >> 16) & 0xFF) + (value >> 24)) & 0xFF
+
 
 class Bus (object):
+	"""
+	A serial connection to one or more TMCM modules.
+
+	`send` and `send_many` are safe to call from several threads. After
+	`start` (or the first `submit`) a single I/O worker owns the port and
+	serves requests from a priority queue, so an emergency stop is sent
+	before queued telemetry polls and stale low-priority requests can be
+	dropped at their deadline.
+
+	Callables in `pre_hooks` are called with every request frame right
+	before it is written, those in `post_hooks` with
+	(request frame, reply frame or None, seconds, exception or None) once
+	its reply was read. The frames are only valid during the call.
+	Those in `unmatched_hooks` are called with every well-formed Reply
+	that answers no request of the exchange reading it, e.g. a late
+	reply, before it is dropped.
+
+	Every reply is checked against its request: checksum, host address,
+	module address and command. When a reply is short or does not match,
+	garbage bytes are dropped until the matching frame turns up, so one
+	glitch costs a few bytes instead of the framing of every later reply.
+	Requests that still get no reply are resent up to `retries` times if
+	repeating them is harmless (see RETRY_SAFE_COMMANDS).
+	"""
 
-	def __init__( self, serial, CAN = False ):
+	def __init__( self, serial, CAN = False, timeout = None, retries = 0, host_address = 2 ):
+		"""
+		:param timeout:
+			Seconds to wait for each reply. None keeps the timeout the
+			serial port was opened with.
+		:type  timeout: float
+
+		:param retries: How often a request without reply is resent
+		:type  retries: int
+
+		:param host_address:
+			Reply address the modules answer with (global parameter 76),
+			None to accept any
+		:type  host_address: int
+		"""
 		self.CAN = CAN
 		self.serial = serial
+		self.reply_length = REPLY_LENGTH_CAN if CAN else REPLY_LENGTH
+		self.msg_length = _MSG_CAN.size if CAN else _MSG.size
+		# reusable frame buffers for `send`, and for traced batches grown on demand
+		self._tx = bytearray(self.msg_length)
+		self._rx = bytearray(self.reply_length)
+		self._batch_tx = bytearray()
+		self._batch_rx = bytearray()
+		# views into those buffers by batch size, see `_buffers`
+		self._views = {}
+		self._lock = threading.RLock()
+		# held only while frames are written, so a stop can go out during an exchange
+		self._write_lock = threading.Lock()
+		self._requests = None
+		self._worker = None
+		self.port = getattr(serial, "port", None)
+		self.stats = None
+		self.pre_hooks = []
+		self.post_hooks = []
+		self.unmatched_hooks = []
+		self.timeout = timeout
+		# per command number overrides of `timeout`, e.g. for slow EEPROM stores
+		self.timeouts = {}
+		# the port's own timeout, restored whenever no override applies
+		self._port_timeout = self._applied_timeout = getattr(serial, "timeout", None)
+		self.retries = retries
+		self.host_address = host_address
+		# check replies against their requests and resynchronise on mismatch
+		self.resync = True
+		# bytes read past a reply while resynchronising, consumed by the next read
+		self._pending = bytearray()
+		# modules in download mode, whose commands are stored and must not be repeated
+		self._downloading = set()
 
-	def send ( self, address, command, type, motorbank, value ):
+	def send ( self, address, command, type, motorbank, value, priority = None, deadline = None ):
 		"""
 		Send a message to the specified module.
 		This is a blocking function that will not return until a reply
@@ -36,26 +140,438 @@ class Bus (object):
 		:param type:	  Type
 		:param motorbank: Mot/Bank
 		:param value:	  Value
+		:param priority:  Queue priority once the worker runs, see `submit`
+		:param deadline:  Queue deadline once the worker runs, see `submit`
 	
 		:rtype: Reply
 		"""
-		if self.CAN:
-			msg = struct.pack(MSG_STRUCTURE_CAN, command, type, motorbank,value)
-			self.serial.write(msg)
-			resp = [0]
-			data = self.serial.read(REPLY_LENGTH_CAN)
-			resp.extend(struct.unpack(REPLY_STRUCTURE_CAN, data))
-			reply = Reply(resp)
-			return self._handle_reply(reply)
+		if self._worker is not None:
+			return self.submit(address, command, type, motorbank, value, priority, deadline).result()
+		with self._lock:
+			return self._transact(address, command, type, motorbank, value)
+
+	def send_many ( self, commands, priority = None, deadline = None, check = True ):
+		"""
+		Send a batch of messages in one write and collect all replies.
+		The frames are packed into a single buffer so the whole batch
+		costs roughly one round trip instead of one per command.
+
+		Every reply is read before any error is raised, so the stream
+		stays aligned even when one of the commands is rejected.
+
+		:param commands:
+			Sequence of (address, command, type, motorbank, value) tuples
+		:type  commands: list
+
+		:param check:
+			Raise TrinamicException for error replies. With False they
+			are returned like any other reply.
+		:type  check: bool
+
+		:return: Replies in the same order as `commands`
+		:rtype:  list of Reply
+		"""
+		commands = list(commands)
+		if not commands:
+			return []
+		if self._worker is not None:
+			return self.submit_many(commands, priority, deadline, check).result()
+		with self._lock:
+			return self._transact_many(commands, check)
+
+	def submit ( self, address, command, type, motorbank, value, priority = None, deadline = None ):
+		"""
+		Queue a message for the I/O worker, starting it if necessary.
+
+		:param priority:
+			One of the `Priority` classes. Defaults to EMERGENCY for MST
+			and NORMAL for everything else.
+		:type  priority: int
+
+		:param deadline:
+			`time.monotonic()` value after which the request is dropped
+			instead of sent. Its future then raises RequestExpired.
+		:type  deadline: float
+
+		:return: Future resolving to the Reply
+		:rtype:  concurrent.futures.Future
+		"""
+		if priority is None:
+			priority = Priority.default(command)
+		request = Request((address, command, type, motorbank, value), False, priority, deadline)
+		return self._queue(request)
+
+	def submit_many ( self, commands, priority = None, deadline = None, check = True ):
+		"""
+		Queue a batch for the I/O worker, see `send_many` and `submit`.
+		The batch is sent as one unit.
+
+		:return: Future resolving to the list of replies
+		:rtype:  concurrent.futures.Future
+		"""
+		commands = list(commands)
+		if priority is None:
+			priority = min(Priority.default(command[1]) for command in commands)
+		return self._queue(Request(commands, True, priority, deadline, check))
+
+	def start( self ):
+		"""
+		Start the I/O worker. From now on all traffic goes through the
+		request queue.
+		"""
+		with self._lock:
+			if self._worker is None:
+				self._requests = RequestQueue()
+				self._worker = Worker(self._requests, self._serve, time.monotonic,
+					"TMCL-bus %s" % getattr(self.serial, "port", ""))
+				self._worker.start()
+
+	def close( self ):
+		"""
+		Stop the I/O worker after the queued requests have been served.
+		"""
+		with self._lock:
+			worker, self._worker = self._worker, None
+			if worker is not None:
+				self._requests.close()
+		if worker is not None:
+			worker.join()
+
+	def enable_stats( self, stats=None ):
+		"""
+		Start collecting latency and error statistics for this bus.
+
+		:param stats: Statistics to add to, e.g. one shared by all buses
+		:type  stats: BusStats
+
+		:rtype: BusStats
+		"""
+		if stats is None:
+			stats = BusStats()
+		self.stats = stats
+		return stats
+
+	def disable_stats( self ):
+		self.stats = None
+
+	def _queue( self, request ):
+		if self._worker is None:
+			self.start()
+		return self._requests.put(request)
+
+	def _serve( self, request ):
+		with self._lock:
+			if request.many:
+				return self._transact_many(request.commands, request.check)
+			return self._transact(*request.commands)
+
+	def _transact( self, address, command, type, motorbank, value ):
+		if self.stats is not None or self.pre_hooks or self.post_hooks:
+			return self._transact_many([(address, command, type, motorbank, value)])[0]
+		self._set_timeout(self.timeouts.get(command, self.timeout) if self.timeouts else self.timeout)
+		self._encode_into(self._tx, 0, address, command, type, motorbank, value)
+		self._write(self._tx)
+		try:
+			reply = self._receive(self._rx, 0, address, command, type)
+		except IOError as error:
+			reply = self._retry([(address, command, type, motorbank, value)], [], error)[0]
+		return self._handle_reply(reply)
+
+	def _transact_many( self, commands, check=True, release=None ):
+		"""
+		Send a batch and read its replies. `release` is called right
+		before the batch is written, e.g. to line the write up with other
+		buses; it is not called again for retries.
+
+		:rtype: list of Reply
+		"""
+		if self.timeouts:
+			# the longest wait any command needs; None is the port's own timeout, which may be no limit
+			timeouts = [self.timeouts.get(command[1], self.timeout) for command in commands]
+			if None in timeouts:
+				own = self._own_timeout()
+				timeouts = [own if timeout is None else timeout for timeout in timeouts]
+			self._set_timeout(None if None in timeouts else max(timeouts))
 		else:
-			checksum = self._binaryadd(address, command, type, motorbank, value)
-			msg = struct.pack(MSG_STRUCTURE, address, command, type, motorbank, value, checksum)
-			self.serial.write(msg)
-			rep = self.serial.read(REPLY_LENGTH)
-			reply = Reply(struct.unpack(REPLY_STRUCTURE, rep))
-			return self._handle_reply(reply)
+			self._set_timeout(self.timeout)
+		replies = []
+		try:
+			if self.stats is not None or self.pre_hooks or self.post_hooks:
+				self._transact_traced(commands, replies, release)
+			else:
+				frames = self._encode_many(commands)
+				if release is not None:
+					release()
+				self._write(frames)
+				self._receive_many(commands, replies)
+		except IOError as error:
+			self._retry(commands, replies, error)
+		if check:
+			for reply in replies:
+				self._handle_reply(reply)
+		return replies
+
+	def _transact_traced( self, commands, replies, release=None ):
+		"""
+		`_transact_many` with hooks and statistics. Encode and write times
+		are those of the whole batch, first byte and total are measured
+		per reply from the start of the write.
+
+		Replies are appended to `replies`. A timeout is raised at once,
+		other errors after all replies were read.
+		"""
+		clock = time.perf_counter
+		tx, tx_frames, rx_frames, head, tail = self._buffers(len(commands))
+		start = clock()
+		offset = 0
+		for address, command, type, motorbank, value in commands:
+			self._encode_into(tx, offset, address, command, type, motorbank, value)
+			offset += self.msg_length
+		encode = clock() - start
+		for hook in self.pre_hooks:
+			hook(tx)
+		if release is not None:
+			release()
+		start = clock()
+		self._write(tx)
+		written = clock()
+		deferred = None
+		first_byte = None
+		i = 0
+		for address, command, type, motorbank, value in commands:
+			rx = rx_frames[i]
+			reply = error = None
+			try:
+				filled = 0
+				if first_byte is None:
+					if self._fill(head, 0, 1) != 1:
+						raise IOError("Timeout waiting for reply (0 of %d bytes received)" % self.reply_length)
+					first_byte = clock() - start
+					filled = 1 + self._fill(tail, 0, len(tail))
+				reply = self._receive(rx, 0, address, command, type, filled)
+			except ChecksumError as e:
+				error = e
+				if self.stats is not None:
+					self.stats.checksum_error(self.port, address, command, type)
+			except IOError as e:
+				error = e
+				if self.stats is not None:
+					self.stats.timeout(self.port, address, command, type)
+			total = clock() - start
+			if reply is not None and self.stats is not None:
+				self.stats.record(self.port, address, command, type, encode, written - start,
+					first_byte, total, reply.status)
+			for hook in self.post_hooks:
+				hook(tx_frames[i], None if isinstance(error, IOError) else rx, total, error)
+			if isinstance(error, IOError):
+				# nothing more will arrive in time, the rest would time out too
+				raise error
+			replies.append(reply)
+			if deferred is None:
+				deferred = error
+			i += 1
+		if deferred is not None:
+			raise deferred
+
+	def _buffers( self, count ):
+		"""
+		Buffers and views for a traced batch of `count` frames. They are
+		created once per batch size and reused, so tracing a batch
+		allocates no frame buffers, views or tuples.
+
+		:return: (request buffer, request frames, reply frames,
+		         first byte of the first reply frame, rest of it)
+		:rtype:  tuple
+		"""
+		views = self._views.get(count)
+		if views is None:
+			if count == 1:
+				tx, rx = self._tx, self._rx
+			else:
+				if len(self._batch_tx) < self.msg_length * count:
+					# views into the old buffers are dropped and rebuilt on demand
+					self._batch_tx = bytearray(self.msg_length * count)
+					self._batch_rx = bytearray(self.reply_length * count)
+					self._views.clear()
+				tx = memoryview(self._batch_tx)[:self.msg_length * count]
+				rx = memoryview(self._batch_rx)[:self.reply_length * count]
+			tx_frames = [memoryview(tx)[i * self.msg_length:(i + 1) * self.msg_length] for i in range(count)]
+			rx_frames = [memoryview(rx)[i * self.reply_length:(i + 1) * self.reply_length] for i in range(count)]
+			views = self._views[count] = (tx, tx_frames, rx_frames, rx_frames[0][:1], rx_frames[0][1:])
+		return views
+
+	def _receive_many( self, commands, replies ):
+		"""
+		Read the replies to a written batch in one go and append them to
+		`replies`, resynchronising from the first one that is missing or
+		does not match its command.
+		"""
+		length = self.reply_length
+		data = bytearray(length * len(commands))
+		n = self._fill(data, 0, len(data))
+		if not self.resync:
+			if n != len(data):
+				raise IOError("Timeout waiting for reply (%d of %d bytes received)" % (n, len(data)))
+			replies.extend(self._decode(data, i * length) for i in range(len(commands)))
+			return
+		if n == 0:
+			raise IOError("Timeout waiting for reply (0 of %d bytes received)" % len(data))
+		for i, (address, command, type, motorbank, value) in enumerate(commands):
+			offset = i * length
+			reply = self._match(data, offset, address, command) if offset + length <= n else None
+			if reply is None:
+				self._pending[0:0] = data[offset:n]
+				for address, command, type, motorbank, value in commands[i:]:
+					replies.append(self._resync(data, offset, address, command, type))
+					offset += length
+				return
+			replies.append(reply)
 
-	def get_module( self, address=1 ):
+	def _receive( self, rx, offset, address, command, type, filled=0 ):
+		"""
+		Read the reply to `command` from `address` into
+		rx[offset:offset + reply_length], of which the first `filled`
+		bytes have already been read.
+
+		:rtype: Reply
+		"""
+		stop = offset + self.reply_length
+		n = filled + self._fill(rx, offset + filled, stop)
+		if not self.resync:
+			if n != self.reply_length:
+				raise IOError("Timeout waiting for reply (%d of %d bytes received)" % (n, self.reply_length))
+			return self._decode(rx, offset)
+		if n == self.reply_length:
+			reply = self._match(rx, offset, address, command)
+			if reply is not None:
+				return reply
+		elif n == 0:
+			raise IOError("Timeout waiting for reply (0 of %d bytes received)" % self.reply_length)
+		self._pending[0:0] = rx[offset:offset + n]
+		return self._resync(rx, offset, address, command, type)
+
+	def _resync( self, rx, offset, address, command, type ):
+		"""
+		Find the reply to `command` from `address` in the bytes read so far
+		and the ones still arriving, and copy it to rx[offset:].
+
+		Bytes that cannot start a valid frame are discarded one at a time,
+		valid frames that answer something else (late replies to timed out
+		requests) as a whole. Gives up after RESYNC_LIMIT discarded bytes
+		or when the port times out.
+
+		:rtype: Reply
+		"""
+		buf = self._pending
+		length = self.reply_length
+		discarded = 0
+		while True:
+			position = 0
+			while len(buf) - position >= length:
+				reply = self._frame(buf, position)
+				if reply is None:
+					position += 1
+				elif reply.module_address != address or reply.command != command:
+					for hook in self.unmatched_hooks:
+						hook(reply)
+					position += length
+				else:
+					rx[offset:offset + length] = buf[position:position + length]
+					del buf[:position + length]
+					discarded += position
+					if discarded and self.stats is not None:
+						self.stats.resync(self.port, address, command, type, discarded)
+					return reply
+			del buf[:position]
+			discarded += position
+			if discarded > RESYNC_LIMIT:
+				raise IOError("No valid reply after discarding %d bytes" % discarded)
+			data = self.serial.read(length - len(buf))
+			if not data:
+				raise IOError("Timeout waiting for reply (%d bytes discarded)" % discarded)
+			buf.extend(data)
+
+	def _retry( self, commands, replies, error ):
+		"""
+		Resend the commands of a failed exchange that have no reply yet,
+		at most `retries` times and only if repeating them is harmless.
+
+		:return: `replies`, completed
+		:rtype:  list of Reply
+		"""
+		for attempt in range(self.retries):
+			remaining = commands[len(replies):]
+			if not self._retry_safe(remaining):
+				break
+			if self.stats is not None:
+				address, command, type, motorbank, value = remaining[0]
+				self.stats.retry(self.port, address, command, type)
+			self.reset_input()
+			try:
+				if self.stats is not None or self.pre_hooks or self.post_hooks:
+					self._transact_traced(remaining, replies)
+				else:
+					self._write(self._encode_many(remaining))
+					self._receive_many(remaining, replies)
+				return replies
+			except IOError as e:
+				error = e
+		raise error
+
+	def _retry_safe( self, commands ):
+		for address, command, type, motorbank, value in commands:
+			if address in self._downloading:
+				return False
+			if command == Command.MVP:
+				if type == MVP_RELATIVE:
+					return False
+			elif command not in RETRY_SAFE_COMMANDS:
+				return False
+		return True
+
+	@contextlib.contextmanager
+	def downloading( self, module ):
+		"""
+		Mark `module` as being in download mode for the duration of the
+		block. Its commands are stored rather than executed, so they are
+		never resent by the retries.
+		"""
+		self._downloading.add(module)
+		try:
+			yield
+		finally:
+			self._downloading.discard(module)
+
+	@contextlib.contextmanager
+	def probing( self ):
+		"""
+		Hold the bus for a scan. For the duration of the block the bus is
+		locked, replies are taken as they come (no resynchronisation, no
+		retries) and the per-command timeouts are suspended, so `timeout`
+		alone sets the wait. All of it is restored afterwards.
+
+		Yields a function with the signature of `send` that exchanges one
+		message directly, also while the I/O worker runs.
+		"""
+		with self._lock:
+			saved = (self.timeout, self.timeouts, self.retries, self.resync)
+			self.timeouts, self.retries, self.resync = {}, 0, False
+			try:
+				yield self._transact
+			finally:
+				self.timeout, self.timeouts, self.retries, self.resync = saved
+				self._set_timeout(self.timeout)
+
+	def reset_input( self ):
+		"""
+		Discard everything received but not yet read, e.g. after a glitch.
+		"""
+		del self._pending[:]
+		reset = getattr(self.serial, "reset_input_buffer", None)
+		if reset is not None:
+			reset()
+
+	def get_module( self, address=1, cache=None ):
 		"""
 			Returns a Module object targeting the device at address `address`
 			You can use this object to retrieve one or more axis motors.
@@ -64,11 +580,15 @@ class Bus (object):
 				Bus address to the target TMCM module
 			:type  address: int
 
+			:param cache:
+				Optional ParameterCache shared by the module's motors
+			:type  cache: ParameterCache
+
 			:rtype: Module
 		"""
-		return Module(self, address)
+		return Module(self, address, cache)
 
-	def get_motor( self, address=1, motor_id=0 ):
+	def get_motor( self, address=1, motor_id=0, cache=None ):
 		"""		
 			Returns object addressing motor number `motor_id` on module `address`.
 			`address` defaults to 1 (doc for TMCM310 starts counting addresses at 1).
@@ -85,9 +605,131 @@ class Bus (object):
 				ID of the motor/axis to target
 			:type  motor_id: int
 
+			:param cache:
+				Optional ParameterCache for axis parameter reads and writes
+			:type  cache: ParameterCache
+
 			:rtype: Motor
 		"""
-		return Motor(self, address, motor_id)
+		return Motor(self, address, motor_id, cache)
+
+	def _encode( self, address, command, type, motorbank, value ):
+		buf = bytearray(self.msg_length)
+		self._encode_into(buf, 0, address, command, type, motorbank, value)
+		return bytes(buf)
+
+	def _encode_many( self, commands ):
+		buf = bytearray(self.msg_length * len(commands))
+		offset = 0
+		for address, command, type, motorbank, value in commands:
+			self._encode_into(buf, offset, address, command, type, motorbank, value)
+			offset += self.msg_length
+		return buf
+
+	def _encode_into( self, buf, offset, address, command, type, motorbank, value ):
+		if self.CAN:
+			_MSG_CAN.pack_into(buf, offset, command, type, motorbank, value)
+		else:
+			_MSG.pack_into(buf, offset, address, command, type, motorbank, value,
+				checksum(address, command, type, motorbank, value))
+
+	def _write( self, data ):
+		with self._write_lock:
+			self.serial.write(data)
+
+	def _read_into( self, buf, start=0, stop=None ):
+		if stop is None:
+			stop = len(buf)
+		n = self._fill(buf, start, stop)
+		if n != stop - start:
+			raise IOError("Timeout waiting for reply (%d of %d bytes received)" % (start + n, stop))
+
+	def _fill( self, buf, start, stop ):
+		"""
+		Read into buf[start:stop], first from the bytes left over by a
+		resynchronisation, then from the port for as long as data keeps
+		arriving within the port's timeout.
+
+		:return: Number of bytes read
+		:rtype:  int
+		"""
+		size = stop - start
+		if size <= 0:
+			return 0
+		view = buf if start == 0 and stop == len(buf) else memoryview(buf)[start:stop]
+		n = 0
+		if self._pending:
+			n = min(len(self._pending), size)
+			view[:n] = self._pending[:n]
+			del self._pending[:n]
+		readinto = getattr(self.serial, "readinto", None)
+		while n < size:
+			if readinto is not None:
+				got = readinto(view if n == 0 else memoryview(view)[n:])
+			else:
+				data = self.serial.read(size - n)
+				got = len(data)
+				view[n:n + got] = data
+			if not got:
+				break
+			n += got
+		return n
+
+	def _set_timeout( self, timeout ):
+		"""
+		Apply `timeout` to the port, or the port's own timeout for None.
+		"""
+		own = self._own_timeout()
+		if timeout is None:
+			timeout = own
+		if self.serial.timeout != timeout:
+			self.serial.timeout = timeout
+		self._applied_timeout = timeout
+
+	def _own_timeout( self ):
+		"""
+		:return: The timeout the port was opened with, or the one last
+		         set on the port directly, e.g. by `find_wheels`
+		:rtype:  float
+		"""
+		if self.serial.timeout != self._applied_timeout:
+			self._port_timeout = self._applied_timeout = self.serial.timeout
+		return self._port_timeout
+
+	def _decode( self, data, offset=0 ):
+		if self.CAN:
+			module_address, status, command, value = _REPLY_CAN.unpack_from(data, offset)
+			return Reply((0, module_address, status, command, value, None))
+		reply = Reply(_REPLY.unpack_from(data, offset))
+		if checksum(reply.reply_address, reply.module_address, reply.status, reply.command,
+				reply.value) != reply.checksum:
+			raise ChecksumError(reply)
+		return reply
+
+	def _frame( self, data, offset ):
+		"""
+		:return: The reply at data[offset:] if it is a well-formed frame, else None
+		:rtype:  Reply
+		"""
+		if self.CAN:
+			return self._decode(data, offset)
+		reply = Reply(_REPLY.unpack_from(data, offset))
+		if checksum(reply.reply_address, reply.module_address, reply.status, reply.command,
+				reply.value) != reply.checksum:
+			return None
+		if self.host_address is not None and reply.reply_address != self.host_address:
+			return None
+		return reply
+
+	def _match( self, data, offset, address, command ):
+		"""
+		:return: The reply at data[offset:] if it answers `command` sent to `address`, else None
+		:rtype:  Reply
+		"""
+		reply = self._frame(data, offset)
+		if reply is None or reply.module_address != address or reply.command != command:
+			return None
+		return reply
 
 	def _handle_reply (self, reply):
 		if reply.status < Reply.Status.SUCCESS:
@@ -95,11 +737,4 @@ class Bus (object):
 		return reply
 
 	def _binaryadd( self, address, command, type, motorbank, value ):
-		checksum_struct = struct.pack(MSG_STRUCTURE[:-1], address, command, type, motorbank, value)
-		checksum = 0
-		for s in checksum_struct:
-			checksum += int(s) % 256
-			checksum = checksum % 256
-		return checksum
-
-
+		return checksum(address, command, type, motorbank, value)
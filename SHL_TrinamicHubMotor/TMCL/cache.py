@@ -0,0 +1,115 @@
+import threading
+from .commands import Command
+
+
+# Axis parameters whose value is measured or changed by the module itself.
+# They are never served from or skipped by the cache.
+VOLATILE_PARAMETERS = frozenset((
+	1,      # actual position
+	3,      # actual speed
+	8,      # target position reached
+	9,      # ref switch status
+	10,     # right limit switch status
+	27,     # IIT sum
+	28,     # IIT exceeded counter
+	29,     # clear IIT exceeded flag
+	30,     # run time
+	31,     # reinitialise timers
+	150,    # actual current
+	151,    # supply voltage
+	152,    # driver temperature
+	155,    # actual motor current
+	156,    # status/error flags
+))
+
+# Axis parameters that motion commands (MVP, ROR, ROL, MST, RFS) overwrite
+MOTION_PARAMETERS = (0, 2)
+
+MOTION_COMMANDS = frozenset((Command.MVP, Command.ROR, Command.ROL, Command.MST, Command.RFS))
+
+
+class ParameterCache(object):
+	"""
+	Write-through cache of axis parameter values keyed by
+	(bus, module, axis, parameter).
+
+	The cache is fed from `Motor.send` with every successful command so
+	it stays coherent no matter which API wrote a parameter. Parameters
+	written with SAP are tracked as dirty until they are stored to EEPROM
+	with STAP. A single cache may be shared by motors on several buses:
+	modules with the same address on different buses, such as the wheels
+	on their own USB ports, are kept apart by the `bus` argument.
+	"""
+
+	def __init__( self, volatile=VOLATILE_PARAMETERS ):
+		"""
+		:param volatile:
+			Parameters that must always be read from the device
+		:type  volatile: frozenset
+		"""
+		self.volatile = frozenset(volatile)
+		self._values = {}
+		self._dirty = set()
+		# re-entrant: `observe` calls `store` and `invalidate`
+		self._lock = threading.RLock()
+
+	def is_volatile( self, param ):
+		return param in self.volatile
+
+	def lookup( self, module, axis, param, bus=None ):
+		"""
+		:param bus: Bus the module is connected to
+		:type  bus: TMCL.Bus
+
+		:return: The cached value, or None if it is unknown or volatile
+		:rtype:  int
+		"""
+		return self._values.get((bus, module, axis, param))
+
+	def store( self, module, axis, param, value, bus=None ):
+		if param not in self.volatile:
+			with self._lock:
+				self._values[(bus, module, axis, param)] = value
+
+	def invalidate( self, module=None, axis=None, param=None, bus=None ):
+		"""
+		Forget cached values. Arguments left as None match everything, so
+		`invalidate()` clears the whole cache and `invalidate(module=1)`
+		everything belonging to module 1 on any bus.
+		"""
+		with self._lock:
+			for key in list(self._values):
+				if ((bus is None or key[0] is bus) and (module is None or key[1] == module)
+						and (axis is None or key[2] == axis) and (param is None or key[3] == param)):
+					del self._values[key]
+					self._dirty.discard(key)
+
+	def dirty( self, module, axis, bus=None ):
+		"""
+		:return: Parameters written since they were last stored to EEPROM
+		:rtype:  set of int
+		"""
+		with self._lock:
+			return set(key[3] for key in self._dirty if key[0] is bus and key[1] == module and key[2] == axis)
+
+	def observe( self, module, cmd, type, motorbank, value, reply, bus=None ):
+		"""
+		Update the cache from a command that completed successfully.
+		"""
+		key = (bus, module, motorbank, type)
+		with self._lock:
+			if cmd == Command.GAP:
+				self.store(module, motorbank, type, reply.value, bus)
+			elif cmd == Command.SAP:
+				if type not in self.volatile:
+					self._values[key] = value
+					self._dirty.add(key)
+			elif cmd == Command.STAP:
+				self._dirty.discard(key)
+			elif cmd == Command.RSAP:
+				self.invalidate(module, motorbank, type, bus)
+			elif cmd in MOTION_COMMANDS:
+				for param in MOTION_PARAMETERS:
+					self._values.pop((bus, module, motorbank, param), None)
+			elif cmd == Command.RESTORE_FACTORY_SETTINGS:
+				self.invalidate(module, bus=bus)
@@ -0,0 +1,217 @@
+import contextlib
+import socket
+import struct
+import threading
+from concurrent.futures import Future, TimeoutError
+from .bus import _MSG_CAN, _REPLY_CAN
+from .motor import Module, Motor
+from .reply import Reply, TrinamicException
+
+
+# struct can_frame from <linux/can.h>: id, length, padding, 8 data bytes
+CAN_FRAME = struct.Struct("=IB3x8s")
+CAN_EFF_MASK = 0x1FFFFFFF
+
+# seconds the reader blocks in recv before checking whether to stop
+READ_INTERVAL = 0.1
+
+
+class CanBus(object):
+	"""
+	TMCL over a SocketCAN interface with several modules on one link.
+
+	A request is sent with the module's CAN receive ID as identifier, so
+	`address` is the module ID set in global parameter 71. Replies are
+	matched to requests by the module address and the command in the
+	reply payload. Each module may have one request in flight, but
+	requests to different modules are issued without waiting for each
+	other. After a request timed out, the next reply of that module
+	carrying the same command is taken for its late reply and dropped.
+
+	Offers the same `send`/`send_many`/`get_module`/`get_motor` surface
+	as `Bus`, so `Module`, `Motor` and `MotorGroup` work unchanged.
+	"""
+
+	# lets MotorGroup run commands for different modules in parallel
+	concurrent_modules = True
+
+	def __init__( self, channel="can0", sock=None, timeout=1.0 ):
+		"""
+		:param channel:
+			SocketCAN interface name, e.g. "can0" or "vcan0"
+		:type  channel: str
+
+		:param sock:
+			An already bound socket carrying `struct can_frame` datagrams.
+			`channel` is ignored when this is given.
+		:type  sock: socket.socket
+
+		:param timeout:
+			Seconds to wait for a module to reply
+		:type  timeout: float
+		"""
+		if sock is None:
+			sock = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+			sock.bind((channel,))
+		sock.settimeout(READ_INTERVAL)
+		self.sock = sock
+		self.timeout = timeout
+		self.unmatched = 0
+		self._pending = {}
+		# {address: command} of requests given up on whose reply may still come
+		self._stale = {}
+		# addresses whose reply was dropped as late since their last request was answered
+		self._dropped = set()
+		self._module_locks = {}
+		self._lock = threading.Lock()
+		self._running = True
+		self._reader = threading.Thread(target=self._receive, name="TMCL-can %s" % channel)
+		self._reader.daemon = True
+		self._reader.start()
+
+	def send( self, address, command, type, motorbank, value, priority=None, deadline=None ):
+		"""
+		Send a message to module `address` and wait for its reply.
+		`priority` and `deadline` are accepted for compatibility with
+		`Bus.send` and ignored.
+
+		:rtype: Reply
+		"""
+		with self._module_lock(address):
+			future = self._issue(address, command, type, motorbank, value)
+			return self._handle_reply(self._wait(address, future))
+
+	def send_many( self, commands, priority=None, deadline=None, check=True ):
+		"""
+		Send a batch of (address, command, type, motorbank, value) tuples.
+		Commands for different modules are in flight at the same time;
+		commands for the same module are sent in order, one at a time.
+		`check` works as for `Bus.send_many`.
+
+		:return: Replies in the same order as `commands`
+		:rtype:  list of Reply
+		"""
+		commands = list(commands)
+		queues = {}
+		for index, command in enumerate(commands):
+			queues.setdefault(command[0], []).append(index)
+		locks = [self._module_lock(address) for address in sorted(queues)]
+		for lock in locks:
+			lock.acquire()
+		try:
+			replies = [None] * len(commands)
+			while queues:
+				wave = [(address, indexes.pop(0)) for address, indexes in queues.items()]
+				futures = [(address, index, self._issue(*commands[index])) for address, index in wave]
+				# wait for the whole wave, so no request is left behind in `_pending`
+				errors = []
+				for address, index, future in futures:
+					try:
+						replies[index] = self._wait(address, future)
+					except IOError as e:
+						errors.append(e)
+				if errors:
+					raise errors[0]
+				queues = dict((address, indexes) for address, indexes in queues.items() if indexes)
+		finally:
+			for lock in locks:
+				lock.release()
+		if check:
+			for reply in replies:
+				self._handle_reply(reply)
+		return replies
+
+	def get_module( self, address=1, cache=None ):
+		"""
+		:rtype: Module
+		"""
+		return Module(self, address, cache)
+
+	def get_motor( self, address=1, motor_id=0, cache=None ):
+		"""
+		:rtype: Motor
+		"""
+		return Motor(self, address, motor_id, cache)
+
+	@contextlib.contextmanager
+	def downloading( self, module ):
+		"""
+		See `Bus.downloading`. CAN requests are never resent, so there is
+		nothing to suspend.
+		"""
+		yield
+
+	def close( self ):
+		"""
+		Stop the reader thread and close the socket. The reader notices
+		within `READ_INTERVAL` seconds.
+		"""
+		self._running = False
+		self._reader.join()
+		self.sock.close()
+
+	def _module_lock( self, address ):
+		with self._lock:
+			if address not in self._module_locks:
+				self._module_locks[address] = threading.Lock()
+			return self._module_locks[address]
+
+	def _issue( self, address, command, type, motorbank, value ):
+		future = Future()
+		self._pending[address] = (command, future)
+		data = _MSG_CAN.pack(command, type, motorbank, value)
+		self.sock.send(CAN_FRAME.pack(address, len(data), data))
+		return future
+
+	def _wait( self, address, future ):
+		try:
+			return future.result(self.timeout)
+		except TimeoutError:
+			raise IOError("Timeout waiting for reply from CAN module %d" % address)
+		finally:
+			self._release(address, future)
+
+	def _release( self, address, future ):
+		# the caller stopped waiting for `future`; if no reply came, its late one must not answer the next request
+		pending = self._pending.get(address)
+		if pending is None or pending[1] is not future or self._pending.pop(address, None) is not pending:
+			return
+		if address in self._dropped:
+			# the module did answer, but its reply was taken for a late one
+			self._dropped.discard(address)
+		else:
+			self._stale[address] = pending[0]
+
+	def _handle_reply( self, reply ):
+		if reply.status < Reply.Status.SUCCESS:
+			raise TrinamicException(reply)
+		return reply
+
+	def _receive( self ):
+		while self._running:
+			try:
+				frame = self.sock.recv(CAN_FRAME.size)
+			except socket.timeout:
+				continue
+			except OSError:
+				break
+			if len(frame) < CAN_FRAME.size:
+				if not frame:
+					break
+				continue
+			can_id, length, data = CAN_FRAME.unpack(frame)
+			if length < _REPLY_CAN.size:
+				continue
+			module_address, status, command, value = _REPLY_CAN.unpack_from(data)
+			# a module answers in order, so a late reply is the first one after the timeout
+			if self._stale.pop(module_address, None) == command:
+				self._dropped.add(module_address)
+				self.unmatched += 1
+				continue
+			pending = self._pending.get(module_address)
+			if pending is None or pending[0] != command or self._pending.pop(module_address, None) is not pending:
+				# late reply to a request that timed out, or another host's
+				self.unmatched += 1
+				continue
+			self._dropped.discard(module_address)
+			pending[1].set_result(Reply(((can_id & CAN_EFF_MASK), module_address, status, command, value, None)))
@@ -0,0 +1,189 @@
+import json
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .bus import Bus
+from .commands import Command
+from .reply import ChecksumError, TrinamicException
+
+
+# How often an address is probed again after a late reply from another one
+LATE_REPLY_RETRIES = 3
+
+def scan_bus( bus, addresses=range(1, 256), timeout=0.02, min_timeout=0.002, margin=3.0, count=None ):
+	"""
+	Find the modules on a multi-drop (RS485) bus.
+
+	Every address is probed with GET_FIRMWARE_VERSION. The first probes
+	wait up to `timeout` for a reply; once a module has answered, the
+	wait is cut down to `margin` times the slowest round trip seen so
+	far, so silent addresses cost a few milliseconds each. A reply that
+	arrives late is not lost: it is recognised by its module address
+	on the next probe, the wait is widened again and the address the
+	late reply got in the way of is probed again.
+
+	The bus is held with `Bus.probing` for the whole scan.
+
+	:param bus:
+		A binary (non-CAN) `Bus`
+	:type  bus: TMCL.Bus
+
+	:param addresses:
+		Module addresses to probe, in order
+	:type  addresses: iterable of int
+
+	:param timeout:
+		Longest wait for a reply in seconds
+	:type  timeout: float
+
+	:param min_timeout:
+		Shortest wait for a reply in seconds
+	:type  min_timeout: float
+
+	:param margin:
+		Wait as a multiple of the slowest measured round trip
+	:type  margin: float
+
+	:param count:
+		Stop after this many modules were found
+	:type  count: int
+
+	:return: The responding modules, ordered by address
+	:rtype:  list of Module
+	"""
+	if bus.CAN:
+		raise ValueError("scan_bus needs a binary bus, CAN frames carry no module address")
+	addresses = list(addresses)
+	wanted = set(addresses)
+	found = set()
+	wait = timeout
+	slowest = 0.0
+	with bus.probing() as probe:
+		for address in addresses:
+			if count is not None and len(found) >= count:
+				break
+			for attempt in range(1 + LATE_REPLY_RETRIES):
+				if address in found:
+					break
+				bus.timeout = wait
+				start = time.monotonic()
+				try:
+					reply = probe(address, Command.GET_FIRMWARE_VERSION, 1, 0, 0)
+				except (IOError, struct.error, ChecksumError):
+					bus.reset_input()
+					break
+				except TrinamicException as e:
+					# an error status still proves the module is there
+					reply = e.reply
+				if reply.module_address != address:
+					# late reply to an earlier probe: widen the wait and ask this address again
+					if reply.module_address in wanted:
+						found.add(reply.module_address)
+					bus.reset_input()
+					wait = min(timeout, wait * 2)
+					continue
+				found.add(address)
+				slowest = max(slowest, time.monotonic() - start)
+				wait = min(timeout, max(min_timeout, slowest * margin))
+	return [bus.get_module(address) for address in sorted(found)]
+
+
+# User variable (global parameter bank 2) holding the wheel number of a module
+WHEEL_VARIABLE = 0
+
+
+def find_wheels( ports=None, wheel_variable=WHEEL_VARIABLE, address=1, timeout=0.05, cache_path=None,
+		refresh=False, serial_timeout=None ):
+	"""
+	Open the TMCM modules on all serial ports and map them to wheels.
+
+	Every port is opened and probed in parallel: GET_FIRMWARE_VERSION
+	checks a TMCM module answers at `address`, then user variable
+	`wheel_variable` tells which wheel it drives. With `cache_path` the
+	wheel of each USB serial number is stored as JSON, and ports found in
+	the cache are opened without probing on later calls.
+
+	:param ports:
+		Device names or `serial.tools.list_ports` entries to try.
+		Defaults to every USB serial port.
+	:type  ports: list
+
+	:param timeout:
+		Read timeout in seconds while probing
+	:type  timeout: float
+
+	:param cache_path:
+		JSON file mapping USB serial numbers to wheel numbers
+	:type  cache_path: str
+
+	:param refresh:
+		Probe every port even if it is in the cache
+	:type  refresh: bool
+
+	:param serial_timeout:
+		Read timeout of the ports once they are handed out
+	:type  serial_timeout: float
+
+	:return: {wheel number: Motor}
+	:rtype:  dict
+	"""
+	from serial.tools import list_ports
+	if ports is None:
+		ports = [port for port in list_ports.comports() if port.vid is not None]
+	candidates = [(getattr(port, "device", port), getattr(port, "serial_number", None)) for port in ports]
+	stored = {} if cache_path is None else _load_wheel_cache(cache_path)
+	cache = {} if refresh else stored
+
+	def open_wheel( device, serial_number ):
+		cached = cache.get(serial_number) if serial_number else None
+		try:
+			bus = _open_bus(device, timeout)
+		except IOError:
+			return None
+		if cached is not None:
+			bus.serial.timeout = serial_timeout
+			return cached, serial_number, bus.get_motor(address)
+		try:
+			bus.send(address, Command.GET_FIRMWARE_VERSION, 1, 0, 0)
+			motor = bus.get_motor(address)
+			wheel = motor.get_user_var(wheel_variable)
+		except (IOError, struct.error, TrinamicException):
+			bus.serial.close()
+			return None
+		bus.serial.timeout = serial_timeout
+		return wheel, serial_number, motor
+
+	with ThreadPoolExecutor(max_workers=max(1, len(candidates))) as pool:
+		found = [result for result in pool.map(lambda c: open_wheel(*c), candidates) if result is not None]
+
+	wheels = {}
+	for wheel, serial_number, motor in found:
+		if wheel in wheels:
+			for _, _, opened in found:
+				opened.bus.serial.close()
+			raise ValueError("Wheel %d is reported by %s and %s" % (wheel, wheels[wheel].bus.port, motor.bus.port))
+		wheels[wheel] = motor
+	if cache_path is not None:
+		known = dict((serial_number, wheel) for wheel, serial_number, _ in found if serial_number)
+		if any(stored.get(serial_number) != wheel for serial_number, wheel in known.items()):
+			stored.update(known)
+			_save_wheel_cache(cache_path, stored)
+	return wheels
+
+
+def _open_bus( device, timeout ):
+	from serial import Serial
+	return Bus(Serial(device, timeout=timeout))
+
+
+def _load_wheel_cache( path ):
+	try:
+		with open(path) as f:
+			return dict((str(k), int(v)) for k, v in json.load(f).items())
+	except (IOError, ValueError, AttributeError):
+		return {}
+
+
+def _save_wheel_cache( path, cache ):
+	with open(path, "w") as f:
+		json.dump(cache, f, indent=2, sort_keys=True)
@@ -0,0 +1,122 @@
+import itertools
+import queue
+import threading
+from concurrent.futures import Future
+from .commands import Command
+
+
+class Priority(object):
+	"""
+	Request classes for `Bus.submit`. Lower values are served first.
+	"""
+	EMERGENCY = 0
+	CONTROL = 1
+	NORMAL = 2
+	TELEMETRY = 3
+
+	@staticmethod
+	def default( command ):
+		return Priority.EMERGENCY if command == Command.MST else Priority.NORMAL
+
+
+class RequestExpired(Exception):
+	"""
+	Set on the future of a request whose deadline passed before it was sent.
+	"""
+
+	def __init__( self ):
+		super(RequestExpired, self).__init__("Request deadline expired before it was sent")
+
+
+class Request(object):
+	__slots__ = ("commands", "many", "priority", "deadline", "check", "future")
+
+	def __init__( self, commands, many, priority, deadline, check=True ):
+		self.commands = commands
+		self.many = many
+		self.priority = priority
+		self.deadline = deadline
+		self.check = check
+		self.future = Future()
+
+	@property
+	def module( self ):
+		"""
+		Address of the module the request is for (of the first command
+		for a batch).
+		"""
+		return self.commands[0][0] if self.many else self.commands[0]
+
+
+class RequestQueue(object):
+	"""
+	Priority queue of pending bus requests.
+
+	Within a priority, requests for different modules are interleaved
+	round-robin, so on a multi-drop bus one busy module cannot starve the
+	others. Requests for the same module keep their submission order.
+	"""
+
+	_STOP = float("inf")
+
+	def __init__( self ):
+		self._queue = queue.PriorityQueue()
+		self._sequence = itertools.count()
+		self._lock = threading.Lock()
+		# next free round per (priority, module) and the round being served per priority
+		self._rounds = {}
+		self._serving = {}
+
+	def put( self, request ):
+		key = (request.priority, request.module)
+		with self._lock:
+			turn = max(self._rounds.get(key, 0), self._serving.get(request.priority, 0))
+			self._rounds[key] = turn + 1
+			self._queue.put((request.priority, turn, next(self._sequence), request))
+		return request.future
+
+	def get( self ):
+		"""
+		Block until a request is available.
+
+		:return: The most urgent request, or None once `close` was called
+		         and everything queued before it has been served.
+		:rtype:  Request
+		"""
+		priority, turn, _, request = self._queue.get()
+		with self._lock:
+			self._serving[priority] = turn
+		return request
+
+	def close( self ):
+		self._queue.put((self._STOP, 0, next(self._sequence), None))
+
+
+class Worker(threading.Thread):
+	"""
+	Serves a `RequestQueue` by running each request through `transact`.
+	"""
+
+	def __init__( self, requests, transact, clock, name ):
+		super(Worker, self).__init__(name=name)
+		self.daemon = True
+		self.requests = requests
+		self.transact = transact
+		self.clock = clock
+
+	def run( self ):
+		while True:
+			request = self.requests.get()
+			if request is None:
+				return
+			if not request.future.set_running_or_notify_cancel():
+				continue
+			if request.deadline is not None and self.clock() > request.deadline:
+				request.future.set_exception(RequestExpired())
+				continue
+			try:
+				result = self.transact(request)
+			except Exception as e:
+				request.future.set_exception(e)
+			else:
+				request.future.set_result(result)
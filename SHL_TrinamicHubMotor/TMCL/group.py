@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MotorGroup(object):
+	"""
+	Fans a command out to several motors at once.
+
+	Every distinct bus gets its own persistent single-thread worker, so
+	calls to motors on different serial ports run in parallel while calls
+	sharing a port are still issued one after another. On a `CanBus`
+	every module gets its own worker instead. Results are returned
+	as a list in the same order as the motors passed to the constructor.
+	"""
+
+	def __init__( self, motors ):
+		"""
+		:param motors:
+			Motors to control together, typically one per bus
+		:type  motors: list of Motor
+		"""
+		self.motors = list(motors)
+		self._workers = {}
+		for motor in self.motors:
+			if self._key(motor) not in self._workers:
+				self._workers[self._key(motor)] = ThreadPoolExecutor(max_workers=1)
+		self.axis = GroupAxisParameterInterface(self)
+
+	def __len__( self ):
+		return len(self.motors)
+
+	def __iter__( self ):
+		return iter(self.motors)
+
+	def __enter__( self ):
+		return self
+
+	def __exit__( self, *exc ):
+		self.close()
+
+	def call( self, func, *args ):
+		"""
+		Run `func(motor, *per_motor_args)` for every motor in parallel.
+
+		Each entry of `args` is either a single value shared by all motors
+		or a list holding one value per motor.
+
+		:return: The results of `func`, ordered like `motors`
+		:rtype:  list
+		"""
+		futures = []
+		for i, motor in enumerate(self.motors):
+			motor_args = [arg[i] if isinstance(arg, (list, tuple)) else arg for arg in args]
+			futures.append(self._workers[self._key(motor)].submit(func, motor, *motor_args))
+		return [future.result() for future in futures]
+
+	def send( self, cmd, type, motorbank, value ):
+		"""
+		:rtype: list of Reply
+		"""
+		return self.call(lambda motor, value: motor.send(cmd, type, motorbank, value), value)
+
+	def stop( self ):
+		self.call(lambda motor: motor.stop())
+
+	def rotate_left( self, velocity ):
+		return self.call(lambda motor, velocity: motor.rotate_left(velocity), velocity)
+
+	def rotate_right( self, velocity ):
+		return self.call(lambda motor, velocity: motor.rotate_right(velocity), velocity)
+
+	def move_absolute( self, position ):
+		return self.call(lambda motor, position: motor.move_absolute(position), position)
+
+	def wait_until( self, condition, target=None, tolerance=0, timeout=None, min_interval=0.002, max_interval=0.1,
+			stop=None ):
+		"""
+		Wait for every motor at once, see `Motor.wait_until`.
+		Motors sharing a bus are polled concurrently too, so `target`
+		may be a list with one value per motor.
+
+		:return: Seconds until each motor's condition held, ordered like
+		         `motors`; None for the motors still waiting when `stop` held
+		:rtype:  list of float
+		"""
+		with ThreadPoolExecutor(max_workers=len(self.motors)) as pool:
+			futures = []
+			for i, motor in enumerate(self.motors):
+				motor_target = target[i] if isinstance(target, (list, tuple)) else target
+				futures.append(pool.submit(motor.wait_until, condition, motor_target, tolerance, timeout,
+					min_interval, max_interval, stop))
+			return [future.result() for future in futures]
+
+	@staticmethod
+	def _key( motor ):
+		# buses that allow one request in flight per module (CAN) get a
+		# worker per module instead of one per bus
+		if getattr(motor.bus, "concurrent_modules", False):
+			return (id(motor.bus), motor.module_id)
+		return id(motor.bus)
+
+	def close( self ):
+		"""
+		Shut down the per-port workers.
+		"""
+		for worker in self._workers.values():
+			worker.shutdown(wait=True)
+		self._workers = {}
+
+
+class GroupAxisParameterInterface(object):
+	def __init__( self, group ):
+		"""
+
+		:param group:
+		:type  group: MotorGroup
+		"""
+		self.group = group
+
+	def get( self, param ):
+		"""
+		:return: The parameter value of every motor
+		:rtype:  list of int
+		"""
+		return self.group.call(lambda motor: motor.axis.get(param))
+
+	def set( self, param, value ):
+		"""
+		:param value: One value for all motors or a list with one per motor
+		:rtype: list of int
+		"""
+		return self.group.call(lambda motor, value: motor.axis.set(param, value), value)
@@ -0,0 +1,212 @@
+import numpy as np
+
+
+# Raw telemetry parameters the derived channels are computed from
+POSITION = 1
+SPEED = 3
+CURRENT = 150
+VOLTAGE = 151
+TEMPERATURE = 152
+IIT_SUM = 27
+IIT_LIMIT = 26
+
+
+class Calibration(object):
+	"""
+	Constants that turn raw TMCM-1630 readings into physical units.
+
+	The defaults are those of the TMCM-1630 on its BB-1630 baseboard:
+	the driver NTC (R25 = 10k, B = 3434) sits in a divider that gives
+	R_NTC [kOhm] = ntc_divider / ADC - ntc_series.
+	"""
+
+	def __init__( self, ntc_b=3434.0, ntc_r25=10.0, ntc_divider=9011.2, ntc_series=2.2,
+			voltage_scale=0.1, current_scale=0.001, counts_per_rev=60.0, distance_per_rev=1.0 ):
+		"""
+		:param voltage_scale: Volts per unit of parameter 151
+		:type  voltage_scale: float
+
+		:param current_scale: Amperes per unit of parameter 150
+		:type  current_scale: float
+
+		:param counts_per_rev: Position counts per wheel revolution
+		:type  counts_per_rev: float
+
+		:param distance_per_rev:
+			Distance travelled per revolution, e.g. the wheel
+			circumference. The default of 1 gives distances in revolutions.
+		:type  distance_per_rev: float
+		"""
+		self.ntc_b = ntc_b
+		self.ntc_r25 = ntc_r25
+		self.ntc_divider = ntc_divider
+		self.ntc_series = ntc_series
+		self.voltage_scale = voltage_scale
+		self.current_scale = current_scale
+		self.counts_per_rev = counts_per_rev
+		self.distance_per_rev = distance_per_rev
+
+
+DEFAULT_CALIBRATION = Calibration()
+
+_T25 = 298.16
+_KELVIN = 273.16
+_ADC_RANGE = 4096
+
+
+def board_temperature( adc, calibration=DEFAULT_CALIBRATION ):
+	"""
+	Driver temperature [C] from raw parameter 152 readings, with the NTC
+	B equation. Readings that give no valid resistance become NaN.
+
+	Integer readings are looked up in a table of all 12-bit ADC values,
+	which is much cheaper than the logarithm per sample.
+
+	:rtype: numpy.ndarray
+	"""
+	adc = np.asarray(adc)
+	if adc.dtype.kind in "iu" and adc.size:
+		table = _temperature_table(calibration)
+		if adc.min() >= 0 and adc.max() < len(table):
+			return table[adc]
+	return _ntc_temperature(adc.astype(np.float64), calibration)
+
+
+def _ntc_temperature( adc, calibration ):
+	with np.errstate(divide="ignore", invalid="ignore"):
+		rntc = calibration.ntc_divider / adc - calibration.ntc_series
+		rntc = np.where((rntc > 0) & np.isfinite(rntc), rntc, np.nan)
+		return calibration.ntc_b * _T25 / (calibration.ntc_b + np.log(rntc / calibration.ntc_r25) * _T25) - _KELVIN
+
+
+def _temperature_table( calibration ):
+	key = (calibration.ntc_b, calibration.ntc_r25, calibration.ntc_divider, calibration.ntc_series)
+	cached = getattr(calibration, "_table", None)
+	if cached is None or cached[0] != key:
+		cached = (key, _ntc_temperature(np.arange(_ADC_RANGE, dtype=np.float64), calibration))
+		calibration._table = cached
+	return cached[1]
+
+
+def supply_voltage( raw, calibration=DEFAULT_CALIBRATION ):
+	"""
+	:return: Supply voltage [V] from parameter 151
+	:rtype:  numpy.ndarray
+	"""
+	return np.multiply(raw, calibration.voltage_scale, dtype=np.float64)
+
+
+def motor_current( raw, calibration=DEFAULT_CALIBRATION ):
+	"""
+	:return: Motor current [A] from parameter 150
+	:rtype:  numpy.ndarray
+	"""
+	return np.multiply(raw, calibration.current_scale, dtype=np.float64)
+
+
+def electrical_power( current, voltage, calibration=DEFAULT_CALIBRATION ):
+	"""
+	:return: Power [W] drawn by the motor, from raw parameters 150 and 151
+	:rtype:  numpy.ndarray
+	"""
+	power = np.multiply(current, voltage, dtype=np.float64)
+	power *= calibration.current_scale * calibration.voltage_scale
+	return power
+
+
+def iit_headroom( iit_sum, iit_limit ):
+	"""
+	Fraction of the IIT limit still available before the module cuts the
+	motor current: 1 when cold, 0 at the limit. NaN where no limit is set.
+
+	:rtype: numpy.ndarray
+	"""
+	limit = np.where(np.asarray(iit_limit) > 0, iit_limit, np.nan)
+	return 1.0 - np.divide(iit_sum, limit, dtype=np.float64)
+
+
+def distance( position, calibration=DEFAULT_CALIBRATION, start=None ):
+	"""
+	Distance travelled since `start` (default: the first sample) from
+	parameter 1 position counts, along the first axis.
+
+	:rtype: numpy.ndarray
+	"""
+	position = np.asarray(position)
+	if start is None:
+		start = position[:1]
+	travelled = np.subtract(position, start, dtype=np.float64)
+	travelled *= calibration.distance_per_rev / calibration.counts_per_rev
+	return travelled
+
+
+def linear_speed( rpm, calibration=DEFAULT_CALIBRATION ):
+	"""
+	:return: Speed in distance units per second from parameter 3 [rpm]
+	:rtype:  numpy.ndarray
+	"""
+	return np.multiply(rpm, calibration.distance_per_rev / 60.0, dtype=np.float64)
+
+
+def derive( block, calibration=DEFAULT_CALIBRATION ):
+	"""
+	Compute every derived channel the raw parameters in `block` allow.
+
+	:param block:
+		Raw telemetry keyed by axis parameter number, each an array of
+		samples (N,) or samples per motor (N, motors). Arrays of one block
+		must broadcast against each other.
+	:type  block: dict
+
+	:return:
+		Any of "temperature" [C], "voltage" [V], "current" [A], "power" [W],
+		"iit_headroom", "distance" and "speed" (per second)
+	:rtype: dict of numpy.ndarray
+	"""
+	channels = {}
+	if TEMPERATURE in block:
+		channels["temperature"] = board_temperature(block[TEMPERATURE], calibration)
+	if VOLTAGE in block:
+		channels["voltage"] = supply_voltage(block[VOLTAGE], calibration)
+	if CURRENT in block:
+		channels["current"] = motor_current(block[CURRENT], calibration)
+	if CURRENT in block and VOLTAGE in block:
+		channels["power"] = channels["current"] * channels["voltage"]
+	if IIT_SUM in block and IIT_LIMIT in block:
+		channels["iit_headroom"] = iit_headroom(block[IIT_SUM], block[IIT_LIMIT])
+	if POSITION in block:
+		channels["distance"] = distance(block[POSITION], calibration)
+	if SPEED in block:
+		channels["speed"] = linear_speed(block[SPEED], calibration)
+	return channels
+
+
+def align( series, times=None ):
+	"""
+	Resample parameters that were polled at different times onto one
+	time base, e.g. `TelemetrySampler.snapshot` results or one
+	(port, module, axis) of `replay.series`, so they can go to `derive`.
+
+	:param series: {param: (times, values)}
+	:type  series: dict
+
+	:param times:
+		Time base, defaults to the times of the most often sampled parameter
+	:type  times: numpy.ndarray
+
+	:return: (times, {param: values at times}), values held from the
+	         latest sample at or before each time, or the first one
+	:rtype:  tuple
+	"""
+	if times is None:
+		times = max(series.values(), key=lambda item: len(item[0]))[0]
+	times = np.asarray(times, dtype=np.float64)
+	block = {}
+	for param, (sample_times, values) in series.items():
+		values = np.asarray(values)
+		if not len(values):
+			block[param] = np.full(len(times), np.nan)
+			continue
+		index = np.clip(np.searchsorted(sample_times, times, side="right") - 1, 0, len(values) - 1)
+		block[param] = values[index]
+	return times, block
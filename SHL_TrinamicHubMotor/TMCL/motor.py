@@ -1,12 +1,20 @@
+import time
+from .assembler import assemble
 from .commands import Command
+from .reply import Reply
+from .snapshot import GLOBAL_BANKS, restore_snapshot, take_snapshot
 
 
 class Module(object):
 	"""
 	Represents a single TMCM module present on the bus.
 	"""
+	PROGRAM_STOPPED = 0
+	PROGRAM_RUNNING = 1
+	PROGRAM_STEPPING = 2
+	PROGRAM_RESET = 3
 
-	def __init__( self, bus, address=1 ):
+	def __init__( self, bus, address=1, cache=None ):
 		"""        
 		:param bus: 
 			A Bus instance that is connected to one or more 
@@ -17,9 +25,14 @@ class Module(object):
 			Module address. This defaults to 1
 		:type  address: int
 		
+		:param cache:
+			Optional parameter cache handed to every motor of this module
+		:type  cache: TMCL.cache.ParameterCache
+
 		"""
 		self.bus = bus
 		self.address = address
+		self.cache = cache
 
 
 	def get_motor( self, axis=0 ):
@@ -34,7 +47,84 @@ class Module(object):
 		:return: An interface to the desired axis/motor
 		:rtype:  Motor
 		"""
-		return Motor(self.bus, self.address, axis)
+		return Motor(self.bus, self.address, axis, self.cache)
+
+	def send( self, cmd, type, motorbank, value ):
+		return self.bus.send(self.address, cmd, type, motorbank, value)
+
+	def download_program( self, program, address=0 ):
+		"""
+		Store a TMCL program in the module's memory.
+		The instructions are streamed in one batch between
+		START_DOWNLOAD_MODE and QUIT_DOWNLOAD_MODE.
+
+		:param program:
+			TMCL source (see `TMCL.assembler.assemble`) or a list of
+			(command, type, motorbank, value) tuples
+		:type  program: str or list
+
+		:param address:
+			Program memory address to load the first instruction to
+		:type  address: int
+
+		:return: Number of instructions downloaded
+		:rtype:  int
+		"""
+		if isinstance(program, str):
+			program = assemble(program)
+		self.send(Command.START_DOWNLOAD_MODE, 0, 0, address)
+		try:
+			with self.bus.downloading(self.address):
+				self.bus.send_many([(self.address,) + tuple(instruction) for instruction in program])
+		finally:
+			self.send(Command.QUIT_DOWNLOAD_MODE, 0, 0, 0)
+		return len(program)
+
+	def run_program( self, address=None ):
+		"""
+		Start the stored program, either where it stopped or at `address`.
+		"""
+		if address is None:
+			reply = self.send(Command.RUN_APPLICATION, 0, 0, 0)
+		else:
+			reply = self.send(Command.RUN_APPLICATION, 1, 0, address)
+		return reply.status
+
+	def stop_program( self ):
+		reply = self.send(Command.STOP_APPLICATION, 0, 0, 0)
+		return reply.status
+
+	def reset_program( self ):
+		reply = self.send(Command.RESET_APPLICATION, 0, 0, 0)
+		return reply.status
+
+	def program_status( self ):
+		"""
+		:return: One of PROGRAM_STOPPED, PROGRAM_RUNNING, PROGRAM_STEPPING
+		         or PROGRAM_RESET
+		:rtype:  int
+		"""
+		reply = self.send(Command.GET_APPLICATION_STATUS, 0, 0, 0)
+		return reply.value
+
+	def snapshot( self, axes=(0,), banks=None ):
+		"""
+		Read every axis parameter, global parameter and user variable the
+		module answers for, see `TMCL.snapshot.take_snapshot`.
+
+		:rtype: TMCL.profile.Profile
+		"""
+		return take_snapshot(self, axes, GLOBAL_BANKS if banks is None else banks)
+
+	def restore( self, snapshot, only_changed=True, persist=False ):
+		"""
+		Write a snapshot taken with `snapshot` to this module, see
+		`TMCL.snapshot.restore_snapshot`.
+
+		:return: (written, rejected), see `restore_snapshot`
+		:rtype:  tuple
+		"""
+		return restore_snapshot(self, snapshot, only_changed, persist)
 
 
 
@@ -43,14 +133,43 @@ class Motor(object):
 	RFS_STOP = 1
 	RFS_STATUS = 2
 
-	def __init__( self, bus, address=1, axis=0 ):
+	def __init__( self, bus, address=1, axis=0, cache=None ):
 		self.bus = bus
 		self.module_id = address
 		self.motor_id = axis
+		self.cache = cache
 		self.axis = AxisParameterInterface(self)
 
 	def send( self, cmd, type, motorbank, value ):
-		return self.bus.send(self.module_id, cmd, type, motorbank, value)
+		reply = self.bus.send(self.module_id, cmd, type, motorbank, value)
+		if self.cache is not None:
+			self.cache.observe(self.module_id, cmd, type, motorbank, value, reply, self.bus)
+		return reply
+
+	def send_many( self, commands, priority=None, deadline=None ):
+		"""
+		Send a batch of (cmd, type, motorbank, value) tuples to this
+		module in one round trip, see `Bus.send_many`.
+
+		:rtype: list of Reply
+		"""
+		commands = list(commands)
+		replies = self.bus.send_many([(self.module_id,) + tuple(command) for command in commands],
+			priority, deadline)
+		if self.cache is not None:
+			for (cmd, type, motorbank, value), reply in zip(commands, replies):
+				self.cache.observe(self.module_id, cmd, type, motorbank, value, reply, self.bus)
+		return replies
+
+	def invalidate_cache( self, param=None ):
+		"""
+		Drop cached values of this axis so the next read goes to the device.
+
+		:param param: Single parameter to drop, or None for all of them
+		:type  param: int
+		"""
+		if self.cache is not None:
+			self.cache.invalidate(self.module_id, self.motor_id, param, self.bus)
 
 	def stop( self ):
 		self.send(Command.MST, 0, self.motor_id, 0)
@@ -86,6 +205,77 @@ class Motor(object):
 		reply = self.send(Command.RFS, rfs_type, self.motor_id, 99)
 		return reply.status
 
+	def wait_until( self, condition, target=None, tolerance=0, timeout=None, min_interval=0.002, max_interval=0.1,
+			stop=None ):
+		"""
+		Block until an axis parameter reaches a value or a predicate holds.
+
+		With a parameter and a `target`, the interval between polls is
+		half the time the axis needs to cover the remaining distance at
+		its measured rate of change, so polling is sparse while the axis
+		is far away and tight close to the target.
+
+		:param condition:
+			Axis parameter number, or a callable taking this motor that
+			returns True once done (polled every `min_interval`)
+		:type  condition: int or callable
+
+		:param target:
+			Value the parameter has to reach. Without one the parameter is
+			treated as a flag, e.g. 8 (target position reached).
+		:type  target: int
+
+		:param tolerance:
+			Largest accepted distance between parameter and `target`
+		:type  tolerance: int
+
+		:param timeout:
+			Seconds to wait, or None to wait forever
+		:type  timeout: float
+
+		:param stop:
+			Checked before every poll; once it returns True the wait ends,
+			e.g. when a watchdog tripped
+		:type  stop: callable
+
+		:return: Seconds until the condition held, or None if `stop` ended the wait
+		:rtype:  float
+		"""
+		start = time.monotonic()
+		last = None
+		while True:
+			if stop is not None and stop():
+				return None
+			if callable(condition):
+				done, delay = condition(self), min_interval
+			else:
+				value = self.axis.get(condition, force=True)
+				done, delay = self._wait_step(value, target, tolerance, last, max_interval)
+				last = (time.monotonic(), value)
+			now = time.monotonic()
+			if done:
+				return now - start
+			if timeout is not None:
+				if now - start >= timeout:
+					raise IOError("Timeout waiting for motor %d on module %d" % (self.motor_id, self.module_id))
+				delay = min(delay, start + timeout - now)
+			time.sleep(max(min_interval, min(delay, max_interval)))
+
+	@staticmethod
+	def _wait_step( value, target, tolerance, last, max_interval ):
+		if target is None:
+			return value != 0, max_interval
+		distance = abs(target - value)
+		if distance <= tolerance:
+			return True, 0
+		if last is None:
+			return False, 0
+		elapsed = time.monotonic() - last[0]
+		rate = abs(value - last[1]) / elapsed if elapsed > 0 else 0
+		if rate == 0:
+			return False, max_interval
+		return False, (distance - tolerance) / rate / 2
+
 
 class AxisParameterInterface(object):
 	def __init__( self, motor ):
@@ -96,11 +286,34 @@ class AxisParameterInterface(object):
 		"""
 		self.motor = motor
 
-	def get( self, param ):
+	def get( self, param, force=False ):
+		"""
+		Read an axis parameter. With a cache attached, non-volatile
+		parameters are answered locally once their value is known.
+
+		:param force: Always query the device
+		:type  force: bool
+		"""
+		cache = self.motor.cache
+		if cache is not None and not force:
+			value = cache.lookup(self.motor.module_id, self.motor.motor_id, param, self.motor.bus)
+			if value is not None:
+				return value
 		reply = self.motor.send(Command.GAP, param, self.motor.motor_id, 0)
 		return reply.value
 
-	def set( self, param, value ):
+	def set( self, param, value, force=False ):
+		"""
+		Write an axis parameter. With a cache attached, writing the value
+		the parameter already holds is skipped.
+
+		:param force: Always send the SAP to the device
+		:type  force: bool
+		"""
+		cache = self.motor.cache
+		if cache is not None and not force:
+			if cache.lookup(self.motor.module_id, self.motor.motor_id, param, self.motor.bus) == value:
+				return Reply.Status.SUCCESS
 		reply = self.motor.send(Command.SAP, param, self.motor.motor_id, value)
 		return reply.status
 
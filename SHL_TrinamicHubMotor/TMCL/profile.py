@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from .cache import VOLATILE_PARAMETERS, MOTION_PARAMETERS
+from .commands import Command
+from .group import MotorGroup
+from .script import ScriptError, parse_script
+
+
+class Profile(object):
+	"""
+	A set of axis and global parameter values to configure a module with.
+
+	`axis` maps (parameter, axis) to a value and `globals` maps
+	(parameter, bank) to a value. Both keep the order the values were
+	defined in, which is also the order they are written in.
+	"""
+
+	def __init__( self, axis=None, globals=None ):
+		self.axis = OrderedDict(axis or ())
+		self.globals = OrderedDict(globals or ())
+
+	def __len__( self ):
+		return len(self.axis) + len(self.globals)
+
+	def __repr__( self ):
+		return "Profile(axis=%r, globals=%r)" % (dict(self.axis), dict(self.globals))
+
+	@classmethod
+	def from_script( cls, instructions ):
+		"""
+		Build a profile from the configuration part of a direct-mode script.
+
+		SAP and SGP lines are collected up to the first line that starts
+		motion or touches a measured value (MST, WAIT, MVP, ROR, ROL, RFS,
+		STOP, or an SAP of a motion or volatile parameter such as
+		"SAP 1, 0, 0"). Later values of the same parameter win.
+
+		:param instructions: Script source or output of `parse_script`
+		:type  instructions: str or list of Instruction
+
+		:rtype: Profile
+		"""
+		if isinstance(instructions, str):
+			instructions = parse_script(instructions)
+		profile = cls()
+		for instruction in instructions:
+			if instruction.mnemonic not in ("SAP", "SGP"):
+				break
+			if len(instruction.args) != 3 or not all(isinstance(arg, int) for arg in instruction.args):
+				raise ScriptError("%s expects three numeric arguments" % instruction.mnemonic, instruction.line)
+			param, bank, value = instruction.args
+			if instruction.mnemonic == "SGP":
+				profile.globals[(param, bank)] = value
+			elif param in VOLATILE_PARAMETERS or param in MOTION_PARAMETERS:
+				break
+			else:
+				profile.axis[(param, bank)] = value
+		return profile
+
+	def reads( self ):
+		"""
+		:return: GAP/GGP commands reading every parameter of the profile
+		:rtype:  list of tuple
+		"""
+		return ([(Command.GAP, param, axis, 0) for param, axis in self.axis] +
+			[(Command.GGP, param, bank, 0) for param, bank in self.globals])
+
+	def writes( self, current=None ):
+		"""
+		:param current:
+			Values returned for `reads()`. Parameters that already hold the
+			profile value are left out. None writes everything.
+		:type  current: list of int
+
+		:return: SAP/SGP commands that bring a module to this profile
+		:rtype:  list of tuple
+		"""
+		writes = ([(Command.SAP, param, axis, value) for (param, axis), value in self.axis.items()] +
+			[(Command.SGP, param, bank, value) for (param, bank), value in self.globals.items()])
+		if current is None:
+			return writes
+		return [write for write, value in zip(writes, current) if write[3] != value]
+
+
+def load_profile( path ):
+	"""
+	Build a Profile from a .tmc script file, see `Profile.from_script`.
+
+	:rtype: Profile
+	"""
+	with open(path) as f:
+		return Profile.from_script(f.read())
+
+
+def apply_profile( motors, profile ):
+	"""
+	Bring every motor's module to `profile`, sending only what differs.
+
+	Each module's current values are read in one batch, compared with the
+	profile and the changed parameters written in a second batch. Modules
+	on different buses are configured in parallel.
+
+	:param motors: Motors to configure
+	:type  motors: MotorGroup or list of Motor
+
+	:param profile: Target configuration
+	:type  profile: Profile
+
+	:return: The SAP/SGP commands that were sent, one list per motor
+	:rtype:  list of list
+	"""
+	if isinstance(motors, MotorGroup):
+		return motors.call(_apply, profile)
+	with MotorGroup(motors) as group:
+		return group.call(_apply, profile)
+
+
+def _apply( motor, profile ):
+	current = [reply.value for reply in motor.send_many(profile.reads())]
+	writes = profile.writes(current)
+	motor.send_many(writes)
+	return writes
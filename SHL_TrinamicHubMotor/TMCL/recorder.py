@@ -0,0 +1,224 @@
+import collections
+import mmap
+import os
+import struct
+import threading
+import time
+from .bus import _MSG, _REPLY, checksum
+from .commands import Command
+from .reply import Reply
+
+
+# Every record is 32 bytes: wall clock time, kind, port index, round trip
+# in microseconds, then the raw request and reply frames
+RECORD = struct.Struct("<dBBI9s9s")
+RECORD_SIZE = RECORD.size
+
+MAGIC = b"TMCLREC1"
+
+# Record kinds
+HEADER = 0      # request field holds MAGIC, written once at the start of a file
+PORT = 1        # request + reply fields hold the port name for `port` from here on
+FRAME = 2       # request and reply as seen on the wire
+TIMEOUT = 3     # request without (complete) reply
+SAMPLE = 4      # telemetry sample, stored as a GAP request and its reply
+
+Record = collections.namedtuple("Record", "time kind port elapsed request reply")
+
+_EMPTY = bytes(_REPLY.size)
+_NAME_LENGTH = 2 * _MSG.size
+
+
+class Recorder(object):
+	"""
+	Append-only log of TMCL traffic with fixed 32-byte records.
+
+	`attach` a bus to log every request/reply pair through its
+	`post_hooks`; `TelemetrySampler` logs its samples with `sample`.
+	Records are buffered by the file object, so logging a frame costs a
+	struct pack and a buffered write.
+	"""
+
+	def __init__( self, path, buffering=65536 ):
+		"""
+		:param path: Log file, appended to if it exists
+		:type  path: str
+
+		:param buffering: Write buffer size in bytes
+		:type  buffering: int
+		"""
+		self.path = path
+		self._file = open(path, "ab", buffering)
+		self._buf = bytearray(RECORD_SIZE)
+		self._ports = {}
+		self._hooks = []
+		self._lock = threading.Lock()
+		if self._file.tell() == 0:
+			self._write(HEADER, 0, 0, MAGIC, _EMPTY)
+
+	def __enter__( self ):
+		return self
+
+	def __exit__( self, *exc ):
+		self.close()
+
+	def attach( self, bus ):
+		"""
+		Log all traffic of `bus` from now on.
+		"""
+		port = self._port(bus.port)
+		hook = lambda request, reply, elapsed, error: self._frame(port, request, reply, elapsed)
+		bus.post_hooks.append(hook)
+		self._hooks.append((bus, hook))
+		return hook
+
+	def detach( self, bus ):
+		"""
+		Stop logging the traffic of `bus`.
+		"""
+		for attached, hook in [item for item in self._hooks if item[0] is bus]:
+			self._hooks.remove((attached, hook))
+			if hook in bus.post_hooks:
+				bus.post_hooks.remove(hook)
+
+	def sample( self, bus, module, axis, param, value ):
+		"""
+		Log a telemetry sample of axis parameter `param`.
+		"""
+		request = _MSG.pack(module, Command.GAP, param, axis, 0, checksum(module, Command.GAP, param, axis, 0))
+		reply = _REPLY.pack(2, module, Reply.Status.SUCCESS, Command.GAP, value,
+			checksum(2, module, Reply.Status.SUCCESS, Command.GAP, value))
+		port = self._port(bus.port)
+		with self._lock:
+			self._write(SAMPLE, port, 0, request, reply)
+
+	def flush( self ):
+		with self._lock:
+			self._file.flush()
+
+	def close( self ):
+		"""
+		Detach from all buses and close the log. Frames and samples that
+		still arrive afterwards are dropped.
+		"""
+		while self._hooks:
+			self.detach(self._hooks[0][0])
+		with self._lock:
+			self._file.close()
+
+	def _frame( self, port, request, reply, elapsed ):
+		with self._lock:
+			if reply is None:
+				self._write(TIMEOUT, port, elapsed, request, _EMPTY)
+			else:
+				self._write(FRAME, port, elapsed, request, reply)
+
+	def _port( self, name ):
+		name = str(name)
+		with self._lock:
+			if name not in self._ports:
+				if len(self._ports) > 255:
+					raise ValueError("A recording holds at most 256 ports")
+				self._ports[name] = len(self._ports)
+				encoded = name.encode("utf-8")[-_NAME_LENGTH:].ljust(_NAME_LENGTH, b"\0")
+				self._write(PORT, self._ports[name], 0, encoded[:_MSG.size], encoded[_MSG.size:])
+			return self._ports[name]
+
+	def _write( self, kind, port, elapsed, request, reply ):
+		if self._file.closed:
+			return
+		RECORD.pack_into(self._buf, 0, time.time(), kind, port, min(int(elapsed * 1e6), 0xFFFFFFFF),
+			bytes(request), bytes(reply))
+		self._file.write(self._buf)
+
+
+def read_records( path ):
+	"""
+	Iterate over the records of a log through a memory map.
+
+	:rtype: iterator of Record
+	"""
+	with open(path, "rb") as f:
+		if os.fstat(f.fileno()).st_size < RECORD_SIZE:
+			return
+		with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+			_check_header(data)
+			for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+				timestamp, kind, port, elapsed, request, reply = RECORD.unpack_from(data, offset)
+				yield Record(timestamp, kind, port, elapsed * 1e-6, request, reply)
+
+
+def port_name( record ):
+	"""
+	:return: The port name carried by a PORT record
+	:rtype:  str
+	"""
+	return (record.request + record.reply).rstrip(b"\0").decode("utf-8", "replace")
+
+
+def _check_header( data ):
+	header = RECORD.unpack_from(data, 0)
+	if header[1] != HEADER or header[4] != MAGIC.ljust(_MSG.size, b"\0"):
+		raise ValueError("Not a TMCL recording")
+
+
+class ReplaySerial(object):
+	"""
+	Serial port stand-in that answers with the replies of a recording.
+
+	Each written request is matched with the next recorded request on
+	`port` that has the same bytes and its recorded reply is returned by
+	the following reads, so `Bus(ReplaySerial(path, port))` re-runs a
+	session offline. Requests without a recorded reply time out.
+	"""
+
+	def __init__( self, path, port=None, timeout=None ):
+		"""
+		:param port:
+			Name of the recorded port to replay, defaults to the first one
+		:type  port: str
+		"""
+		self.port = port
+		self.timeout = timeout
+		self._pairs = []
+		self._cursor = 0
+		self._pending = bytearray()
+		names = {}
+		for record in read_records(path):
+			if record.kind == PORT:
+				names[record.port] = port_name(record)
+				if self.port is None:
+					self.port = names[record.port]
+			elif record.kind in (FRAME, TIMEOUT) and names.get(record.port) == self.port:
+				self._pairs.append((record.request, record.reply if record.kind == FRAME else None))
+
+	def write( self, data ):
+		data = bytes(data)
+		for offset in range(0, len(data) - _MSG.size + 1, _MSG.size):
+			self._answer(data[offset:offset + _MSG.size])
+		return len(data)
+
+	def readinto( self, buf ):
+		n = min(len(buf), len(self._pending))
+		buf[:n] = self._pending[:n]
+		del self._pending[:n]
+		return n
+
+	def read( self, size=1 ):
+		data = bytes(self._pending[:size])
+		del self._pending[:size]
+		return data
+
+	def reset_input_buffer( self ):
+		del self._pending[:]
+
+	def close( self ):
+		pass
+
+	def _answer( self, request ):
+		for index in range(self._cursor, len(self._pairs)):
+			if self._pairs[index][0] == request:
+				self._cursor = index + 1
+				if self._pairs[index][1] is not None:
+					self._pending.extend(self._pairs[index][1])
+				return
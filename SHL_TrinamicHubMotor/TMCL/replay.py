@@ -0,0 +1,136 @@
+""" Turn a `TMCL.recorder` log back into NumPy arrays.
+
+    python -m TMCL.replay run.tmlog --npz run.npz
+"""
+import argparse
+import os
+import numpy as np
+from .commands import Command
+from .recorder import FRAME, HEADER, MAGIC, PORT, RECORD_SIZE, SAMPLE, TIMEOUT
+from .reply import Reply
+
+
+# Layout of `recorder.RECORD` with the frames split into their fields
+RECORD_DTYPE = np.dtype([
+	("time", "<f8"), ("kind", "u1"), ("port", "u1"), ("elapsed_us", "<u4"),
+	("address", "u1"), ("command", "u1"), ("type", "u1"), ("bank", "u1"),
+	("request_value", ">i4"), ("request_checksum", "u1"),
+	("reply_address", "u1"), ("module", "u1"), ("status", "u1"), ("reply_command", "u1"),
+	("value", ">i4"), ("reply_checksum", "u1"),
+])
+assert RECORD_DTYPE.itemsize == RECORD_SIZE
+
+
+def load_records( path ):
+	"""
+	Memory-map a log as a structured array of RECORD_DTYPE.
+	A partly written record at the end of the file is ignored.
+
+	:rtype: numpy.ndarray
+	"""
+	count = os.path.getsize(path) // RECORD_SIZE
+	if count == 0:
+		return np.zeros(0, dtype=RECORD_DTYPE)
+	records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+	if records[0]["kind"] != HEADER or records[:1].view("u1")[14:14 + len(MAGIC)].tobytes() != MAGIC:
+		raise ValueError("Not a TMCL recording")
+	return records
+
+
+def port_names( records ):
+	"""
+	Resolve the port index of every record to a port name.
+
+	:return: (names, index) with `index[i]` the position of record i's
+	         port in `names`, or -1 for records before their PORT record
+	:rtype:  tuple of (list of str, numpy.ndarray)
+	"""
+	names = []
+	index = np.full(len(records), -1, dtype=np.int16)
+	declared = np.flatnonzero(records["kind"] == PORT)
+	raw = records.view("u1").reshape(-1, RECORD_SIZE)
+	for i, position in enumerate(declared):
+		port = records["port"][position]
+		name = raw[position, 14:].tobytes().rstrip(b"\0").decode("utf-8", "replace")
+		if name not in names:
+			names.append(name)
+		# a PORT record names its index until the index is declared again
+		later = declared[i + 1:]
+		later = later[records["port"][later] == port]
+		end = later[0] if len(later) else len(records)
+		segment = slice(position + 1, end)
+		index[segment][records["port"][segment] == port] = names.index(name)
+	return names, index
+
+
+def series( records, kinds=(FRAME, SAMPLE) ):
+	"""
+	Axis parameter values read with GAP, one time series per
+	(port, module, axis, parameter).
+
+	:param kinds: Record kinds to include
+	:type  kinds: tuple
+
+	:return: {(port name, module, axis, param): (times, values)}
+	:rtype:  dict
+	"""
+	names, ports = port_names(records)
+	mask = (np.isin(records["kind"], kinds) & (records["command"] == Command.GAP) &
+		(records["status"] == Reply.Status.SUCCESS) & (ports >= 0))
+	selected = records[mask]
+	keys = (ports[mask].astype(np.int64) << 24 | selected["address"].astype(np.int64) << 16 |
+		selected["bank"].astype(np.int64) << 8 | selected["type"].astype(np.int64))
+	order = np.argsort(keys, kind="stable")
+	unique, starts = np.unique(keys[order], return_index=True)
+	result = {}
+	for key, chunk in zip(unique, np.split(order, starts[1:])):
+		key = int(key)
+		name = (names[key >> 24], (key >> 16) & 0xFF, (key >> 8) & 0xFF, key & 0xFF)
+		result[name] = (selected["time"][chunk], selected["value"][chunk].astype(np.int32))
+	return result
+
+
+def summary( records ):
+	"""
+	:return: Frame, timeout and error counts and mean round trip per port
+	:rtype:  dict
+	"""
+	names, ports = port_names(records)
+	result = {}
+	for i, name in enumerate(names):
+		own = records[ports == i]
+		frames = own[own["kind"] == FRAME]
+		result[name] = {
+			"frames": len(frames),
+			"timeouts": int(np.count_nonzero(own["kind"] == TIMEOUT)),
+			"samples": int(np.count_nonzero(own["kind"] == SAMPLE)),
+			"errors": int(np.count_nonzero(frames["status"] < Reply.Status.SUCCESS)),
+			"mean_round_trip_us": float(frames["elapsed_us"].mean()) if len(frames) else None,
+		}
+	return result
+
+
+def main( argv=None ):
+	parser = argparse.ArgumentParser(description="Summarise a TMCL recording and export its time series")
+	parser.add_argument("path", help="log written by TMCL.recorder.Recorder")
+	parser.add_argument("--npz", help="save every (port, module, axis, parameter) series to this .npz file")
+	args = parser.parse_args(argv)
+
+	records = load_records(args.path)
+	print("%d records" % len(records))
+	for name, counts in summary(records).items():
+		print("%s: %s" % (name, counts))
+	data = series(records)
+	for (port, module, axis, param), (times, values) in sorted(data.items()):
+		print("%s module %d axis %d parameter %d: %d values" % (port, module, axis, param, len(values)))
+	if args.npz:
+		arrays = {}
+		for (port, module, axis, param), (times, values) in data.items():
+			prefix = "%s_m%d_a%d_p%d" % (port.strip("/").replace("/", "_"), module, axis, param)
+			arrays[prefix + "_time"] = times
+			arrays[prefix + "_value"] = values
+		np.savez(args.npz, **arrays)
+
+
+if __name__ == "__main__":
+	main()
@@ -4,7 +4,19 @@ class TrinamicException(Exception):
 		self.reply = reply
 
 
+class ChecksumError(TrinamicException):
+	"""
+	Raised when the checksum of a reply frame does not match its contents.
+	"""
+
+	def __init__( self, reply ):
+		super(TrinamicException, self).__init__("Incorrect reply checksum")
+		self.reply = reply
+
+
 class Reply(object):
+	__slots__ = ("reply_address", "module_address", "status", "command", "value", "checksum")
+
 	def __init__( self, reply_struct ):
 		self.reply_address = reply_struct[0]
 		self.module_address = reply_struct[1]
@@ -13,6 +25,10 @@ class Reply(object):
 		self.value = reply_struct[4]
 		self.checksum = reply_struct[5]
 
+	def __repr__( self ):
+		return "Reply(module=%d, status=%d, command=%d, value=%d)" % (
+			self.module_address, self.status, self.command, self.value)
+
 
 	class Status(object):
 		SUCCESS = 100
@@ -0,0 +1,70 @@
+from collections import namedtuple
+
+
+# One parsed line of a TMCL-IDE script: mnemonic, argument list and
+# 1-based source line number. Numeric arguments are ints, symbolic ones
+# (e.g. the POS in "WAIT POS, 0, 0") are upper-case strings. A label
+# definition such as "Loop:" is returned as mnemonic "LABEL" with the
+# upper-cased label name as its only argument.
+Instruction = namedtuple("Instruction", "mnemonic args line")
+
+
+class ScriptError(Exception):
+	def __init__( self, message, line=None ):
+		if line is not None:
+			message = "line %d: %s" % (line, message)
+		super(ScriptError, self).__init__(message)
+		self.line = line
+
+
+def parse_script( text ):
+	"""
+	Parse a TMCL-IDE direct-mode script such as position_mode_script.tmc.
+
+	`//` comments and blank lines are ignored. Every other line is one
+	instruction, e.g. "SAP 159, 0, 6" or "WAIT POS, 0, 5730", optionally
+	preceded by a label ("Loop: MVP ABS, 0, 0").
+
+	:param text: Script source
+	:type  text: str
+
+	:rtype: list of Instruction
+	"""
+	instructions = []
+	for number, line in enumerate(text.splitlines(), 1):
+		line = line.split("//", 1)[0].strip()
+		if not line:
+			continue
+		parts = line.split(None, 1)
+		if parts[0].endswith(":"):
+			instructions.append(Instruction("LABEL", [parts[0][:-1].upper()], number))
+			if len(parts) == 1:
+				continue
+			parts = parts[1].split(None, 1)
+		mnemonic = parts[0].upper()
+		args = []
+		if len(parts) > 1:
+			args = [_parse_argument(arg.strip(), number) for arg in parts[1].split(",")]
+		instructions.append(Instruction(mnemonic, args, number))
+	return instructions
+
+
+def load_script( path ):
+	"""
+	Read and parse a .tmc script file.
+
+	:rtype: list of Instruction
+	"""
+	with open(path) as f:
+		return parse_script(f.read())
+
+
+def _parse_argument( arg, line ):
+	if not arg:
+		raise ScriptError("empty argument", line)
+	for base in (0, 10):
+		try:
+			return int(arg, base)
+		except ValueError:
+			pass
+	return arg.upper()
@@ -0,0 +1,623 @@
+import heapq
+import os
+import pty
+import random
+import select
+import socket
+import struct
+import threading
+import time
+import tty
+from .bus import MSG_STRUCTURE, MSG_STRUCTURE_CAN, REPLY_LENGTH, REPLY_LENGTH_CAN, REPLY_STRUCTURE_CAN
+from .commands import Command
+from .reply import Reply
+
+
+# Axis parameters understood by the simulated TMCM-1630 and their power-on values
+AXIS_PARAMETERS = {
+	0: 0,       # target position
+	1: 0,       # actual position
+	2: 0,       # target velocity
+	3: 0,       # actual velocity
+	4: 4000,    # max velocity [rpm]
+	6: 2000,    # max current [mA]
+	7: 0,       # standby current
+	8: 0,       # target position reached
+	9: 0,       # ref switch status
+	10: 0,      # right limit switch status
+	11: 1000,   # acceleration [rpm/s]
+	12: 0,      # right limit switch disable
+	13: 0,      # left limit switch disable
+	25: 4000,   # thermal winding time constant [ms]
+	26: 0,      # IIT limit
+	27: 0,      # IIT sum
+	28: 0,      # IIT exceeded counter
+	29: 0,      # clear IIT exceeded flag
+	30: 0,      # run time [min]
+	31: 0,      # reinitialise timers
+	146: 0,     # enable velocity ramp
+	150: 0,     # actual current [mA]
+	151: 296,   # supply voltage [0.1V]
+	152: 739,   # driver temperature ADC (~25C)
+	156: 0,     # status/error flags
+	159: 0,     # commutation mode
+	172: 0,     # torque P
+	173: 0,     # torque I
+	177: 0,     # start current [mA]
+	230: 0,     # position P
+	234: 0,     # velocity P
+	235: 0,     # velocity I
+	253: 8,     # motor poles
+	254: 0,     # hall sensor invert
+}
+
+# Axis parameters that are measured by the module and cannot be written
+READ_ONLY_AXIS_PARAMETERS = frozenset((3, 8, 9, 10, 27, 28, 30, 150, 151, 152, 156))
+
+# Global parameters in bank 0 and their power-on values
+GLOBAL_PARAMETERS = {
+	65: 0,      # serial baud rate
+	66: 1,      # serial address
+	70: 2,      # CAN send ID
+	71: 1,      # CAN receive ID
+	76: 2,      # serial host address
+	77: 0,      # auto start mode
+}
+
+FIRMWARE_TYPE = 1630
+FIRMWARE_VERSION = 0x0308
+
+
+class SimulatedModule(object):
+	"""
+	In-memory model of a single TMCM-1630 module.
+
+	`handle` takes a request frame and returns the reply frame the real
+	module would produce, including status codes and checksum. A simple
+	ramp model moves the actual velocity towards its setpoint and
+	integrates the actual position, so `target_position_reached` flips
+	once a positioning move completes.
+	"""
+
+	def __init__( self, address=1, host_address=2, counts_per_rev=60, position_tolerance=5 ):
+		"""
+		:param address:
+			Module address that this module answers to
+		:type  address: int
+
+		:param counts_per_rev:
+			Position counts per motor revolution used by the motion model
+		:type  counts_per_rev: int
+
+		:param position_tolerance:
+			Distance in counts at which the target position counts as reached
+		:type  position_tolerance: int
+		"""
+		self.address = address
+		self.host_address = host_address
+		self.counts_per_rev = counts_per_rev
+		self.position_tolerance = position_tolerance
+		self.eeprom_locked = False
+		self.axis = dict(AXIS_PARAMETERS)
+		self.globals = {0: dict(GLOBAL_PARAMETERS), 1: {}, 2: {}, 3: {}}
+		self.globals[0][66] = address
+		self.globals[0][71] = address
+		self.stored_axis = dict(self.axis)
+		self.stored_globals = dict((bank, dict(params)) for bank, params in self.globals.items())
+		self.mode = "stop"
+		self._velocity = 0.0
+		self._position = 0.0
+		self._started = time.monotonic()
+		self._last_update = self._started
+		self._lock = threading.Lock()
+		# TMCL program memory and interpreter state
+		self.program = {}
+		self.program_status = 0
+		self.pc = 0
+		self._download = None
+		self._accumulator = 0
+		self._x_register = 0
+		self._comparison = 0
+		self._stack = []
+		self._wait = None
+
+	def handle( self, frame ):
+		"""
+		Process one 9-byte request frame.
+
+		:return: The 9-byte reply, or None if the frame is addressed to
+		         another module.
+		:rtype:  bytes
+		"""
+		address, command, type, motorbank, value, checksum = struct.unpack(MSG_STRUCTURE, frame)
+		if address != self.address:
+			return None
+		if sum(bytearray(frame[:-1])) & 0xFF != checksum:
+			status, value = Reply.Status.WRONG_CHECKSUM, 0
+		elif command == Command.GET_FIRMWARE_VERSION and type == 0:
+			return bytes(bytearray([self.host_address])) + ("%04dV%03X" % (FIRMWARE_TYPE, FIRMWARE_VERSION)).encode("ascii")
+		else:
+			status, value = self.execute(command, type, motorbank, value)
+		reply = struct.pack(">BBBBi", self.host_address, self.address, status, command, value)
+		return reply + bytes(bytearray([sum(bytearray(reply)) & 0xFF]))
+
+	def handle_can( self, frame ):
+		"""
+		Process one 7-byte CAN request frame.
+
+		:rtype: bytes
+		"""
+		command, type, motorbank, value = struct.unpack(MSG_STRUCTURE_CAN, frame)
+		status, value = self.execute(command, type, motorbank, value)
+		return struct.pack(REPLY_STRUCTURE_CAN, self.address, status, command, value)
+
+	def execute( self, command, type, motorbank, value ):
+		"""
+		Execute a decoded command against the module state.
+
+		:return: (status, value) for the reply
+		:rtype:  tuple
+		"""
+		with self._lock:
+			self._update(time.monotonic())
+			if self._download is not None and command != Command.QUIT_DOWNLOAD_MODE:
+				self.program[self._download] = (command, type, motorbank, value)
+				self._download += 1
+				return Reply.Status.COMMAND_LOADED, 0
+			handler = self._handlers.get(command)
+			if handler is None:
+				return Reply.Status.INVALID_COMMAND, 0
+			return handler(self, type, motorbank, value)
+
+	def _sap( self, type, motorbank, value ):
+		if type not in self.axis:
+			return Reply.Status.WRONG_TYPE, value
+		if type in READ_ONLY_AXIS_PARAMETERS:
+			return Reply.Status.INVALID_VALUE, value
+		self.axis[type] = value
+		if type == 0:
+			self.mode = "position"
+		elif type == 1:
+			self._position = float(value)
+		elif type == 2:
+			self.mode = "velocity"
+		return Reply.Status.SUCCESS, value
+
+	def _gap( self, type, motorbank, value ):
+		if type not in self.axis:
+			return Reply.Status.WRONG_TYPE, 0
+		return Reply.Status.SUCCESS, self.axis[type]
+
+	def _stap( self, type, motorbank, value ):
+		if type not in self.axis:
+			return Reply.Status.WRONG_TYPE, 0
+		if self.eeprom_locked:
+			return Reply.Status.EEPROM_LOCKED, 0
+		self.stored_axis[type] = self.axis[type]
+		return Reply.Status.SUCCESS, 0
+
+	def _rsap( self, type, motorbank, value ):
+		if type not in self.axis:
+			return Reply.Status.WRONG_TYPE, 0
+		self.axis[type] = self.stored_axis[type]
+		return Reply.Status.SUCCESS, 0
+
+	def _bank( self, type, motorbank ):
+		bank = self.globals.get(motorbank)
+		if bank is None or (motorbank == 0 and type not in bank):
+			return None
+		return bank
+
+	def _sgp( self, type, motorbank, value ):
+		bank = self._bank(type, motorbank)
+		if bank is None:
+			return Reply.Status.WRONG_TYPE, value
+		bank[type] = value
+		return Reply.Status.SUCCESS, value
+
+	def _ggp( self, type, motorbank, value ):
+		bank = self._bank(type, motorbank)
+		if bank is None:
+			return Reply.Status.WRONG_TYPE, 0
+		return Reply.Status.SUCCESS, bank.get(type, 0)
+
+	def _stgp( self, type, motorbank, value ):
+		bank = self._bank(type, motorbank)
+		if bank is None:
+			return Reply.Status.WRONG_TYPE, 0
+		if self.eeprom_locked:
+			return Reply.Status.EEPROM_LOCKED, 0
+		self.stored_globals[motorbank][type] = bank.get(type, 0)
+		return Reply.Status.SUCCESS, 0
+
+	def _rsgp( self, type, motorbank, value ):
+		bank = self._bank(type, motorbank)
+		if bank is None:
+			return Reply.Status.WRONG_TYPE, 0
+		bank[type] = self.stored_globals[motorbank].get(type, 0)
+		return Reply.Status.SUCCESS, 0
+
+	def _mst( self, type, motorbank, value ):
+		self.mode = "stop"
+		self.axis[2] = 0
+		return Reply.Status.SUCCESS, 0
+
+	def _ror( self, type, motorbank, value ):
+		self.mode = "velocity"
+		self.axis[2] = value
+		return Reply.Status.SUCCESS, 0
+
+	def _rol( self, type, motorbank, value ):
+		self.mode = "velocity"
+		self.axis[2] = -value
+		return Reply.Status.SUCCESS, 0
+
+	def _mvp( self, type, motorbank, value ):
+		if type == 0:
+			self.axis[0] = value
+		elif type == 1:
+			self.axis[0] = self.axis[0] + value
+		else:
+			return Reply.Status.WRONG_TYPE, 0
+		self.mode = "position"
+		return Reply.Status.SUCCESS, 0
+
+	def _firmware( self, type, motorbank, value ):
+		if type != 1:
+			return Reply.Status.WRONG_TYPE, 0
+		return Reply.Status.SUCCESS, (FIRMWARE_TYPE << 16) | FIRMWARE_VERSION
+
+	_handlers = {
+		Command.SAP: _sap,
+		Command.GAP: _gap,
+		Command.STAP: _stap,
+		Command.RSAP: _rsap,
+		Command.SGP: _sgp,
+		Command.GGP: _ggp,
+		Command.STGP: _stgp,
+		Command.RSGP: _rsgp,
+		Command.MST: _mst,
+		Command.ROR: _ror,
+		Command.ROL: _rol,
+		Command.MVP: _mvp,
+		Command.GET_FIRMWARE_VERSION: _firmware,
+	}
+
+	def _start_download( self, type, motorbank, value ):
+		self.program_status = 0
+		self._download = value
+		return Reply.Status.SUCCESS, 0
+
+	def _quit_download( self, type, motorbank, value ):
+		self._download = None
+		return Reply.Status.SUCCESS, 0
+
+	def _run_application( self, type, motorbank, value ):
+		if type == 1:
+			self.pc = value
+		self._wait = None
+		self.program_status = 1
+		return Reply.Status.SUCCESS, 0
+
+	def _stop_application( self, type, motorbank, value ):
+		self.program_status = 0
+		return Reply.Status.SUCCESS, 0
+
+	def _reset_application( self, type, motorbank, value ):
+		self.program_status = 0
+		self.pc = 0
+		self._stack = []
+		self._wait = None
+		return Reply.Status.SUCCESS, 0
+
+	def _application_status( self, type, motorbank, value ):
+		return Reply.Status.SUCCESS, self.program_status
+
+	_handlers.update({
+		Command.START_DOWNLOAD_MODE: _start_download,
+		Command.QUIT_DOWNLOAD_MODE: _quit_download,
+		Command.RUN_APPLICATION: _run_application,
+		Command.STOP_APPLICATION: _stop_application,
+		Command.RESET_APPLICATION: _reset_application,
+		Command.GET_APPLICATION_STATUS: _application_status,
+	})
+
+	_calc = {
+		0: lambda a, b: a + b,
+		1: lambda a, b: a - b,
+		2: lambda a, b: a * b,
+		3: lambda a, b: int(float(a) / b),
+		4: lambda a, b: a - b * int(float(a) / b),
+		5: lambda a, b: a & b,
+		6: lambda a, b: a | b,
+		7: lambda a, b: a ^ b,
+		8: lambda a, b: ~a,
+		9: lambda a, b: b,
+	}
+
+	_conditions = {
+		0: lambda c: c == 0,
+		1: lambda c: c != 0,
+		2: lambda c: c == 0,
+		3: lambda c: c != 0,
+		4: lambda c: c > 0,
+		5: lambda c: c >= 0,
+		6: lambda c: c < 0,
+		7: lambda c: c <= 0,
+	}
+
+	def _run_program( self, limit=100 ):
+		"""
+		Execute stored instructions until the program waits or stops.
+		"""
+		for _ in range(limit):
+			if self._wait is not None:
+				condition, deadline = self._wait
+				if not condition() and (deadline is None or self._last_update < deadline):
+					return
+				self._wait = None
+			instruction = self.program.get(self.pc)
+			if instruction is None:
+				self.program_status = 0
+				return
+			self.pc += 1
+			command, type, motorbank, value = instruction
+			if command == Command.STOP:
+				self.program_status = 0
+				return
+			elif command == Command.JA:
+				self.pc = value
+			elif command == Command.JC:
+				if self._conditions.get(type, lambda c: False)(self._comparison):
+					self.pc = value
+			elif command == Command.CSUB:
+				self._stack.append(self.pc)
+				self.pc = value
+			elif command == Command.RSUB:
+				self.pc = self._stack.pop() if self._stack else self.pc
+			elif command == Command.COMP:
+				self._comparison = self._accumulator - value
+			elif command == Command.CALC and type in self._calc:
+				self._accumulator = self._calc[type](self._accumulator, value)
+				self._comparison = self._accumulator
+			elif command == Command.CALCX and type == 10:
+				self._accumulator, self._x_register = self._x_register, self._accumulator
+			elif command == Command.CALCX and type in self._calc:
+				self._accumulator = self._calc[type](self._accumulator, self._x_register)
+				self._comparison = self._accumulator
+			elif command == Command.WAIT:
+				self._start_wait(type, motorbank, value)
+			elif command in (Command.GAP, Command.GGP):
+				status, result = self._handlers[command](self, type, motorbank, value)
+				if status == Reply.Status.SUCCESS:
+					self._accumulator = result
+			elif command == Command.AAP:
+				self._sap(type, motorbank, self._accumulator)
+			elif command == Command.AGP:
+				self._sgp(type, motorbank, self._accumulator)
+			elif command in self._handlers and command < Command.STOP_APPLICATION:
+				self._handlers[command](self, type, motorbank, value)
+
+	def _start_wait( self, type, motorbank, value ):
+		# WAIT TICKS waits `value` 10ms ticks; the other conditions use
+		# `value` as a timeout in ticks, 0 meaning no timeout.
+		deadline = self._last_update + value * 0.01
+		if type == 0:
+			self._wait = (lambda: False, deadline)
+		elif type == 1:
+			self._wait = (lambda: self.axis[8] == 1, deadline if value else None)
+		else:
+			self._wait = None
+
+	def _update( self, now, step=0.001 ):
+		"""
+		Advance the motion model to `now`.
+		"""
+		step = max(step, (now - self._last_update) / 1000.0)
+		while self._last_update < now:
+			dt = min(step, now - self._last_update)
+			self._last_update += dt
+			self._step(dt)
+			if self.program_status == 1:
+				self._run_program()
+		self.axis[30] = int((now - self._started) // 60)
+
+	def _step( self, dt ):
+		max_velocity = abs(self.axis[4])
+		accel = abs(self.axis[11]) or float("inf")
+		if self.mode == "position":
+			distance = self.axis[0] - self._position
+			if abs(distance) <= self.position_tolerance and abs(self._velocity) < 1:
+				self._velocity = 0.0
+				self._position = float(self.axis[0])
+				self.axis[8] = 1
+				target = 0.0
+			else:
+				self.axis[8] = 0
+				# fastest speed that can still brake in time for the target
+				stopping = (2 * accel * abs(distance) * 60.0 / self.counts_per_rev) ** 0.5
+				target = min(max_velocity, stopping) * (1 if distance > 0 else -1)
+		elif self.mode == "velocity":
+			target = max(-max_velocity, min(max_velocity, self.axis[2]))
+		else:
+			target = 0.0
+		limit = accel * dt
+		change = max(-limit, min(limit, target - self._velocity))
+		self._velocity += change
+		self._position += self._velocity * dt * self.counts_per_rev / 60.0
+		# crude current model: proportional to the acceleration being applied
+		self.axis[150] = int(abs(change) / dt) if dt else 0
+		self.axis[1] = int(round(self._position))
+		self.axis[3] = int(round(self._velocity))
+
+
+class SimulatedPort(object):
+	"""
+	Serves one or more `SimulatedModule` objects on a pseudo-terminal.
+
+	Open `port` with `serial.Serial` and use it like a real module. In
+	binary mode every module on the port sees every frame and only the
+	addressed one replies (RS485 style). In CAN mode the port carries the
+	7-byte frames used by `Bus(serial, CAN=True)` and serves one module.
+	"""
+
+	def __init__( self, modules=None, CAN=False, latency=0.0, jitter=0.0 ):
+		"""
+		:param modules:
+			Modules to serve, defaults to a single module at address 1
+		:type  modules: list of SimulatedModule
+
+		:param latency:
+			Seconds to wait before each reply
+		:type  latency: float
+
+		:param jitter:
+			Extra random delay of up to `jitter` seconds per reply
+		:type  jitter: float
+		"""
+		self.modules = modules if modules is not None else [SimulatedModule()]
+		self.CAN = CAN
+		self.latency = latency
+		self.jitter = jitter
+		self.port = None
+		self.requests = 0
+		self._master = None
+		self._slave = None
+		self._thread = None
+		self._running = False
+
+	def __enter__( self ):
+		self.start()
+		return self
+
+	def __exit__( self, *exc ):
+		self.stop()
+
+	def start( self ):
+		"""
+		Create the pseudo-terminal and start serving requests.
+
+		:return: Device path of the terminal, e.g. "/dev/pts/3"
+		:rtype:  str
+		"""
+		self._master, self._slave = pty.openpty()
+		tty.setraw(self._slave)
+		self.port = os.ttyname(self._slave)
+		self._running = True
+		self._thread = threading.Thread(target=self._serve, name="TMCL-sim %s" % self.port)
+		self._thread.daemon = True
+		self._thread.start()
+		return self.port
+
+	def stop( self ):
+		self._running = False
+		if self._thread is not None:
+			self._thread.join()
+			self._thread = None
+		for fd in (self._master, self._slave):
+			if fd is not None:
+				os.close(fd)
+		self._master = self._slave = None
+
+	def _serve( self ):
+		length = REPLY_LENGTH_CAN if self.CAN else REPLY_LENGTH
+		buf = b""
+		while self._running:
+			ready, _, _ = select.select([self._master], [], [], 0.05)
+			if not ready:
+				continue
+			try:
+				buf += os.read(self._master, 4096)
+			except OSError:
+				continue
+			while len(buf) >= length:
+				frame, buf = buf[:length], buf[length:]
+				self.requests += 1
+				reply = self._dispatch(frame)
+				if reply is None:
+					continue
+				delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+				if delay > 0:
+					time.sleep(delay)
+				os.write(self._master, reply)
+
+	def _dispatch( self, frame ):
+		if self.CAN:
+			return self.modules[0].handle_can(frame)
+		for module in self.modules:
+			reply = module.handle(frame)
+			if reply is not None:
+				return reply
+		return None
+
+
+class SimulatedCanNetwork(object):
+	"""
+	Serves several `SimulatedModule` objects on one simulated CAN link.
+
+	`socket` is the host end of a datagram socket pair carrying Linux
+	`struct can_frame` records, so it can be passed to `TMCL.can.CanBus`
+	in place of a SocketCAN socket. Requests are routed by CAN ID to the
+	module whose receive ID (global parameter 71) matches, and each module
+	answers on its send ID (global parameter 70) after its own latency,
+	independently of the others.
+	"""
+
+	def __init__( self, modules, latency=0.0, jitter=0.0 ):
+		self.modules = modules
+		self.latency = latency
+		self.jitter = jitter
+		self.requests = 0
+		self.socket = None
+		self._socket = None
+		self._thread = None
+		self._running = False
+
+	def __enter__( self ):
+		self.start()
+		return self
+
+	def __exit__( self, *exc ):
+		self.stop()
+
+	def start( self ):
+		self.socket, self._socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+		self._running = True
+		self._thread = threading.Thread(target=self._serve, name="TMCL-sim CAN")
+		self._thread.daemon = True
+		self._thread.start()
+		return self.socket
+
+	def stop( self ):
+		self._running = False
+		if self._thread is not None:
+			self._thread.join()
+			self._thread = None
+		self._socket.close()
+
+	def _serve( self ):
+		from .can import CAN_FRAME
+		pending = []
+		while self._running:
+			now = time.monotonic()
+			while pending and pending[0][0] <= now:
+				self._socket.send(heapq.heappop(pending)[2])
+			timeout = min(0.05, pending[0][0] - now) if pending else 0.05
+			ready, _, _ = select.select([self._socket], [], [], max(0, timeout))
+			if not ready:
+				continue
+			try:
+				frame = self._socket.recv(CAN_FRAME.size)
+			except OSError:
+				break
+			if len(frame) != CAN_FRAME.size:
+				continue
+			self.requests += 1
+			can_id, length, data = CAN_FRAME.unpack(frame)
+			for module in self.modules:
+				if module.globals[0][71] == can_id:
+					reply = module.handle_can(data[:REPLY_LENGTH_CAN])
+					due = time.monotonic() + self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+					frame = CAN_FRAME.pack(module.globals[0][70], len(reply), reply)
+					heapq.heappush(pending, (due, self.requests, frame))
+					break
@@ -0,0 +1,160 @@
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from .cache import MOTION_PARAMETERS, VOLATILE_PARAMETERS
+from .commands import Command
+from .profile import Profile
+from .reply import Reply
+
+
+# Global parameter banks read by default: module settings, user variables
+# and interrupt configuration
+GLOBAL_BANKS = (0, 2, 3)
+
+# Global parameters that would cut the link if restored: baud rate, serial
+# address, CAN send and receive IDs and the reply (host) address
+LINK_PARAMETERS = frozenset(((65, 0), (66, 0), (70, 0), (71, 0), (76, 0)))
+
+# Commands per batch, small enough for the module's and the host's buffers
+BATCH_SIZE = 64
+
+MAGIC = b"TMCLSNP1"
+ENTRY = struct.Struct("<BBBi")
+_AXIS = 0
+_GLOBAL = 1
+
+
+def take_snapshot( module, axes=(0,), banks=GLOBAL_BANKS ):
+	"""
+	Read every axis and global parameter a module answers for.
+
+	All 256 parameter numbers of each axis and bank are requested in
+	pipelined batches. Numbers the module rejects are left out.
+
+	:param module: Module to read
+	:type  module: Module
+
+	:rtype: Profile
+	"""
+	reads = ([(Command.GAP, param, axis, 0) for axis in axes for param in range(256)] +
+		[(Command.GGP, param, bank, 0) for bank in banks for param in range(256)])
+	snapshot = Profile()
+	for (command, param, bank, _), reply in zip(reads, _send_batches(module, reads, False)):
+		if reply.status != Reply.Status.SUCCESS:
+			continue
+		if command == Command.GAP:
+			snapshot.axis[(param, bank)] = reply.value
+		else:
+			snapshot.globals[(param, bank)] = reply.value
+	return snapshot
+
+
+def restore_snapshot( module, snapshot, only_changed=True, persist=False ):
+	"""
+	Write a snapshot back to a module, e.g. a replacement board.
+
+	Measured values, motion targets and the LINK_PARAMETERS are skipped.
+	Parameters the module rejects, e.g. ones its firmware does not
+	have, do not stop the restore; they are reported instead. The
+	module's parameter cache is updated with everything written.
+
+	:param only_changed:
+		Read the module first and only write values that differ
+	:type  only_changed: bool
+
+	:param persist:
+		Store every restored parameter to EEPROM with STAP/STGP
+	:type  persist: bool
+
+	:return: (written, rejected): the SAP/SGP commands the module
+	         accepted, and (command, reply) for every SAP/SGP/STAP/STGP
+	         it refused
+	:rtype:  tuple
+	"""
+	profile = Profile(
+		[(key, value) for key, value in snapshot.axis.items()
+			if key[0] not in VOLATILE_PARAMETERS and key[0] not in MOTION_PARAMETERS],
+		[(key, value) for key, value in snapshot.globals.items() if key not in LINK_PARAMETERS])
+	writes = profile.writes()
+	if only_changed:
+		current = [reply.value if reply.status == Reply.Status.SUCCESS else None
+			for reply in _send_batches(module, profile.reads(), False)]
+		writes = profile.writes(current)
+	written, rejected = _apply(module, writes)
+	if persist:
+		rejected.extend(_apply(module, [(Command.STAP, param, axis, 0) for param, axis in profile.axis] +
+			[(Command.STGP, param, bank, 0) for param, bank in profile.globals])[1])
+	return written, rejected
+
+
+def snapshot_modules( modules, axes=(0,), banks=GLOBAL_BANKS ):
+	"""
+	`take_snapshot` of several modules in parallel.
+
+	:rtype: list of Profile
+	"""
+	with ThreadPoolExecutor(max_workers=max(1, len(modules))) as pool:
+		return list(pool.map(lambda module: take_snapshot(module, axes, banks), modules))
+
+
+def restore_modules( modules, snapshots, only_changed=True, persist=False ):
+	"""
+	`restore_snapshot` of several modules in parallel.
+
+	:return: (written, rejected) of each module
+	:rtype:  list of tuple
+	"""
+	with ThreadPoolExecutor(max_workers=max(1, len(modules))) as pool:
+		return list(pool.map(lambda args: restore_snapshot(args[0], args[1], only_changed, persist),
+			zip(modules, snapshots)))
+
+
+def save_snapshot( path, snapshot ):
+	"""
+	Write a snapshot as a magic header followed by one 7-byte entry per
+	parameter.
+	"""
+	with open(path, "wb") as f:
+		f.write(MAGIC)
+		for (param, axis), value in snapshot.axis.items():
+			f.write(ENTRY.pack(_AXIS, param, axis, value))
+		for (param, bank), value in snapshot.globals.items():
+			f.write(ENTRY.pack(_GLOBAL, param, bank, value))
+
+
+def load_snapshot( path ):
+	"""
+	:rtype: Profile
+	"""
+	with open(path, "rb") as f:
+		data = f.read()
+	if data[:len(MAGIC)] != MAGIC or (len(data) - len(MAGIC)) % ENTRY.size:
+		raise ValueError("Not a TMCL snapshot: %s" % path)
+	snapshot = Profile()
+	for kind, param, bank, value in ENTRY.iter_unpack(data[len(MAGIC):]):
+		if kind == _AXIS:
+			snapshot.axis[(param, bank)] = value
+		else:
+			snapshot.globals[(param, bank)] = value
+	return snapshot
+
+
+def _apply( module, commands ):
+	# send without stopping at rejected commands, keeping the module's cache coherent
+	written = []
+	rejected = []
+	for command, reply in zip(commands, _send_batches(module, commands, False)):
+		if reply.status < Reply.Status.SUCCESS:
+			rejected.append((command, reply))
+			continue
+		written.append(command)
+		if module.cache is not None:
+			module.cache.observe(module.address, *(command + (reply, module.bus)))
+	return written, rejected
+
+
+def _send_batches( module, commands, check ):
+	replies = []
+	for start in range(0, len(commands), BATCH_SIZE):
+		replies.extend(module.bus.send_many([(module.address,) + command
+			for command in commands[start:start + BATCH_SIZE]], check=check))
+	return replies
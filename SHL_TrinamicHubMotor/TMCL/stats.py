@@ -0,0 +1,238 @@
+import threading
+import time
+
+
+class Histogram(object):
+	"""
+	Log2 histogram of durations.
+
+	Bucket 0 counts durations under 1 microsecond and bucket `i` those
+	in [2**(i-1), 2**i) microseconds; the last bucket takes everything
+	longer. Adding a sample is a handful of integer operations.
+	"""
+	__slots__ = ("buckets", "count", "total", "max")
+
+	BUCKETS = 32
+
+	def __init__( self ):
+		self.buckets = [0] * self.BUCKETS
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def add( self, seconds ):
+		self.buckets[min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)] += 1
+		self.count += 1
+		self.total += seconds
+		if seconds > self.max:
+			self.max = seconds
+
+	def quantile( self, q ):
+		"""
+		:return: Upper bound in seconds of the bucket holding quantile `q`,
+		         or None without samples
+		:rtype:  float
+		"""
+		if not self.count:
+			return None
+		rank = q * self.count
+		seen = 0
+		for i, n in enumerate(self.buckets):
+			seen += n
+			if seen >= rank and n:
+				return min((1 << i) * 1e-6, self.max)
+		return self.max
+
+	def as_dict( self ):
+		return {
+			"count": self.count,
+			"mean_us": self.total / self.count * 1e6 if self.count else None,
+			"p50_us": self._us(self.quantile(0.50)),
+			"p99_us": self._us(self.quantile(0.99)),
+			"max_us": self.max * 1e6,
+			"buckets": list(self.buckets),
+		}
+
+	@staticmethod
+	def _us( seconds ):
+		return None if seconds is None else seconds * 1e6
+
+
+class CommandStats(object):
+	"""
+	Counters and timings of one (port, module, command, type).
+	"""
+	__slots__ = ("count", "errors", "checksum_errors", "timeouts", "retries", "resyncs", "discarded",
+		"encode", "write", "first_byte", "total")
+
+	def __init__( self ):
+		self.count = 0
+		self.errors = {}
+		self.checksum_errors = 0
+		self.timeouts = 0
+		self.retries = 0
+		self.resyncs = 0
+		self.discarded = 0
+		self.encode = Histogram()
+		self.write = Histogram()
+		self.first_byte = Histogram()
+		self.total = Histogram()
+
+	def as_dict( self ):
+		return {
+			"count": self.count,
+			"errors": dict(self.errors),
+			"checksum_errors": self.checksum_errors,
+			"timeouts": self.timeouts,
+			"retries": self.retries,
+			"resyncs": self.resyncs,
+			"discarded": self.discarded,
+			"encode": self.encode.as_dict(),
+			"write": self.write.as_dict(),
+			"first_byte": self.first_byte.as_dict(),
+			"total": self.total.as_dict(),
+		}
+
+
+class BusStats(object):
+	"""
+	Latency and error statistics of TMCL traffic, keyed by
+	(port, module, command, type).
+
+	Attach it with `Bus.enable_stats`. One instance may be shared by
+	several buses. Every completed command adds its encode, write, time to
+	first reply byte and total round trip time to log2 histograms and
+	counts errors by `Reply.Status`, checksum errors, timeouts, retries
+	and resynchronisations.
+	"""
+
+	def __init__( self ):
+		# {port: {module << 16 | command << 8 | type: CommandStats}}
+		self._entries = {}
+		self._lock = threading.Lock()
+
+	def entry( self, port, module, command, type ):
+		"""
+		:rtype: CommandStats
+		"""
+		key = module << 16 | command << 8 | type
+		entries = self._entries.get(port)
+		entry = entries.get(key) if entries is not None else None
+		if entry is None:
+			with self._lock:
+				entry = self._entries.setdefault(port, {}).setdefault(key, CommandStats())
+		return entry
+
+	def record( self, port, module, command, type, encode, write, first_byte, total, status ):
+		"""
+		Add one command that received a reply. Times are in seconds.
+		"""
+		entry = self.entry(port, module, command, type)
+		with self._lock:
+			entry.count += 1
+			entry.encode.add(encode)
+			entry.write.add(write)
+			entry.first_byte.add(first_byte)
+			entry.total.add(total)
+			if status < 100:
+				entry.errors[status] = entry.errors.get(status, 0) + 1
+
+	def checksum_error( self, port, module, command, type ):
+		entry = self.entry(port, module, command, type)
+		with self._lock:
+			entry.count += 1
+			entry.checksum_errors += 1
+
+	def timeout( self, port, module, command, type ):
+		entry = self.entry(port, module, command, type)
+		with self._lock:
+			entry.count += 1
+			entry.timeouts += 1
+
+	def retry( self, port, module, command, type ):
+		entry = self.entry(port, module, command, type)
+		with self._lock:
+			entry.retries += 1
+
+	def resync( self, port, module, command, type, discarded ):
+		"""
+		A reply was found after dropping `discarded` bytes.
+		"""
+		entry = self.entry(port, module, command, type)
+		with self._lock:
+			entry.resyncs += 1
+			entry.discarded += discarded
+
+	def snapshot( self ):
+		"""
+		:return: One dict per (port, module, command, type) seen so far
+		:rtype:  list of dict
+		"""
+		with self._lock:
+			snapshot = []
+			for port, entries in sorted(self._entries.items(), key=lambda item: str(item[0])):
+				for key, entry in sorted(entries.items()):
+					row = {"port": port, "module": key >> 16, "command": key >> 8 & 0xFF, "type": key & 0xFF}
+					row.update(entry.as_dict())
+					snapshot.append(row)
+		return snapshot
+
+	def reset( self ):
+		with self._lock:
+			self._entries = {}
+
+
+class StatsExporter(object):
+	"""
+	Hands a `BusStats.snapshot` to `sink` every `interval` seconds from a
+	background thread, e.g. to append JSON lines for a dashboard:
+
+		exporter = StatsExporter(stats, 10.0, lambda s: log.write(json.dumps(s) + "\\n"))
+	"""
+
+	def __init__( self, stats, interval, sink ):
+		"""
+		:param stats: Statistics to export
+		:type  stats: BusStats
+
+		:param interval: Seconds between snapshots
+		:type  interval: float
+
+		:param sink: Called with {"timestamp": time.time(), "commands": snapshot}
+		:type  sink: callable
+		"""
+		self.stats = stats
+		self.interval = interval
+		self.sink = sink
+		self._stop = threading.Event()
+		self._thread = None
+
+	def __enter__( self ):
+		self.start()
+		return self
+
+	def __exit__( self, *exc ):
+		self.stop()
+
+	def start( self ):
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name="TMCL-stats")
+		self._thread.daemon = True
+		self._thread.start()
+
+	def stop( self ):
+		"""
+		Stop the thread after exporting a final snapshot.
+		"""
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+			self._thread = None
+
+	def export( self ):
+		self.sink({"timestamp": time.time(), "commands": self.stats.snapshot()})
+
+	def _run( self ):
+		while not self._stop.wait(self.interval):
+			self.export()
+		self.export()
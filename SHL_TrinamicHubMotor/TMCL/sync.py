@@ -0,0 +1,189 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from .commands import Command
+
+
+class SyncResult(object):
+	"""
+	Outcome of one `SyncDispatcher` release.
+
+	`sent` holds the `time.perf_counter()` value at which each motor's
+	frame was handed to its port and `acked` the time the replies of its
+	bus were complete, both ordered like the dispatcher's motors.
+	"""
+	__slots__ = ("replies", "sent", "acked")
+
+	def __init__( self, replies, sent, acked ):
+		self.replies = replies
+		self.sent = sent
+		self.acked = acked
+
+	@property
+	def send_skew( self ):
+		"""
+		Seconds between the first and the last frame being written
+		"""
+		return max(self.sent) - min(self.sent)
+
+	@property
+	def ack_skew( self ):
+		"""
+		Seconds between the first and the last reply arriving
+		"""
+		return max(self.acked) - min(self.acked)
+
+	def __repr__( self ):
+		return "SyncResult(send_skew=%.6f, ack_skew=%.6f)" % (self.send_skew, self.ack_skew)
+
+
+class SyncDispatcher(object):
+	"""
+	Sends one command to several motors at (nearly) the same instant.
+
+	Every bus has a writer thread that is started up front. For each
+	dispatch every writer takes its bus lock, encodes its frames and
+	waits on a shared barrier. Once all of them hold their port the
+	barrier opens and the frames are written together, so the skew
+	between wheels is a thread wake-up rather than a full round trip per
+	motor. Motors sharing a bus go out in a single write. Apart from the
+	barrier the exchange is an ordinary `send_many`: replies are matched
+	and resynchronised, and hooks, statistics and retries apply.
+
+	If any bus fails, the exception is raised from the dispatch and the
+	barrier is re-armed for the next one.
+	"""
+
+	def __init__( self, motors ):
+		"""
+		:param motors:
+			Motors on serial `Bus` instances, typically one per bus
+		:type  motors: list of Motor
+		"""
+		self.motors = list(motors)
+		self.worst_skew = 0.0
+		self._slots = {}
+		for index, motor in enumerate(self.motors):
+			self._slots.setdefault(id(motor.bus), []).append(index)
+		self._barrier = threading.Barrier(len(self._slots))
+		self._lock = threading.Lock()
+		self._jobs = {}
+		self._threads = []
+		for key, indexes in self._slots.items():
+			jobs = queue.Queue()
+			thread = threading.Thread(target=self._write, args=(self.motors[indexes[0]].bus, jobs),
+				name="TMCL-sync")
+			thread.daemon = True
+			thread.start()
+			self._jobs[key] = jobs
+			self._threads.append(thread)
+
+	def __enter__( self ):
+		return self
+
+	def __exit__( self, *exc ):
+		self.close()
+
+	def send( self, cmd, type, motorbank, value ):
+		"""
+		:param value: One value for all motors or a list with one per motor
+		:rtype: SyncResult
+		"""
+		return self._dispatch(cmd, type, lambda motor: motorbank, value)
+
+	def set_axis( self, param, value ):
+		"""
+		SAP on every motor's own axis.
+
+		:rtype: SyncResult
+		"""
+		return self._dispatch(Command.SAP, param, lambda motor: motor.motor_id, value)
+
+	def move_absolute( self, position ):
+		return self._dispatch(Command.MVP, 0, lambda motor: motor.motor_id, position)
+
+	def rotate_left( self, velocity ):
+		return self._dispatch(Command.ROL, 0, lambda motor: motor.motor_id, velocity)
+
+	def rotate_right( self, velocity ):
+		return self._dispatch(Command.ROR, 0, lambda motor: motor.motor_id, velocity)
+
+	def stop( self ):
+		return self._dispatch(Command.MST, 0, lambda motor: motor.motor_id, 0)
+
+	def close( self ):
+		"""
+		Stop the writer threads.
+		"""
+		for jobs in self._jobs.values():
+			jobs.put(None)
+		for thread in self._threads:
+			thread.join()
+		self._threads = []
+		self._jobs = {}
+
+	def _dispatch( self, cmd, type, bank, value ):
+		# `bank` maps a motor to the motor/bank field of its frame
+		commands = []
+		for i, motor in enumerate(self.motors):
+			motor_value = value[i] if isinstance(value, (list, tuple)) else value
+			commands.append((motor.module_id, cmd, type, bank(motor), motor_value))
+		with self._lock:
+			return self._release(commands)
+
+	def _release( self, commands ):
+		futures = []
+		for key, indexes in self._slots.items():
+			future = Future()
+			self._jobs[key].put(([commands[i] for i in indexes], future))
+			futures.append((indexes, future))
+
+		# wait for every writer before raising, so none is still at the barrier
+		results = []
+		error = None
+		for indexes, future in futures:
+			try:
+				results.append((indexes, future.result()))
+			except Exception as e:
+				if error is None or isinstance(error, threading.BrokenBarrierError):
+					error = e
+		if error is not None:
+			self._barrier.reset()
+			raise error
+
+		replies = [None] * len(self.motors)
+		sent = [0.0] * len(self.motors)
+		acked = [0.0] * len(self.motors)
+		for indexes, (bus_sent, bus_replies, bus_acked) in results:
+			for i, reply in zip(indexes, bus_replies):
+				replies[i], sent[i], acked[i] = reply, bus_sent, bus_acked
+		for motor, command, reply in zip(self.motors, commands, replies):
+			if motor.cache is not None:
+				motor.cache.observe(*(command + (reply, motor.bus)))
+		result = SyncResult(replies, sent, acked)
+		self.worst_skew = max(self.worst_skew, result.send_skew)
+		return result
+
+	def _write( self, bus, jobs ):
+		while True:
+			job = jobs.get()
+			if job is None:
+				return
+			commands, future = job
+			sent = []
+
+			def release():
+				self._barrier.wait()
+				sent.append(time.perf_counter())
+
+			try:
+				with bus._lock:
+					replies = bus._transact_many(commands, release=release)
+					acked = time.perf_counter()
+			except Exception as e:
+				# a writer that fails before the barrier must not leave the others waiting
+				self._barrier.abort()
+				future.set_exception(e)
+			else:
+				future.set_result((sent[0], replies, acked))
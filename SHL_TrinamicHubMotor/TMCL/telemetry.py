@@ -0,0 +1,195 @@
+import struct
+import threading
+import time
+import numpy as np
+from .commands import Command
+from .dispatch import Priority, RequestExpired
+from .reply import TrinamicException
+
+
+# Default poll rates in Hz per axis parameter
+DEFAULT_RATES = {
+	3: 50.0,    # actual speed
+	1: 50.0,    # actual position
+	150: 20.0,  # actual current
+	156: 10.0,  # status/error flags
+	27: 2.0,    # IIT sum
+	151: 1.0,   # supply voltage
+	152: 1.0,   # driver temperature
+}
+
+
+class RingBuffer(object):
+	"""
+	Fixed-size buffer of (timestamp, value) samples.
+
+	Storage is allocated once. There must be a single writer; any number
+	of readers may call `snapshot` at the same time without locking. A
+	reader copies the buffer and then drops whatever the writer may have
+	overwritten while the copy was being taken, so at most
+	`capacity - 1` samples are returned.
+	"""
+
+	def __init__( self, capacity, dtype=np.int64 ):
+		self.capacity = capacity
+		self.times = np.zeros(capacity, dtype=np.float64)
+		self.values = np.zeros(capacity, dtype=dtype)
+		self.count = 0
+
+	def __len__( self ):
+		return min(self.count, self.capacity)
+
+	def append( self, timestamp, value ):
+		i = self.count % self.capacity
+		self.times[i] = timestamp
+		self.values[i] = value
+		self.count += 1
+
+	def snapshot( self, n=None ):
+		"""
+		:param n: Return at most the `n` newest samples
+		:type  n: int
+
+		:return: (timestamps, values), oldest first
+		:rtype:  tuple of numpy.ndarray
+		"""
+		start = self.count
+		times = self.times.copy()
+		values = self.values.copy()
+		# the slot after the newest sample may be half written, and every
+		# sample appended during the copy has overwritten an old one
+		written = self.count - start
+		available = min(start, self.capacity - 1) - written
+		if n is not None:
+			available = min(available, n)
+		if available <= 0:
+			return times[:0], values[:0]
+		index = np.arange(start - available, start) % self.capacity
+		return times[index], values[index]
+
+	def latest( self ):
+		"""
+		:return: (timestamp, value) of the newest sample, or None
+		:rtype:  tuple
+		"""
+		times, values = self.snapshot(1)
+		if not len(times):
+			return None
+		return times[0], values[0]
+
+
+class TelemetrySampler(object):
+	"""
+	Polls axis parameters of several motors in the background.
+
+	Every bus gets one sampling thread. Parameters that are due at the
+	same time are read from a module in a single `send_many` batch and
+	stored with a `time.monotonic()` timestamp in a per (motor, parameter)
+	`RingBuffer`.
+
+	Polls are queued at Priority.TELEMETRY with the next poll time as
+	deadline, so on a bus shared with control traffic a poll that could
+	not be sent in time is dropped (and counted in `dropped`) rather
+	than delaying commands.
+	"""
+
+	def __init__( self, motors, rates=None, capacity=4096, recorder=None ):
+		"""
+		:param motors:
+			Motors to sample, referred to by their index in this list
+		:type  motors: list of Motor
+
+		:param rates:
+			Poll rate in Hz per axis parameter, defaults to DEFAULT_RATES
+		:type  rates: dict
+
+		:param capacity:
+			Samples kept per (motor, parameter)
+		:type  capacity: int
+
+		:param recorder:
+			Optional log that every sample is also written to
+		:type  recorder: TMCL.recorder.Recorder
+		"""
+		self.motors = list(motors)
+		self.rates = dict(rates or DEFAULT_RATES)
+		self.buffers = {}
+		for index in range(len(self.motors)):
+			for param in self.rates:
+				self.buffers[(index, param)] = RingBuffer(capacity)
+		self.recorder = recorder
+		self.errors = 0
+		self.dropped = 0
+		self._threads = []
+		self._running = False
+
+	def __enter__( self ):
+		self.start()
+		return self
+
+	def __exit__( self, *exc ):
+		self.stop()
+
+	def start( self ):
+		buses = {}
+		for index, motor in enumerate(self.motors):
+			buses.setdefault(id(motor.bus), []).append(index)
+		self._running = True
+		for indexes in buses.values():
+			thread = threading.Thread(target=self._sample, args=(indexes,), name="TMCL-telemetry")
+			thread.daemon = True
+			thread.start()
+			self._threads.append(thread)
+
+	def stop( self ):
+		self._running = False
+		for thread in self._threads:
+			thread.join()
+		self._threads = []
+
+	def snapshot( self, motor, param, n=None ):
+		"""
+		:param motor: Index of the motor in `motors`
+		:type  motor: int
+
+		:return: (timestamps, values), oldest first
+		:rtype:  tuple of numpy.ndarray
+		"""
+		return self.buffers[(motor, param)].snapshot(n)
+
+	def latest( self, motor, param ):
+		return self.buffers[(motor, param)].latest()
+
+	def _sample( self, indexes ):
+		periods = dict((param, 1.0 / rate) for param, rate in self.rates.items())
+		now = time.monotonic()
+		due = dict((param, now) for param in periods)
+		while self._running:
+			now = time.monotonic()
+			params = [param for param, deadline in due.items() if deadline <= now]
+			for param in params:
+				# keep the schedule, but never try to catch up on missed polls
+				due[param] = max(due[param] + periods[param], now)
+			if params:
+				self._poll(indexes, params, min(due[param] for param in params))
+			delay = min(due.values()) - time.monotonic()
+			if delay > 0:
+				time.sleep(delay)
+
+	def _poll( self, indexes, params, deadline ):
+		for index in indexes:
+			motor = self.motors[index]
+			try:
+				replies = motor.send_many([(Command.GAP, param, motor.motor_id, 0) for param in params],
+					Priority.TELEMETRY, deadline)
+			except RequestExpired:
+				self.dropped += 1
+				continue
+			except (TrinamicException, IOError, struct.error):
+				self.errors += 1
+				continue
+			timestamp = time.monotonic()
+			for param, reply in zip(params, replies):
+				self.buffers[(index, param)].append(timestamp, reply.value)
+				if self.recorder is not None:
+					self.recorder.sample(motor.bus, motor.module_id, motor.motor_id, param, reply.value)
@@ -0,0 +1,283 @@
+import math
+import struct
+import threading
+import time
+import numpy as np
+from .commands import Command
+from .dispatch import Priority, RequestExpired
+from .group import MotorGroup
+from .reply import TrinamicException
+
+
+class Trajectory(object):
+	"""
+	A time-parameterised setpoint profile for one axis.
+
+	`times` are seconds from the start of the stream and `values` the
+	setpoints at those times, either target positions [counts] or target
+	velocities [rpm]. Setpoints between samples are interpolated linearly;
+	after the last sample its value is held.
+	"""
+
+	# axis parameter each kind of profile is streamed to
+	POSITION = 0
+	VELOCITY = 2
+
+	def __init__( self, times, values, kind=POSITION ):
+		"""
+		:param times: Strictly increasing sample times in seconds
+		:type  times: numpy.ndarray
+
+		:param values: Setpoint at each sample time
+		:type  values: numpy.ndarray
+
+		:param kind: Trajectory.POSITION or Trajectory.VELOCITY
+		:type  kind: int
+		"""
+		self.times = np.asarray(times, dtype=np.float64)
+		self.values = np.asarray(values, dtype=np.float64)
+		if self.times.shape != self.values.shape or self.times.ndim != 1 or not len(self.times):
+			raise ValueError("times and values must be non-empty 1-D arrays of the same length")
+		if np.any(np.diff(self.times) <= 0):
+			raise ValueError("times must be strictly increasing")
+		if kind not in (self.POSITION, self.VELOCITY):
+			raise ValueError("kind must be Trajectory.POSITION or Trajectory.VELOCITY")
+		self.kind = kind
+
+	@property
+	def duration( self ):
+		return self.times[-1]
+
+	def at( self, t ):
+		"""
+		:return: Setpoint(s) at time(s) `t`, rounded to integers
+		:rtype:  numpy.ndarray
+		"""
+		return np.rint(np.interp(t, self.times, self.values)).astype(np.int64)
+
+	def positions( self, t, start=0.0, counts_per_rev=None ):
+		"""
+		Position the axis should be at at time(s) `t` when it follows
+		this profile exactly.
+
+		:param start: Actual position when the stream started [counts]
+		:type  start: float
+
+		:param counts_per_rev: Position counts per revolution, needed for velocity profiles
+		:type  counts_per_rev: float
+
+		:rtype: numpy.ndarray
+		"""
+		if self.kind == self.POSITION:
+			return np.interp(t, self.times, self.values)
+		if counts_per_rev is None:
+			raise ValueError("counts_per_rev is needed to integrate a velocity profile")
+		# trapezoidal integral of rpm over the samples, then up to `t`
+		counts = self.values * counts_per_rev / 60.0
+		integral = np.concatenate(([0.0], np.cumsum(np.diff(self.times) * (counts[1:] + counts[:-1]) / 2)))
+		t = np.asarray(t, dtype=np.float64)
+		clipped = np.clip(t, self.times[0], self.times[-1])
+		rate = np.interp(clipped, self.times, counts)
+		index = np.clip(np.searchsorted(self.times, clipped, side="right") - 1, 0, len(self.times) - 1)
+		inside = integral[index] + (clipped - self.times[index]) * (counts[index] + rate) / 2
+		before = np.minimum(t - self.times[0], 0) * counts[0]
+		after = np.maximum(t - self.times[-1], 0) * counts[-1]
+		return start + inside + before + after
+
+
+class StreamResult(object):
+	"""
+	What a `TrajectoryStreamer` run achieved.
+
+	Arrays have one row per scheduled update; rows of skipped updates hold
+	NaN. `setpoints`, `positions` and `expected` have one column per motor.
+	"""
+
+	def __init__( self, period, scheduled, sent, setpoints, positions, expected, skipped, errors ):
+		self.period = period
+		self.scheduled = scheduled
+		self.sent = sent
+		self.setpoints = setpoints
+		self.positions = positions
+		self.expected = expected
+		self.skipped = skipped
+		self.errors = errors
+
+	@property
+	def updates( self ):
+		return int(np.count_nonzero(~np.isnan(self.sent)))
+
+	@property
+	def rate( self ):
+		"""
+		Achieved updates per second
+		"""
+		sent = self.sent[~np.isnan(self.sent)]
+		if len(sent) < 2:
+			return 0.0
+		return (len(sent) - 1) / (sent[-1] - sent[0])
+
+	@property
+	def lateness( self ):
+		"""
+		Seconds each sent update went out after its deadline
+		"""
+		mask = ~np.isnan(self.sent)
+		return self.sent[mask] - self.scheduled[mask]
+
+	@property
+	def jitter( self ):
+		"""
+		Standard deviation of the lateness in seconds
+		"""
+		lateness = self.lateness
+		return float(np.std(lateness)) if len(lateness) else 0.0
+
+	@property
+	def tracking_error( self ):
+		"""
+		Expected minus actual position per update and motor [counts]
+		"""
+		return self.expected - self.positions
+
+	def rms_tracking_error( self ):
+		"""
+		:return: Root mean square tracking error per motor [counts]
+		:rtype:  numpy.ndarray
+		"""
+		return np.sqrt(np.nanmean(self.tracking_error ** 2, axis=0))
+
+	def __repr__( self ):
+		lateness = self.lateness
+		return "StreamResult(updates=%d, skipped=%d, rate=%.1f/s, jitter=%.3fms, max_late=%.3fms)" % (
+			self.updates, self.skipped, self.rate, self.jitter * 1e3,
+			(lateness.max() if len(lateness) else 0.0) * 1e3)
+
+
+class TrajectoryStreamer(object):
+	"""
+	Streams trajectories to one or more motors at a fixed rate.
+
+	Updates are due at start + k / `rate` on the monotonic clock. Every
+	update writes each motor's setpoint (SAP 0 or SAP 2) and reads its
+	actual position back in the same batch, with motors on different
+	buses served in parallel. An update that is due while the previous
+	one is still in flight is skipped rather than queued, so a slow link
+	lowers the achieved rate but never delays the setpoints. Updates
+	that fail are counted in `StreamResult.errors` and skipped as well.
+	"""
+
+	def __init__( self, motors, trajectories, rate=50.0, counts_per_rev=None ):
+		"""
+		:param motors: Motors to drive
+		:type  motors: list of Motor
+
+		:param trajectories: One trajectory per motor, or one shared by all
+		:type  trajectories: Trajectory or list of Trajectory
+
+		:param rate: Updates per second
+		:type  rate: float
+
+		:param counts_per_rev:
+			Position counts per revolution, needed for the tracking error
+			of velocity profiles
+		:type  counts_per_rev: float
+		"""
+		self.motors = list(motors)
+		if isinstance(trajectories, Trajectory):
+			trajectories = [trajectories] * len(self.motors)
+		self.trajectories = list(trajectories)
+		if len(self.trajectories) != len(self.motors):
+			raise ValueError("Need one trajectory per motor")
+		self.rate = rate
+		self.counts_per_rev = counts_per_rev
+		self.result = None
+		self._stop = threading.Event()
+		self._thread = None
+
+	def run( self ):
+		"""
+		Stream the trajectories and block until the longest one ends.
+
+		:rtype: StreamResult
+		"""
+		self._stop.clear()
+		period = 1.0 / self.rate
+		duration = max(trajectory.duration for trajectory in self.trajectories)
+		count = int(math.floor(duration * self.rate)) + 1
+		scheduled = np.arange(count) * period
+		sent = np.full(count, np.nan)
+		setpoints = np.full((count, len(self.motors)), np.nan)
+		positions = np.full((count, len(self.motors)), np.nan)
+		expected = np.full((count, len(self.motors)), np.nan)
+		kinds = [trajectory.kind for trajectory in self.trajectories]
+		skipped = errors = 0
+
+		with MotorGroup(self.motors) as group:
+			starts = group.axis.get(1)
+			start = time.monotonic()
+			k = 0
+			while k < count and not self._stop.is_set():
+				deadline = start + scheduled[k]
+				now = time.monotonic()
+				if now < deadline:
+					time.sleep(deadline - now)
+					now = time.monotonic()
+				elif now >= deadline + period:
+					# too late for this update, continue with the one due now
+					late = min(int((now - start) / period), count - 1) - k
+					if late > 0:
+						skipped += late
+						k += late
+						continue
+				t = now - start
+				values = [int(trajectory.at(t)) for trajectory in self.trajectories]
+				try:
+					replies = group.call(self._update, values, kinds, deadline + period)
+				except RequestExpired:
+					skipped += 1
+					k += 1
+					continue
+				except (TrinamicException, IOError, struct.error):
+					errors += 1
+					k += 1
+					continue
+				sent[k] = t
+				setpoints[k] = values
+				positions[k] = [reply.value for reply in replies]
+				expected[k] = [trajectory.positions(t, motor_start, self.counts_per_rev)
+					if trajectory.kind == Trajectory.POSITION or self.counts_per_rev else np.nan
+					for trajectory, motor_start in zip(self.trajectories, starts)]
+				k += 1
+
+		self.result = StreamResult(period, scheduled, sent, setpoints, positions, expected, skipped, errors)
+		return self.result
+
+	def start( self ):
+		"""
+		Run the stream on a background thread, see `join` and `stop`.
+		"""
+		self._thread = threading.Thread(target=self.run, name="TMCL-trajectory")
+		self._thread.daemon = True
+		self._thread.start()
+
+	def join( self, timeout=None ):
+		"""
+		:rtype: StreamResult
+		"""
+		self._thread.join(timeout)
+		return self.result
+
+	def stop( self ):
+		"""
+		End the stream early. The motors keep their last setpoint.
+		"""
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+
+	@staticmethod
+	def _update( motor, value, kind, deadline ):
+		replies = motor.send_many([(Command.SAP, kind, motor.motor_id, value), (Command.GAP, 1, motor.motor_id, 0)],
+			Priority.CONTROL, deadline)
+		return replies[1]
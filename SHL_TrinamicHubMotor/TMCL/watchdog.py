@@ -0,0 +1,282 @@
+import math
+import queue
+import struct
+import threading
+import time
+from .commands import Command
+from .dispatch import Priority, RequestExpired
+from .metrics import board_temperature
+from .reply import TrinamicException
+
+
+# Error bits of axis parameter 156: overcurrent, undervoltage, overvoltage,
+# overtemperature and hall error. The other bits report the motion state.
+ERROR_FLAGS = 0x2F
+
+
+class Limit(object):
+	"""
+	Allowed range of one axis parameter.
+
+	The value is optionally converted first, e.g. with
+	`metrics.board_temperature`; a conversion that fails or gives NaN
+	counts as a violation. A `mask` instead trips as soon as any of its
+	bits is set, for flag words such as parameter 156.
+	"""
+
+	def __init__( self, param, low=None, high=None, mask=None, convert=None, name=None ):
+		self.param = param
+		self.low = low
+		self.high = high
+		self.mask = mask
+		self.convert = convert
+		self.name = name or "parameter %d" % param
+
+	def violated( self, value ):
+		"""
+		:return: True if `value` (raw, as read from the module) is outside the limit
+		:rtype:  bool
+		"""
+		if self.mask is not None and value & self.mask:
+			return True
+		if self.convert is not None:
+			try:
+				value = self.convert(value)
+			except (ValueError, ZeroDivisionError):
+				return True
+			if math.isnan(value):
+				return True
+		return bool((self.low is not None and value < self.low) or (self.high is not None and value > self.high))
+
+	def __repr__( self ):
+		return "Limit(%s, low=%r, high=%r, mask=%r)" % (self.name, self.low, self.high, self.mask)
+
+
+# Conservative defaults for a TMCM-1630 on a 29.6V pack, adjust to the application
+DEFAULT_LIMITS = (
+	Limit(156, mask=ERROR_FLAGS, name="error flags"),
+	Limit(27, high=300, name="IIT sum"),
+	Limit(152, high=80.0, convert=board_temperature, name="driver temperature [C]"),
+	Limit(151, low=240, high=340, name="supply voltage [0.1V]"),
+)
+
+
+class Trip(object):
+	"""
+	One emergency stop and its timing.
+
+	`time` is the `time.perf_counter()` value at which the stop was
+	triggered; `written` and `acked` hold, per motor, when its MST frame
+	was written and when the module confirmed it (None if it did not).
+	"""
+
+	def __init__( self, reason, motor, limit, value, motors ):
+		self.reason = reason
+		self.motor = motor
+		self.limit = limit
+		self.value = value
+		self.time = time.perf_counter()
+		self.written = [None] * motors
+		self.acked = [None] * motors
+		self.done = threading.Event()
+		self._pending = 0
+		self._lock = threading.Lock()
+
+	@property
+	def latencies( self ):
+		"""
+		Seconds from the trip to each motor's MST acknowledgement
+		"""
+		return [None if acked is None else acked - self.time for acked in self.acked]
+
+	@property
+	def max_latency( self ):
+		latencies = [latency for latency in self.latencies if latency is not None]
+		return max(latencies) if latencies else None
+
+	def __repr__( self ):
+		latency = self.max_latency
+		return "Trip(%s, max_latency=%s)" % (self.reason,
+			"%.3fms" % (latency * 1e3) if latency is not None else "no ack")
+
+
+class Watchdog(object):
+	"""
+	Monitors motor health and stops every motor when a limit is exceeded.
+
+	Each bus gets a monitor thread that reads the limited parameters of
+	its motors in one batch at `rate` Hz, and a stop thread holding MST
+	frames encoded up front. On a trip every stop thread writes all its
+	frames at once. It waits at most for a frame write already in
+	progress, never for an exchange in flight or for the request queue.
+	Acknowledgements that arrive while another thread reads the bus are
+	passed on by that thread's resynchronisation through
+	`Bus.unmatched_hooks`. The rest are read, matched like any reply,
+	once the bus is free.
+	"""
+
+	def __init__( self, motors, limits=DEFAULT_LIMITS, rate=20.0, on_trip=None ):
+		"""
+		:param motors: Motors to watch and stop
+		:type  motors: list of Motor
+
+		:param limits: Limits checked for every motor
+		:type  limits: list of Limit
+
+		:param rate: Checks per second and motor
+		:type  rate: float
+
+		:param on_trip: Called with the Trip once all stops were acknowledged
+		:type  on_trip: callable
+		"""
+		self.motors = list(motors)
+		self.limits = list(limits)
+		self.rate = rate
+		self.on_trip = on_trip
+		self.tripped = None
+		self.trips = []
+		self.checks = 0
+		self.errors = 0
+		self._buses = {}
+		for index, motor in enumerate(self.motors):
+			self._buses.setdefault(id(motor.bus), (motor.bus, []))[1].append(index)
+		self._lock = threading.Lock()
+		self._running = False
+		self._threads = []
+		self._stops = []
+		for bus, indexes in self._buses.values():
+			frames = bus._encode_many([(self.motors[i].module_id, Command.MST, 0, self.motors[i].motor_id, 0)
+				for i in indexes])
+			jobs = queue.Queue()
+			thread = threading.Thread(target=self._stop, args=(bus, indexes, frames, jobs), name="TMCL-estop")
+			thread.daemon = True
+			thread.start()
+			self._stops.append((jobs, thread))
+
+	def __enter__( self ):
+		self.start()
+		return self
+
+	def __exit__( self, *exc ):
+		self.close()
+
+	def start( self ):
+		"""
+		Start monitoring.
+		"""
+		self._running = True
+		for bus, indexes in self._buses.values():
+			thread = threading.Thread(target=self._monitor, args=(indexes,), name="TMCL-watchdog")
+			thread.daemon = True
+			thread.start()
+			self._threads.append(thread)
+
+	def stop_monitoring( self ):
+		self._running = False
+		for thread in self._threads:
+			thread.join()
+		self._threads = []
+
+	def close( self ):
+		"""
+		Stop monitoring and shut down the stop threads.
+		"""
+		self.stop_monitoring()
+		for jobs, thread in self._stops:
+			jobs.put(None)
+			thread.join()
+		self._stops = []
+
+	def trip( self, reason="manual", motor=None, limit=None, value=None ):
+		"""
+		Stop every motor now. Further trips are ignored until `reset`.
+
+		:return: The new Trip, or the one already in progress
+		:rtype:  Trip
+		"""
+		with self._lock:
+			if self.tripped is not None:
+				return self.tripped
+			trip = Trip(reason, motor, limit, value, len(self.motors))
+			trip._pending = len(self._stops)
+			self.tripped = trip
+			self.trips.append(trip)
+		for jobs, _ in self._stops:
+			jobs.put(trip)
+		return trip
+
+	def reset( self ):
+		"""
+		Re-arm after a trip.
+		"""
+		with self._lock:
+			self.tripped = None
+
+	def _monitor( self, indexes ):
+		period = 1.0 / self.rate
+		params = sorted(set(limit.param for limit in self.limits))
+		next_check = time.monotonic()
+		while self._running:
+			for index in indexes:
+				if self.tripped is not None:
+					break
+				motor = self.motors[index]
+				try:
+					replies = motor.send_many([(Command.GAP, param, motor.motor_id, 0) for param in params],
+						Priority.CONTROL, next_check + period)
+				except (RequestExpired, TrinamicException, IOError, struct.error):
+					self.errors += 1
+					continue
+				self.checks += 1
+				values = dict((param, reply.value) for param, reply in zip(params, replies))
+				for limit in self.limits:
+					if limit.violated(values[limit.param]):
+						self.trip("motor %d: %s = %d" % (index, limit.name, values[limit.param]),
+							index, limit, values[limit.param])
+						break
+			next_check = max(next_check + period, time.monotonic())
+			delay = next_check - time.monotonic()
+			if delay > 0:
+				time.sleep(delay)
+
+	def _stop( self, bus, indexes, frames, jobs ):
+		rx = bytearray(bus.reply_length)
+		while True:
+			trip = jobs.get()
+			if trip is None:
+				return
+			# motors per module still waiting for their acknowledgement
+			waiting = {}
+			for i in indexes:
+				waiting.setdefault(self.motors[i].module_id, []).append(i)
+			lock = threading.Lock()
+
+			def acknowledge( reply ):
+				if reply.command == Command.MST:
+					with lock:
+						if waiting.get(reply.module_address):
+							trip.acked[waiting[reply.module_address].pop(0)] = time.perf_counter()
+
+			bus.unmatched_hooks.append(acknowledge)
+			try:
+				bus._write(frames)
+				written = time.perf_counter()
+				for i in indexes:
+					trip.written[i] = written
+				with bus._lock:
+					bus._set_timeout(bus.timeouts.get(Command.MST, bus.timeout))
+					for module_id, motors in waiting.items():
+						while motors:
+							acknowledge(bus._receive(rx, 0, module_id, Command.MST, 0))
+			except (IOError, struct.error, TrinamicException):
+				# ChecksumError is a TrinamicException; the motors left have no ack
+				pass
+			finally:
+				bus.unmatched_hooks.remove(acknowledge)
+				with trip._lock:
+					trip._pending -= 1
+					finished = trip._pending == 0
+			if finished:
+				trip.done.set()
+				if self.on_trip is not None:
+					self.on_trip(trip)
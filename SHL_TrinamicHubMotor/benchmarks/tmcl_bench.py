@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------------------------------------------------------
+""" Round-trip latency and throughput benchmarks for the TMCL package.
+
+Four simulated TMCM-1630 modules are served on pseudo-terminals
+(TMCL.simulator) and driven through Bus.send, Motor.axis.get/set,
+MotorGroup and the RPi_TMCM.py routines. For every case the number of
+commands per second and the p50/p99/max latency per call are reported,
+plus the CPU time spent encoding and decoding a single frame.
+
+Results are written as JSON so runs can be compared before and after a
+change to the protocol path:
+
+    python benchmarks/tmcl_bench.py --iterations 500 --output before.json
+"""
+# ---------------------------------------------------------------------------
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from serial import Serial
+import TMCL
+from TMCL.commands import Command
+from TMCL.simulator import SimulatedPort
+
+MODULE_ADDRESS = 1
+
+## RPi_TMCM.py routines that wait for a complete move, timed once each
+MOTION_ROUTINES = ("fwd", "rev")
+
+## RPi_TMCM.py parameter upload, as one batch
+PARAMETERS = [(159, 6), (254, 1), (253, 20), (177, 1000), (6, 6250), (4, 1700), (11, 500),
+	(172, 600), (173, 1000), (234, 20175), (235, 20175), (230, 300), (25, 300), (26, 300)]
+
+
+def percentile( values, fraction ):
+	"""
+	Nearest-rank percentile of an already sorted list.
+	"""
+	index = min(len(values) - 1, max(0, int(math.ceil(fraction * len(values))) - 1))
+	return values[index]
+
+
+def summarize( name, latencies, commands, wall ):
+	latencies = sorted(latencies)
+	return {
+		"name": name,
+		"calls": len(latencies),
+		"commands": commands,
+		"commands_per_s": commands / wall if wall else None,
+		"p50_ms": percentile(latencies, 0.50) * 1e3,
+		"p99_ms": percentile(latencies, 0.99) * 1e3,
+		"max_ms": latencies[-1] * 1e3,
+		"mean_ms": sum(latencies) / len(latencies) * 1e3,
+	}
+
+
+def measure( name, func, iterations, commands_per_call ):
+	latencies = []
+	start = time.perf_counter()
+	for _ in range(iterations):
+		t0 = time.perf_counter()
+		func()
+		latencies.append(time.perf_counter() - t0)
+	wall = time.perf_counter() - start
+	return summarize(name, latencies, iterations * commands_per_call, wall)
+
+
+def bench_codec( iterations ):
+	"""
+	CPU time per frame for encoding a request and decoding a reply.
+	"""
+	bus = TMCL.Bus(None)
+	frame = bus._encode(MODULE_ADDRESS, Command.GAP, 1, 0, 123456)
+	reply = bytearray(frame)
+	reply[0], reply[1], reply[2] = 2, MODULE_ADDRESS, 100
+	reply[8] = sum(reply[:8]) & 0xFF
+
+	buf = bytearray(len(frame))
+	start = time.process_time()
+	for _ in range(iterations):
+		bus._encode_into(buf, 0, MODULE_ADDRESS, Command.GAP, 1, 0, 123456)
+	encode = time.process_time() - start
+
+	start = time.process_time()
+	for _ in range(iterations):
+		bus._handle_reply(bus._decode(reply))
+	decode = time.process_time() - start
+
+	return {
+		"name": "codec",
+		"frames": iterations,
+		"encode_us_per_frame": encode / iterations * 1e6,
+		"decode_us_per_frame": decode / iterations * 1e6,
+	}
+
+
+def bench_bus( ports, iterations ):
+	buses = [TMCL.connect(Serial(port, timeout=1)) for port in ports]
+	motors = [bus.get_motor(MODULE_ADDRESS) for bus in buses]
+	bus, motor = buses[0], motors[0]
+	batch = [(MODULE_ADDRESS, Command.SAP, param, 0, value) for param, value in PARAMETERS]
+	results = [
+		measure("bus.send GAP", lambda: bus.send(MODULE_ADDRESS, Command.GAP, 1, 0, 0), iterations, 1),
+		measure("bus.send_many SAP x%d" % len(batch), lambda: bus.send_many(batch), iterations, len(batch)),
+		measure("motor.axis.get", lambda: motor.axis.get(3), iterations, 1),
+		measure("motor.axis.set", lambda: motor.axis.set(4, 1700), iterations, 1),
+	]
+	with TMCL.MotorGroup(motors) as group:
+		results.append(measure("group.axis.get x%d" % len(motors), lambda: group.axis.get(3),
+			iterations, len(motors)))
+		results.append(measure("group.axis.set x%d" % len(motors), lambda: group.axis.set(4, 1700),
+			iterations, len(motors)))
+	for bus in buses:
+		bus.serial.close()
+	return results
+
+
+def bench_routines( sims, iterations ):
+	"""
+	Time the RPi_TMCM.py routines against the simulated modules.
+	Their console output is discarded. The motion routines wait for the
+	simulated move to finish and are only run once.
+	"""
+	os.environ["TMCM_PORTS"] = ",".join(sim.port for sim in sims)
+	with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+		import RPi_TMCM
+		names = ["motorParam"] + list(MOTION_ROUTINES) + sorted(name for name in dir(RPi_TMCM)
+			if name.startswith("read") and callable(getattr(RPi_TMCM, name)))
+		results = []
+		for name in names:
+			routine = getattr(RPi_TMCM, name)
+			before = sum(sim.requests for sim in sims)
+			latencies = []
+			start = time.perf_counter()
+			for _ in range(1 if name in MOTION_ROUTINES else iterations):
+				t0 = time.perf_counter()
+				routine()
+				latencies.append(time.perf_counter() - t0)
+			wall = time.perf_counter() - start
+			results.append(summarize("RPi_TMCM." + name, latencies,
+				sum(sim.requests for sim in sims) - before, wall))
+	return results
+
+
+def main( argv=None ):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--iterations", type=int, default=200,
+		help="calls per benchmark case (default: %(default)s)")
+	parser.add_argument("--routine-iterations", type=int, default=10,
+		help="calls per RPi_TMCM.py routine, motion routines run once (default: %(default)s)")
+	parser.add_argument("--latency", type=float, default=0.0,
+		help="simulated reply latency in seconds (default: %(default)s)")
+	parser.add_argument("--jitter", type=float, default=0.0,
+		help="simulated reply jitter in seconds (default: %(default)s)")
+	parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+	args = parser.parse_args(argv)
+
+	sims = [SimulatedPort(latency=args.latency, jitter=args.jitter) for _ in range(4)]
+	for sim in sims:
+		sim.start()
+	try:
+		results = [bench_codec(args.iterations * 100)]
+		results.extend(bench_bus([sim.port for sim in sims], args.iterations))
+		results.extend(bench_routines(sims, args.routine_iterations))
+	finally:
+		for sim in sims:
+			sim.stop()
+
+	report = {
+		"timestamp": time.time(),
+		"python": platform.python_version(),
+		"machine": platform.machine(),
+		"config": vars(args),
+		"results": results,
+	}
+	text = json.dumps(report, indent=2)
+	if args.output:
+		with open(args.output, "w") as f:
+			f.write(text + "\n")
+	else:
+		print(text)
+
+
+if __name__ == "__main__":
+	main()
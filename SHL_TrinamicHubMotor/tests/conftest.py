@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serial import Serial
+import TMCL
+from TMCL.simulator import SimulatedPort
+
+
+@pytest.fixture
+def sim():
+	with SimulatedPort() as port:
+		yield port
+
+
+@pytest.fixture
+def bus( sim ):
+	bus = TMCL.connect(Serial(sim.port, timeout=1))
+	yield bus
+	bus.close()
+	bus.serial.close()
+
+
+@pytest.fixture
+def motor( bus ):
+	return bus.get_motor(1)
+
+
+@pytest.fixture
+def sims():
+	ports = [SimulatedPort() for _ in range(4)]
+	for port in ports:
+		port.start()
+	yield ports
+	for port in ports:
+		port.stop()
+
+
+@pytest.fixture
+def motors( sims ):
+	buses = [TMCL.connect(Serial(port.port, timeout=1)) for port in sims]
+	yield [bus.get_motor(1) for bus in buses]
+	for bus in buses:
+		bus.close()
+		bus.serial.close()
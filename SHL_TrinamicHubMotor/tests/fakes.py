@@ -0,0 +1,53 @@
+from TMCL.simulator import SimulatedModule
+
+
+class FakeSerial(object):
+	"""
+	In-memory port answering with a `SimulatedModule`, for tests that
+	need to lose or corrupt replies on purpose.
+
+	`drop` replies are swallowed, `garbage` is sent ahead of the next
+	reply and `late` holds replies back until the next request.
+	"""
+
+	def __init__( self, modules=None, timeout=0.05 ):
+		self.modules = modules or [SimulatedModule()]
+		self.timeout = timeout
+		self.port = "fake"
+		self.drop = 0
+		self.garbage = b""
+		self.late = 0
+		self.writes = 0
+		self._held = b""
+		self._out = bytearray()
+
+	def write( self, data ):
+		data = bytes(data)
+		for offset in range(0, len(data), 9):
+			self.writes += 1
+			self._out += self._held
+			self._held = b""
+			for module in self.modules:
+				reply = module.handle(data[offset:offset + 9])
+				if reply is None:
+					continue
+				if self.drop:
+					self.drop -= 1
+				elif self.late:
+					self.late -= 1
+					self._held = reply
+				else:
+					self._out += self.garbage + reply
+					self.garbage = b""
+		return len(data)
+
+	def read( self, size=1 ):
+		data = bytes(self._out[:size])
+		del self._out[:size]
+		return data
+
+	def reset_input_buffer( self ):
+		del self._out[:]
+
+	def close( self ):
+		pass
@@ -0,0 +1,56 @@
+import asyncio
+
+from serial import Serial
+
+import TMCL
+from TMCL.commands import Command
+from TMCL.simulator import SimulatedPort
+
+from fakes import FakeSerial
+
+
+def test_async_reads_run_concurrently( sims ):
+	for sim in sims:
+		sim.latency = 0.05
+	sims[1].modules[0].axis[6] = 1234
+
+	async def main():
+		motors = [TMCL.connect_async(Serial(sim.port), timeout=1).get_motor(1) for sim in sims]
+		loop = asyncio.get_running_loop()
+		start = loop.time()
+		values = await asyncio.gather(*[motor.axis.get(6) for motor in motors])
+		return values, loop.time() - start
+
+	values, elapsed = asyncio.run(main())
+	assert values == [2000, 1234, 2000, 2000]
+	assert elapsed < 0.15
+
+
+def test_async_timeout_keeps_the_stream_aligned():
+	with SimulatedPort(latency=0.05) as sim:
+		async def main():
+			bus = TMCL.connect_async(Serial(sim.port), timeout=0.02)
+			motor = bus.get_motor(1)
+			try:
+				await motor.axis.get(4)
+			except IOError:
+				pass
+			else:
+				raise AssertionError("expected a timeout")
+			sim.latency = 0
+			await asyncio.sleep(0.1)
+			bus.timeout = 1
+			return await motor.axis.get(6)
+
+		assert asyncio.run(main()) == 2000
+
+
+def test_async_send_many_resyncs():
+	port = FakeSerial()
+	bus = TMCL.AsyncBus(port, timeout=0.2)
+	port.garbage = b"\x01\x02\x03"
+
+	async def main():
+		return await bus.send_many([(1, Command.GAP, 4, 0, 0), (1, Command.GAP, 6, 0, 0)])
+
+	assert [reply.value for reply in asyncio.run(main())] == [4000, 2000]
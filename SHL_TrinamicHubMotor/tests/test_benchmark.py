@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import tmcl_bench
+
+
+def test_percentile_is_nearest_rank():
+	values = list(range(1, 101))
+	assert tmcl_bench.percentile(values, 0.50) == 50
+	assert tmcl_bench.percentile(values, 0.99) == 99
+	assert tmcl_bench.percentile([7], 0.99) == 7
+
+
+def test_codec_case():
+	result = tmcl_bench.bench_codec(100)
+	assert result["frames"] == 100
+	assert result["encode_us_per_frame"] >= 0 and result["decode_us_per_frame"] >= 0
+
+
+def test_bus_cases( sims ):
+	results = tmcl_bench.bench_bus([sim.port for sim in sims], 3)
+	assert [result["calls"] for result in results] == [3] * 6
+	assert results[1]["commands"] == 3 * len(tmcl_bench.PARAMETERS)
+	assert sims[0].modules[0].axis[4] == 1700
@@ -0,0 +1,144 @@
+import time
+
+import pytest
+from serial import Serial
+
+import TMCL
+from TMCL.commands import Command
+from TMCL.reply import ChecksumError, TrinamicException
+from TMCL.simulator import SimulatedModule, SimulatedPort
+
+from fakes import FakeSerial
+
+
+def test_send_many_answers_in_order( bus, sim ):
+	sim.modules[0].axis[6] = 1234
+	replies = bus.send_many([(1, Command.GAP, param, 0, 0) for param in (4, 6, 151)])
+	assert [reply.value for reply in replies] == [4000, 1234, 296]
+	assert sim.requests == 3
+
+
+def test_send_many_reads_every_reply_before_raising( bus ):
+	with pytest.raises(TrinamicException):
+		bus.send_many([(1, Command.GAP, 99, 0, 0), (1, Command.GAP, 4, 0, 0)])
+	# the second reply was consumed, the stream is still aligned
+	assert bus.send(1, Command.GAP, 6, 0, 0).value == 2000
+
+
+def test_send_many_unchecked_returns_error_replies( bus ):
+	replies = bus.send_many([(1, Command.GAP, 99, 0, 0)], check=False)
+	assert replies[0].status < TMCL.Reply.Status.SUCCESS
+
+
+def test_checksum_error_is_raised():
+	port = FakeSerial()
+	bus = TMCL.connect(port)
+	bus.resync = False
+	port.garbage = b"\x02\x01\x64\x06\x00\x00\x00\x05\x00"
+	with pytest.raises(ChecksumError):
+		bus.send(1, Command.GAP, 4, 0, 0)
+
+
+def test_resync_skips_garbage():
+	port = FakeSerial()
+	bus = TMCL.connect(port)
+	port.garbage = b"\x01\x02\x03"
+	assert bus.send(1, Command.GAP, 4, 0, 0).value == 4000
+	port.garbage = b"\xff" * 5
+	assert [reply.value for reply in bus.send_many([(1, Command.GAP, 4, 0, 0), (1, Command.GAP, 6, 0, 0)])] == \
+		[4000, 2000]
+
+
+def test_resync_drops_late_reply():
+	port = FakeSerial()
+	bus = TMCL.connect(port)
+	late = []
+	bus.unmatched_hooks.append(late.append)
+	port.late = 1
+	with pytest.raises(IOError):
+		bus.send(1, Command.GGP, 66, 0, 0)
+	assert bus.send(1, Command.GAP, 6, 0, 0).value == 2000
+	assert [(reply.command, reply.value) for reply in late] == [(Command.GGP, 1)]
+
+
+def test_retries_resend_safe_commands():
+	port = FakeSerial()
+	bus = TMCL.connect(port, retries=2)
+	port.drop = 1
+	assert bus.send(1, Command.GAP, 4, 0, 0).value == 4000
+	assert port.writes == 2
+
+
+def test_retries_never_resend_relative_moves():
+	port = FakeSerial()
+	bus = TMCL.connect(port, retries=2)
+	port.drop = 1
+	with pytest.raises(IOError):
+		bus.send(1, Command.MVP, 1, 0, 100)
+	assert port.writes == 1
+
+
+def test_timeout_override_restores_port_timeout( bus ):
+	bus.timeouts = {Command.STAP: 3.0}
+	bus.send(1, Command.STAP, 4, 0, 0)
+	assert bus.serial.timeout == 3.0
+	bus.send(1, Command.GAP, 4, 0, 0)
+	assert bus.serial.timeout == 1
+	bus.send_many([(1, Command.STAP, 4, 0, 0), (1, Command.GAP, 4, 0, 0)])
+	bus.send_many([(1, Command.GAP, 4, 0, 0)])
+	assert bus.serial.timeout == 1
+
+
+def test_zero_timeout_is_kept( bus ):
+	bus.timeouts = {Command.STAP: 0}
+	bus.timeout = 0.1
+	bus.send_many([(1, Command.GAP, 4, 0, 0)])
+	assert bus.serial.timeout == 0.1
+	bus.timeout = None
+	bus.send(1, Command.GAP, 4, 0, 0)
+	assert bus.serial.timeout == 1
+
+
+def test_expired_requests_are_dropped( bus, sim ):
+	sim.latency = 0.01
+	bus.start()
+	blocker = bus.submit(1, Command.GAP, 4, 0, 0)
+	expired = bus.submit(1, Command.GAP, 3, 0, 0, TMCL.Priority.TELEMETRY, time.monotonic())
+	assert blocker.result().value == 4000
+	with pytest.raises(TMCL.RequestExpired):
+		expired.result()
+
+
+def test_stop_overtakes_queued_telemetry( bus, sim ):
+	sim.latency = 0.01
+	bus.start()
+	order = []
+	blocker = bus.submit(1, Command.GAP, 4, 0, 0)
+	polls = [bus.submit(1, Command.GAP, 3, 0, 0, TMCL.Priority.TELEMETRY) for _ in range(5)]
+	for poll in polls:
+		poll.add_done_callback(lambda future: order.append("poll"))
+	stop = bus.submit(1, Command.MST, 0, 0, 0)
+	stop.add_done_callback(lambda future: order.append("stop"))
+	blocker.result()
+	for poll in polls:
+		poll.result()
+	assert order[0] == "stop"
+
+
+def test_encode_decode_round_trip():
+	bus = TMCL.connect(FakeSerial())
+	frame = bus._encode(1, Command.SAP, 4, 0, -1234)
+	assert len(frame) == 9
+	assert sum(bytearray(frame[:8])) & 0xFF == bytearray(frame)[8]
+	reply = SimulatedModule().handle(frame)
+	decoded = bus._decode(reply)
+	assert (decoded.module_address, decoded.status, decoded.command, decoded.value) == (1, 100, Command.SAP, -1234)
+
+
+def test_can_mode_over_serial():
+	with SimulatedPort(CAN=True) as port:
+		bus = TMCL.connect(Serial(port.port, timeout=1), CAN=True)
+		motor = bus.get_motor(1)
+		motor.set_user_var(3, -12345)
+		assert motor.get_user_var(3) == -12345
+		bus.serial.close()
@@ -0,0 +1,61 @@
+from serial import Serial
+
+import TMCL
+from TMCL.commands import Command
+from TMCL.simulator import SimulatedPort
+
+
+def test_cached_reads_skip_the_bus( bus, sim ):
+	motor = bus.get_motor(1, cache=TMCL.ParameterCache())
+	assert motor.axis.get(4) == 4000
+	requests = sim.requests
+	assert motor.axis.get(4) == 4000
+	assert sim.requests == requests
+	# volatile parameters are always read
+	motor.axis.get(1)
+	assert sim.requests == requests + 1
+
+
+def test_writing_the_cached_value_is_skipped( bus, sim ):
+	motor = bus.get_motor(1, cache=TMCL.ParameterCache())
+	motor.axis.set(4, 1500)
+	requests = sim.requests
+	motor.axis.set(4, 1500)
+	assert sim.requests == requests
+	motor.axis.set(4, 1500, force=True)
+	assert sim.requests == requests + 1
+
+
+def test_dirty_until_stored( bus ):
+	cache = TMCL.ParameterCache()
+	motor = bus.get_motor(1, cache=cache)
+	motor.axis.set(4, 1500)
+	assert cache.dirty(1, 0, bus) == set([4])
+	motor.send(Command.STAP, 4, 0, 0)
+	assert cache.dirty(1, 0, bus) == set()
+
+
+def test_raw_commands_keep_the_cache_coherent( bus, sim ):
+	motor = bus.get_motor(1, cache=TMCL.ParameterCache())
+	motor.axis.get(6)
+	motor.send(Command.SAP, 6, 0, 1500)
+	assert motor.axis.get(6) == 1500
+	sim.modules[0].axis[6] = 1200
+	motor.invalidate_cache(6)
+	assert motor.axis.get(6) == 1200
+
+
+def test_same_address_on_two_buses():
+	cache = TMCL.ParameterCache()
+	with SimulatedPort() as first, SimulatedPort() as second:
+		buses = [TMCL.connect(Serial(port.port, timeout=1)) for port in (first, second)]
+		motors = [bus.get_motor(1, cache=cache) for bus in buses]
+		motors[0].axis.set(4, 1000)
+		motors[1].axis.set(4, 2000)
+		assert [motor.axis.get(4) for motor in motors] == [1000, 2000]
+		assert second.modules[0].axis[4] == 2000
+		motors[1].invalidate_cache()
+		assert cache.lookup(1, 0, 4, buses[0]) == 1000
+		assert cache.lookup(1, 0, 4, buses[1]) is None
+		for bus in buses:
+			bus.serial.close()
@@ -0,0 +1,44 @@
+import pytest
+
+from TMCL.can import CanBus
+from TMCL.commands import Command
+from TMCL.simulator import SimulatedCanNetwork, SimulatedModule
+
+
+def test_requests_to_different_modules_overlap():
+	modules = [SimulatedModule(address) for address in (1, 2, 3, 4)]
+	with SimulatedCanNetwork(modules, latency=0.05) as network:
+		bus = CanBus(sock=network.socket, timeout=1)
+		modules[2].axis[6] = 1234
+		replies = bus.send_many([(address, Command.GAP, 6, 0, 0) for address in (1, 2, 3, 4)])
+		assert [reply.value for reply in replies] == [2000, 2000, 1234, 2000]
+		bus.close()
+
+
+def test_late_reply_is_dropped():
+	modules = [SimulatedModule(1)]
+	modules[0].axis[6] = 1234
+	with SimulatedCanNetwork(modules, latency=0.15) as network:
+		bus = CanBus(sock=network.socket, timeout=0.1)
+		motor = bus.get_motor(1)
+		with pytest.raises(IOError):
+			motor.axis.get(4)
+		bus.timeout = 1
+		# the late reply to GAP 4 must not be taken for the answer to this one
+		assert motor.axis.get(6) == 1234
+		assert motor.axis.get(4) == 4000
+		assert bus.unmatched == 1
+		bus.close()
+
+
+def test_send_many_leaves_no_request_pending():
+	modules = [SimulatedModule(address) for address in (1, 2)]
+	with SimulatedCanNetwork(modules, latency=0.15) as network:
+		bus = CanBus(sock=network.socket, timeout=0.1)
+		with pytest.raises(IOError):
+			bus.send_many([(1, Command.GAP, 4, 0, 0), (2, Command.GAP, 4, 0, 0)])
+		assert bus._pending == {}
+		bus.timeout = 1
+		assert [reply.value for reply in bus.send_many([(1, Command.GAP, 6, 0, 0), (2, Command.GAP, 6, 0, 0)])] == \
+			[2000, 2000]
+		bus.close()
@@ -0,0 +1,83 @@
+import json
+import time
+
+import pytest
+from serial import Serial
+
+import TMCL
+from TMCL.discovery import find_wheels
+from TMCL.simulator import SimulatedModule, SimulatedPort
+
+
+class SlowPort(SimulatedPort):
+	"""
+	Module 2 answers a few milliseconds late.
+	"""
+
+	def _dispatch( self, frame ):
+		reply = SimulatedPort._dispatch(self, frame)
+		if bytearray(frame)[0] == 2:
+			time.sleep(0.004)
+		return reply
+
+
+class PortInfo(object):
+
+	def __init__( self, device, serial_number ):
+		self.device = device
+		self.serial_number = serial_number
+
+
+def test_scan_bus_finds_every_module():
+	with SimulatedPort([SimulatedModule(address) for address in (1, 3, 7, 42)]) as sim:
+		bus = TMCL.connect(Serial(sim.port, timeout=1))
+		found = TMCL.scan_bus(bus, range(1, 50))
+		assert [module.address for module in found] == [1, 3, 7, 42]
+		# the bus settings are back once the scan is over
+		assert (bus.serial.timeout, bus.timeout, bus.retries, bus.resync) == (1, None, 0, True)
+		assert bus.send(3, TMCL.Command.GAP, 4, 0, 0).value == 4000
+		bus.serial.close()
+
+
+def test_scan_bus_probes_again_after_late_reply():
+	with SlowPort([SimulatedModule(address) for address in (1, 2, 3)]) as sim:
+		bus = TMCL.connect(Serial(sim.port, timeout=1))
+		found = TMCL.scan_bus(bus, [1, 2, 3], timeout=0.05, min_timeout=0.002, margin=1.5)
+		assert [module.address for module in found] == [1, 2, 3]
+		bus.serial.close()
+
+
+def test_find_wheels_maps_and_caches( tmp_path ):
+	sims = []
+	for wheel in (2, 0, 3, 1):
+		module = SimulatedModule()
+		module.globals[2][0] = wheel
+		sims.append(SimulatedPort([module]))
+	sims.append(SimulatedPort([SimulatedModule(5)]))
+	for sim in sims:
+		sim.start()
+	cache_path = str(tmp_path / "wheels.json")
+	ports = [PortInfo(sim.port, "SN%d" % i) for i, sim in enumerate(sims)] + [PortInfo("/dev/nonexistent", "X")]
+	try:
+		wheels = find_wheels(ports, cache_path=cache_path)
+		assert sorted((wheel, motor.bus.port) for wheel, motor in wheels.items()) == \
+			sorted((wheel, sims[i].port) for i, wheel in enumerate((2, 0, 3, 1)))
+		with open(cache_path) as f:
+			assert json.load(f) == {"SN0": 2, "SN1": 0, "SN2": 3, "SN3": 1}
+		for motor in wheels.values():
+			motor.bus.serial.close()
+
+		# cached ports are not probed again
+		requests = [sim.requests for sim in sims]
+		wheels = find_wheels(ports[:4], cache_path=cache_path)
+		assert [sim.requests for sim in sims] == requests
+		assert sorted(wheels) == [0, 1, 2, 3]
+		for motor in wheels.values():
+			motor.bus.serial.close()
+
+		sims[0].modules[0].globals[2][0] = 1
+		with pytest.raises(ValueError):
+			find_wheels(ports[:4], refresh=True)
+	finally:
+		for sim in sims:
+			sim.stop()
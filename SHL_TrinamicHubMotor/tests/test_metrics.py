@@ -0,0 +1,45 @@
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from TMCL import metrics
+
+
+def test_board_temperature():
+	temperatures = metrics.board_temperature(np.array([739, 900, 0]))
+	assert abs(temperatures[0] - 25.0) < 1.0
+	assert temperatures[1] > temperatures[0]
+	assert math.isnan(temperatures[2])
+	assert abs(float(metrics.board_temperature(739)) - temperatures[0]) < 1e-9
+
+
+def test_derive_block():
+	block = {
+		metrics.VOLTAGE: np.array([296, 300]),
+		metrics.CURRENT: np.array([1000, 2000]),
+		metrics.IIT_SUM: np.array([150, 300]),
+		metrics.IIT_LIMIT: np.array([300, 0]),
+		metrics.POSITION: np.array([60, 180]),
+	}
+	channels = metrics.derive(block, metrics.Calibration(distance_per_rev=0.5))
+	assert np.allclose(channels["voltage"], [29.6, 30.0])
+	assert np.allclose(channels["power"], [29.6, 60.0])
+	assert channels["iit_headroom"][0] == 0.5 and math.isnan(channels["iit_headroom"][1])
+	assert np.allclose(channels["distance"], [0.0, 1.0])
+	assert "temperature" not in channels
+
+
+def test_derive_per_motor_columns():
+	block = {metrics.SPEED: np.array([[60, 120], [0, -60]])}
+	assert np.allclose(metrics.derive(block)["speed"], [[1.0, 2.0], [0.0, -1.0]])
+
+
+def test_align_holds_the_latest_sample():
+	times, block = metrics.align({
+		metrics.POSITION: (np.array([0.0, 1.0, 2.0]), np.array([0, 60, 120])),
+		metrics.VOLTAGE: (np.array([0.5]), np.array([296])),
+	})
+	assert list(times) == [0.0, 1.0, 2.0]
+	assert list(block[metrics.VOLTAGE]) == [296, 296, 296]
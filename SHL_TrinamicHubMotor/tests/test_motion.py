@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+import TMCL
+from TMCL.commands import Command
+
+
+def _fast( motors ):
+	for motor in motors:
+		motor.axis.set(11, 100000)
+		motor.axis.set(4, 4000)
+
+
+def test_group_fans_out_to_every_bus( motors, sims ):
+	sims[2].modules[0].axis[6] = 1234
+	with TMCL.MotorGroup(motors) as group:
+		assert group.axis.get(6) == [2000, 2000, 1234, 2000]
+		group.axis.set(4, [1000, 1100, 1200, 1300])
+	assert [sim.modules[0].axis[4] for sim in sims] == [1000, 1100, 1200, 1300]
+
+
+def test_group_runs_buses_in_parallel( motors, sims ):
+	for sim in sims:
+		sim.latency = 0.05
+	with TMCL.MotorGroup(motors) as group:
+		start = time.monotonic()
+		group.axis.get(4)
+		assert time.monotonic() - start < 0.15
+
+
+def test_wait_until_target_position( motor ):
+	_fast([motor])
+	motor.move_absolute(500)
+	elapsed = motor.wait_until(1, 500, tolerance=5, timeout=5)
+	assert elapsed is not None
+	assert abs(motor.axis.actual_position - 500) <= 5
+
+
+def test_wait_until_times_out( motor ):
+	with pytest.raises(IOError):
+		motor.wait_until(1, 10 ** 6, timeout=0.2)
+
+
+def test_wait_until_predicate( motor ):
+	assert motor.wait_until(lambda m: True, timeout=1) is not None
+
+
+def test_group_wait_until_ends_on_stop( motors ):
+	flag = threading.Event()
+	threading.Timer(0.2, flag.set).start()
+	with TMCL.MotorGroup(motors) as group:
+		start = time.monotonic()
+		times = group.wait_until(1, 10 ** 9, timeout=5, stop=flag.is_set)
+	assert time.monotonic() - start < 2
+	assert times == [None] * len(motors)
+
+
+def test_sync_dispatch_reaches_every_motor( motors, sims ):
+	with TMCL.SyncDispatcher(motors) as wheels:
+		result = wheels.set_axis(4, [1000, 1001, 1002, 1003])
+		assert [reply.status for reply in result.replies] == [TMCL.Reply.Status.SUCCESS] * 4
+		assert result.send_skew >= 0
+		assert [sim.modules[0].axis[4] for sim in sims] == [1000, 1001, 1002, 1003]
+
+
+def test_sync_dispatch_recovers_after_a_failure( motors ):
+	with TMCL.SyncDispatcher(motors) as wheels:
+		with pytest.raises(TMCL.reply.TrinamicException):
+			wheels.send(Command.SAP, 255, 0, 0)
+		assert len(wheels.set_axis(4, 1500).replies) == 4
+
+
+def test_sync_dispatch_updates_the_cache( motors, sims ):
+	cache = TMCL.ParameterCache()
+	cached = [motor.bus.get_motor(1, cache=cache) for motor in motors]
+	with TMCL.SyncDispatcher(cached) as wheels:
+		wheels.set_axis(4, [1000, 1001, 1002, 1003])
+	requests = [sim.requests for sim in sims]
+	assert [motor.axis.get(4) for motor in cached] == [1000, 1001, 1002, 1003]
+	assert [sim.requests for sim in sims] == requests
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+import TMCL
+from TMCL.commands import Command
+from TMCL.script import ScriptError
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "position_mode_script.tmc")
+
+
+def test_load_profile_stops_at_motion():
+	profile = TMCL.load_profile(SCRIPT)
+	assert profile.globals == {(65, 0): 0}
+	assert profile.axis[(4, 0)] == 1800
+	assert (230, 0) in profile.axis
+	# "SAP 1, 0, 0" sets the measured position and ends the configuration part
+	assert (1, 0) not in profile.axis and (0, 0) not in profile.axis
+
+
+def test_parse_script_reports_the_line():
+	with pytest.raises(ScriptError) as error:
+		TMCL.Profile.from_script("SAP 4, 0, 1000\nSAP 6, 0\n")
+	assert error.value.line == 2
+
+
+def test_apply_profile_writes_only_the_difference( motors, sims ):
+	profile = TMCL.Profile(axis=[((4, 0), 1700), ((6, 0), 2000), ((11, 0), 500)])
+	changed = TMCL.apply_profile(motors, profile)
+	assert changed == [[(Command.SAP, 4, 0, 1700), (Command.SAP, 11, 0, 500)]] * 4
+	assert [sim.modules[0].axis[4] for sim in sims] == [1700] * 4
+	assert TMCL.apply_profile(motors, profile) == [[]] * 4
+
+
+def test_snapshot_round_trip( bus, sim, tmp_path ):
+	module = bus.get_module(1)
+	sim.modules[0].axis[4] = 1234
+	sim.modules[0].globals[2][5] = 77
+	snapshot = module.snapshot()
+	assert snapshot.axis[(4, 0)] == 1234
+	assert snapshot.globals[(5, 2)] == 77
+	path = str(tmp_path / "module.snap")
+	TMCL.save_snapshot(path, snapshot)
+	loaded = TMCL.load_snapshot(path)
+	assert loaded.axis == snapshot.axis and loaded.globals == snapshot.globals
+
+
+def test_restore_reports_rejected_parameters( bus, sim ):
+	cache = TMCL.ParameterCache()
+	module = bus.get_module(1, cache=cache)
+	motor = module.get_motor(0)
+	assert motor.axis.get(4) == 4000
+	snapshot = TMCL.Profile([((4, 0), 1234), ((200, 0), 5), ((6, 0), 777)], [((7, 2), 42), ((71, 0), 9)])
+	written, rejected = module.restore(snapshot, only_changed=False)
+	assert written == [(Command.SAP, 4, 0, 1234), (Command.SAP, 6, 0, 777), (Command.SGP, 7, 2, 42)]
+	assert [command for command, reply in rejected] == [(Command.SAP, 200, 0, 5)]
+	assert sim.modules[0].axis[4] == 1234
+	# link parameters are never restored
+	assert sim.modules[0].globals[0][71] == 1
+	# the cache saw the writes
+	requests = sim.requests
+	assert motor.axis.get(4) == 1234
+	assert sim.requests == requests
+
+
+def test_restore_only_changed( bus, sim ):
+	module = bus.get_module(1)
+	snapshot = module.snapshot()
+	sim.modules[0].axis[6] = 1500
+	written, rejected = module.restore(snapshot)
+	assert written == [(Command.SAP, 6, 0, 2000)]
+	assert rejected == []
@@ -0,0 +1,39 @@
+import time
+
+from TMCL.assembler import assemble
+from TMCL.commands import Command
+
+LOOP = """
+	SAP 11, 0, 100000
+Loop:	SAP 0, 0, 300
+	WAIT POS, 0, 0
+	SAP 0, 0, 0
+	WAIT POS, 0, 0
+	GGP 0, 2
+	CALC ADD, 1
+	AGP 0, 2
+	COMP 2
+	JC LT, Loop
+	STOP
+"""
+
+
+def test_assemble_resolves_labels():
+	program = assemble(LOOP)
+	assert program[0] == (Command.SAP, 11, 0, 100000)
+	# JC LT, Loop jumps to the second instruction
+	assert program[-2][3] == 1
+	assert len(program) == 11
+
+
+def test_download_and_run( bus ):
+	module = bus.get_module(1)
+	assert module.download_program(LOOP) == 11
+	module.run_program(0)
+	deadline = time.monotonic() + 10
+	while module.program_status() == module.PROGRAM_RUNNING and time.monotonic() < deadline:
+		time.sleep(0.02)
+	motor = module.get_motor(0)
+	assert motor.get_user_var(0) == 2
+	assert motor.axis.target_position == 0
+	assert module.program_status() != module.PROGRAM_RUNNING
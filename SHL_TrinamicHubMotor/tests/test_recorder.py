@@ -0,0 +1,54 @@
+import pytest
+
+from TMCL.commands import Command
+from TMCL.recorder import FRAME, PORT, TIMEOUT, Recorder, ReplaySerial, read_records
+import TMCL
+
+
+def _record( bus, motor, path ):
+	recorder = Recorder(path)
+	recorder.attach(bus)
+	motor.axis.get(4)
+	motor.send_many([(Command.GAP, param, 0, 0) for param in (1, 6)])
+	with pytest.raises(IOError):
+		bus.send(9, Command.GAP, 1, 0, 0)
+	recorder.close()
+
+
+def test_recorder_writes_frames_and_timeouts( bus, motor, tmp_path ):
+	bus.timeout = 0.05
+	path = str(tmp_path / "run.tmlog")
+	_record(bus, motor, path)
+	kinds = [record.kind for record in read_records(path)]
+	assert kinds.count(PORT) == 1
+	assert kinds.count(FRAME) == 3
+	assert kinds.count(TIMEOUT) == 1
+	assert bus.post_hooks == []
+
+
+def test_replay_serial_answers_from_the_recording( bus, motor, sim, tmp_path ):
+	sim.modules[0].axis[6] = 1234
+	path = str(tmp_path / "run.tmlog")
+	bus.timeout = 0.05
+	_record(bus, motor, path)
+	replayed = TMCL.Bus(ReplaySerial(path, timeout=0.05)).get_motor(1)
+	assert replayed.axis.get(4) == 4000
+	assert [reply.value for reply in replayed.send_many([(Command.GAP, 1, 0, 0), (Command.GAP, 6, 0, 0)])] == \
+		[0, 1234]
+
+
+def test_replay_series_and_summary( bus, motor, sim, tmp_path ):
+	np = pytest.importorskip("numpy")
+	from TMCL import replay
+	path = str(tmp_path / "run.tmlog")
+	bus.timeout = 0.05
+	_record(bus, motor, path)
+	records = replay.load_records(path)
+	summary = replay.summary(records)
+	assert summary[sim.port]["frames"] == 3
+	assert summary[sim.port]["timeouts"] == 1
+	series = replay.series(records)
+	times, values = series[(sim.port, 1, 0, 4)]
+	assert list(values) == [4000]
+	replay.main([path, "--npz", str(tmp_path / "run.npz")])
+	assert len(np.load(str(tmp_path / "run.npz")).files) == 6
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+import TMCL
+from TMCL.commands import Command
+
+from fakes import FakeSerial
+
+
+def test_stats_count_commands_and_errors( bus, motor ):
+	stats = bus.enable_stats()
+	for _ in range(10):
+		motor.axis.get(1)
+	motor.send_many([(Command.GAP, param, 0, 0) for param in (1, 3, 150)])
+	with pytest.raises(TMCL.reply.TrinamicException):
+		motor.send(Command.SAP, 255, 0, 0)
+	rows = dict(((row["module"], row["command"], row["type"]), row) for row in stats.snapshot())
+	assert rows[(1, Command.GAP, 1)]["count"] == 11
+	assert rows[(1, Command.GAP, 1)]["total"]["count"] == 11
+	assert rows[(1, Command.GAP, 150)]["count"] == 1
+	assert sum(rows[(1, Command.SAP, 255)]["errors"].values()) == 1
+
+
+def test_stats_count_timeouts_and_resyncs():
+	port = FakeSerial()
+	bus = TMCL.connect(port)
+	stats = bus.enable_stats()
+	port.garbage = b"\x01\x02\x03"
+	bus.send(1, Command.GAP, 4, 0, 0)
+	port.drop = 1
+	with pytest.raises(IOError):
+		bus.send(1, Command.GAP, 6, 0, 0)
+	rows = dict(((row["command"], row["type"]), row) for row in stats.snapshot())
+	assert (rows[(Command.GAP, 4)]["resyncs"], rows[(Command.GAP, 4)]["discarded"]) == (1, 3)
+	assert rows[(Command.GAP, 6)]["timeouts"] == 1
+
+
+def test_hooks_see_every_frame( bus, motor ):
+	requests = []
+	frames = []
+	bus.pre_hooks.append(lambda tx: requests.append(bytes(tx)))
+	bus.post_hooks.append(lambda tx, rx, elapsed, error: frames.append((bytes(tx), rx and bytes(rx), error)))
+	motor.axis.get(4)
+	motor.send_many([(Command.GAP, param, 0, 0) for param in (4, 6)])
+	assert [len(request) for request in requests] == [9, 18]
+	assert len(frames) == 3
+	assert [frame[0] for frame in frames[1:]] == [requests[1][:9], requests[1][9:]]
+	assert all(len(rx) == 9 and error is None for _, rx, error in frames)
+
+
+def test_hooks_see_timeouts():
+	port = FakeSerial()
+	bus = TMCL.connect(port)
+	frames = []
+	bus.post_hooks.append(lambda tx, rx, elapsed, error: frames.append((rx, error)))
+	port.drop = 1
+	with pytest.raises(IOError):
+		bus.send(1, Command.GAP, 4, 0, 0)
+	assert frames[0][0] is None and isinstance(frames[0][1], IOError)
+
+
+def test_exporter_hands_out_snapshots( bus, motor ):
+	stats = bus.enable_stats()
+	motor.axis.get(4)
+	exported = []
+	with TMCL.StatsExporter(stats, 0.02, exported.append):
+		time.sleep(0.1)
+	assert len(exported) >= 2
+	assert exported[-1]["commands"][0]["count"] == 1
@@ -0,0 +1,39 @@
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from TMCL.telemetry import RingBuffer, TelemetrySampler
+
+
+def test_ring_buffer_keeps_the_newest_samples():
+	buffer = RingBuffer(4)
+	for i in range(10):
+		buffer.append(float(i), i * 10)
+	times, values = buffer.snapshot()
+	# one slot is held back for the writer
+	assert list(times) == [7.0, 8.0, 9.0]
+	assert list(values) == [70, 80, 90]
+	assert buffer.latest() == (9.0, 90)
+	assert list(buffer.snapshot(2)[1]) == [80, 90]
+
+
+def test_empty_ring_buffer():
+	buffer = RingBuffer(4)
+	assert len(buffer.snapshot()[0]) == 0
+	assert buffer.latest() is None
+
+
+def test_sampler_polls_every_motor( motors, sims ):
+	sims[2].modules[0].axis[6] = 1234
+	with TelemetrySampler(motors, rates={6: 100.0, 151: 50.0}, capacity=64) as sampler:
+		time.sleep(0.3)
+	assert sampler.errors == 0
+	for index in range(len(motors)):
+		assert sampler.buffers[(index, 6)].count >= 5
+		assert sampler.buffers[(index, 151)].count >= 3
+	assert sampler.latest(2, 6)[1] == 1234
+	times, values = sampler.snapshot(0, 151)
+	assert np.all(values == 296)
+	assert np.all(np.diff(times) > 0)
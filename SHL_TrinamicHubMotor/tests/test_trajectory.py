@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from TMCL.trajectory import Trajectory, TrajectoryStreamer
+
+
+def test_velocity_profile_integrates_to_position():
+	profile = Trajectory([0.0, 1.0, 2.0], [0.0, 600.0, 600.0], Trajectory.VELOCITY)
+	# 600 rpm at 60 counts per revolution is 600 counts/s
+	assert np.allclose(profile.positions(np.array([0.0, 1.0, 2.0, 3.0]), 100, 60), [100, 400, 1000, 1600])
+
+
+def test_position_profile_holds_the_last_value():
+	profile = Trajectory([0.0, 1.0], [0.0, 100.0])
+	assert list(profile.at(np.array([0.5, 5.0]))) == [50, 100]
+
+
+def test_invalid_profiles_are_rejected():
+	with pytest.raises(ValueError):
+		Trajectory([0.0, 0.0], [1.0, 2.0])
+	with pytest.raises(ValueError):
+		Trajectory([0.0, 1.0], [0.0, 600.0], Trajectory.VELOCITY).positions(0.5)
+
+
+def test_streamer_tracks_a_position_profile( motors ):
+	for motor in motors:
+		motor.axis.set(11, 100000)
+	profile = Trajectory(np.linspace(0, 0.5, 11), np.linspace(0, 200, 11))
+	result = TrajectoryStreamer(motors, profile, rate=50).run()
+	assert result.errors == 0
+	assert result.updates + result.skipped == len(result.scheduled)
+	assert result.updates >= 20
+	assert np.all(result.setpoints[-1] == 200)
+	assert np.all(result.rms_tracking_error() < 100)
+
+
+def test_slow_link_skips_updates( motor, sim ):
+	sim.latency = 0.03
+	profile = Trajectory([0.0, 0.4], [0.0, 100.0])
+	result = TrajectoryStreamer([motor], profile, rate=50).run()
+	assert result.skipped > 0
+	assert result.rate < 40
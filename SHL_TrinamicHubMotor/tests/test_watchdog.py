@@ -0,0 +1,102 @@
+import importlib
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from TMCL.watchdog import ERROR_FLAGS, Limit, Watchdog
+
+
+def test_limits():
+	assert Limit(156, mask=ERROR_FLAGS).violated(0x01)
+	assert not Limit(156, mask=ERROR_FLAGS).violated(0x10)
+	assert Limit(151, low=240, high=340).violated(200)
+	assert not Limit(151, low=240, high=340).violated(296)
+	assert Limit(152, high=80.0, convert=lambda adc: float("nan")).violated(739)
+
+
+def test_error_flag_stops_every_motor( motors, sims ):
+	for motor in motors:
+		motor.rotate_right(1000)
+	tripped = threading.Event()
+	with Watchdog(motors, [Limit(156, mask=ERROR_FLAGS, name="error flags")], rate=100,
+			on_trip=lambda trip: tripped.set()) as watchdog:
+		time.sleep(0.05)
+		assert watchdog.tripped is None
+		sims[1].modules[0].axis[156] = 0x02
+		assert tripped.wait(2)
+		trip = watchdog.tripped
+	assert trip.motor == 1
+	assert trip.value == 0x02
+	assert all(latency is not None for latency in trip.latencies)
+	assert [sim.modules[0].mode for sim in sims] == ["stop"] * 4
+
+
+def test_trip_is_sent_while_the_bus_is_busy( motor, sim ):
+	watchdog = Watchdog([motor], limits=[])
+	sim.latency = 0.3
+	reader = threading.Thread(target=lambda: motor.axis.get(4))
+	reader.start()
+	time.sleep(0.05)
+	trip = watchdog.trip()
+	time.sleep(0.01)
+	# written without waiting for the exchange in flight
+	assert trip.written[0] is not None and trip.written[0] - trip.time < 0.05
+	assert trip.done.wait(3)
+	assert trip.acked[0] is not None
+	reader.join()
+	watchdog.close()
+	assert motor.bus.unmatched_hooks == []
+
+
+def test_trip_survives_reply_errors( motor ):
+	watchdog = Watchdog([motor], limits=[])
+	receive = motor.bus._receive
+
+	def broken( *args ):
+		raise IOError("no reply")
+
+	motor.bus._receive = broken
+	try:
+		assert watchdog.trip().done.wait(2)
+	finally:
+		motor.bus._receive = receive
+	time.sleep(0.05)
+	motor.bus.reset_input()
+	watchdog.reset()
+	assert watchdog.trip().done.wait(2)
+	watchdog.close()
+
+
+class _Tripped(object):
+	"""
+	Stands in for a Watchdog that already stopped the wheels.
+	"""
+	tripped = type("Trip", (object,), {"reason": "test"})()
+
+
+@pytest.fixture
+def rpi( sims ):
+	os.environ["TMCM_PORTS"] = ",".join(sim.port for sim in sims)
+	try:
+		module = importlib.import_module("RPi_TMCM")
+	finally:
+		del os.environ["TMCM_PORTS"]
+	yield module
+	module.wheels.close()
+	for bus in (module.bus0, module.bus1, module.bus2, module.bus3):
+		bus.serial.close()
+	sys.modules.pop("RPi_TMCM", None)
+
+
+def test_rpi_routines_skip_motion_after_a_trip( rpi, sims ):
+	rpi.watchdog = _Tripped()
+	rpi.fwd()
+	rpi.rev()
+	# actual position and ramp were set, no target position was sent
+	assert [sim.modules[0].axis[146] for sim in sims] == [1] * 4
+	assert [sim.modules[0].axis[0] for sim in sims] == [0] * 4
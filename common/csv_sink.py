@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Buffered CSV output shared by the acquisition scripts.
+
+    The file is created once with exclusive creation (mode 'x'), so existing
+    data is never overwritten, and stays open for the whole run. Rows are
+    collected in memory and handed to the csv writer once `flush_rows` rows
+    are pending or `flush_interval` seconds have passed since the last
+    flush. The interval is checked when rows are added and by poll(), which
+    a read loop should call on every pass so a quiet stream is still written
+    out in time. sync() and close() also fsync the file, so everything
+    written before a stop or quit is on disk.
+"""
+
+import csv
+import os
+import time
+
+
+class CsvSink:
+    """ Keeps a csv file open and writes rows to it in batches. """
+
+    def __init__(self, filepath, header=None, flush_rows=100, flush_interval=1.0,
+                 mode='x', encoding='utf-8', dialect='excel'):
+        """ filepath: csv file to create; with mode 'x' FileExistsError is raised if it exists
+            header: optional first row, written and synced right away
+            flush_rows: write once this many rows are buffered
+            flush_interval: write once this many seconds have passed since the last write
+        """
+        self.filepath = filepath
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._rows = []
+        self._file = open(filepath, mode=mode, newline='', encoding=encoding)
+        self._writer = csv.writer(self._file, dialect=dialect)
+        self._last_flush = time.monotonic()
+        if header is not None:
+            self._writer.writerow(header)
+            self.sync()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def writerow(self, row):
+        """ Buffer one row. """
+        self._rows.append(row)
+        self._maybe_flush()
+
+    def writerows(self, rows):
+        """ Buffer a block of rows. """
+        self._rows.extend(rows)
+        self._maybe_flush()
+
+    def flush(self):
+        """ Write the buffered rows and hand them to the operating system. """
+        if self._rows:
+            self._writer.writerows(self._rows)
+            self.rows_written += len(self._rows)
+            self._rows = []
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def poll(self):
+        """ Flush if rows are pending and flush_interval has passed, e.g. from an idle loop. """
+        if self._rows:
+            self._maybe_flush()
+
+    def sync(self):
+        """ flush() and wait until the data is stored on disk, e.g. when acquisition stops. """
+        self.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        """ sync() and close the file. Safe to call more than once. """
+        if not self._file.closed:
+            try:
+                self.sync()
+            finally:
+                self._file.close()
+
+    def _maybe_flush(self):
+        if (len(self._rows) >= self.flush_rows or
+                time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from csv_sink import CsvSink
+
+
+def _lines(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def test_header_is_written_right_away(tmp_path):
+    path = str(tmp_path / "data.csv")
+    sink = CsvSink(path, header=["time", "value"])
+    assert _lines(path) == ["time,value"]
+    sink.close()
+
+
+def test_rows_are_written_in_batches(tmp_path):
+    path = str(tmp_path / "data.csv")
+    with CsvSink(path, flush_rows=3, flush_interval=60) as sink:
+        sink.writerow([1, 2])
+        sink.writerow([3, 4])
+        assert _lines(path) == []
+        sink.writerow([5, 6])
+        assert _lines(path) == ["1,2", "3,4", "5,6"]
+        sink.writerows([[7, 8]])
+    assert _lines(path)[-1] == "7,8"
+    assert sink.rows_written == 4
+    assert sink.closed
+
+
+def test_poll_writes_a_quiet_stream(tmp_path):
+    path = str(tmp_path / "data.csv")
+    sink = CsvSink(path, flush_rows=100, flush_interval=0.05)
+    sink.writerow([1])
+    sink.poll()
+    assert _lines(path) == []
+    time.sleep(0.06)
+    sink.poll()
+    assert _lines(path) == ["1"]
+    sink.close()
+    sink.close()
+
+
+def test_existing_files_are_never_overwritten(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("keep\n")
+    with pytest.raises(FileExistsError):
+        CsvSink(str(path))
+    assert path.read_text() == "keep\n"